@@ -12,6 +12,8 @@ Command Line Parameters:  There is just 1:
                           It is the folder path that will be used to start looking at the *.mkv files from.
                           If this value isn't provided, then the starting path will be where this application file is located.
                           The intention is that you can call this application from a context menu from a file browser (e.g. Nemo) and it would automatically load up that folder.
+                          With --cli the application runs without the GUI (see --help), e.g. on headless machines:
+                          linux_bulk_mkv_extract.py --cli --action audio [--execute] FOLDER_OR_FILES...
 Purpose:  I wanted to re-make my original [mkv_extractor](https://github.com/BSFEMA/mkv_extractor) python application to have a proper GUI.
           I couldn't find a good mkvextract frontend for Linux, so I decided to make my own.
           This currently exports all tracks (audio, video, subtitles) as well as chapters and attachments.
@@ -21,10 +23,6 @@ Resources:  https://mkvtoolnix.download/doc/mkvpropedit.html
 """
 
 
-import gi
-gi.require_version("Gtk", "3.0")
-from gi.repository import Gtk as gtk
-from gi.repository import Gdk as gdk
 import sys
 import os
 import re
@@ -32,24 +30,103 @@ import datetime
 from operator import itemgetter
 import subprocess
 import json
+import concurrent.futures
+import sqlite3
+import time
+import threading
+import argparse
+import collections
+import itertools
+import fnmatch
+import struct
+import ctypes
+import ctypes.util
+import select
+import queue
+import shlex
+import string
+import asyncio
+import hashlib
+import mmap
 
 
+gtk = None  # Gtk, Gdk and GLib are only imported (by import_gtk) when the GUI is used, so the --cli mode works without them
+gdk = None
+glib = None
 default_folder_path = ""  # The path for the filechooser and data grid to work against.  This is the base folder to work against.
-files_Full = []  # Holds all of the file information
+files_Full = []  # Holds all of the file information (MkvFile records)
 files = []  # Holds only the file information for displaying in the data grid
 konami_code = []  # Easter Egg to see if the Konami code has been entered in the About dialog.
-languages_audio = []  # Holds the unique audio languages
-languages_subtitle = []  # Holds the unique subtitle languages
-languages_video = []  # Holds the unique subtitle languages
-types_audio = []  # Holds the unique audio types (codex)
-types_subtitle = []  # Holds the unique subtitle types (codex)
-types_video = []  # Holds the unique subtitle types (codex)
-ids_audio = []  # Holds the unique audio IDs
-ids_subtitle = []  # Holds the unique subtitle ids
-ids_video = []  # Holds the unique subtitle ids
-command_lines = {}  # The full list of command lines, or the output of this application
+# The facet index of the files_Full tracks (see update_track_facets), per track kind:
+# "languages" = language:  number of tracks, "types" = codec:  number of files, "ids" = track ID:  number of files
+track_facets = {kind: {"languages": collections.Counter(), "types": collections.Counter(), "ids": collections.Counter()} for kind in ("video", "audio", "subtitles")}
+# The facets offered by the filter entries (see entry_Track_Filter_icon_press)
+track_filter_facets = {"entry_Audio_Languages": ("audio", "languages"), "entry_Audio_Types": ("audio", "types"), "entry_IDs_Audio": ("audio", "ids"),
+                       "entry_Subtitles_Languages": ("subtitles", "languages"), "entry_Subtitles_Types": ("subtitles", "types"), "entry_IDs_Subtitles": ("subtitles", "ids")}
+command_lines = {}  # The full list of command lines per file (a list of passes, which are mkvextract argument lists, or a "# ..." comment for the files with nothing to do), or the output of this application
+extraction_plans = {}  # The reason for the passes in command_lines, per file (see plan_extraction_passes)
+parameter_files = []  # The files from the command line parameters
+track_filters = {"audio": None, "subtitles": None}  # The track filters (see parse_track_filter) that decide which audio/subtitle tracks are extracted.  None = all tracks.
+incremental_extract = False  # Skip the outputs that a previous run already extracted (see is_output_up_to_date)
+skip_duplicates = False  # Only extract the first copy of every duplicate group (see find_duplicate_groups)
+duplicate_hash_bytes = 1000000  # find_duplicate_groups confirms that files are the same with a hash of this many bytes at their start and at their end
+content_hashes = {}  # identify cache key:  (size, hash) of the files that find_duplicate_groups read (see get_content_hash)
+content_hashes_lock = threading.Lock()  # find_duplicate_groups runs in the background threads of Main.start_duplicate_check
+skipped_outputs = []  # The (MkvFile name, output path, size) of the outputs that incremental_extract skipped in build_command_lines()
+extract_actions = ["everything", "tracks", "video", "audio", "subtitles", "chapters", "attachments"]  # The --cli names of the combo_Option choices (in the same order)
 output = ""  # The output of the command lines
+markup_cache = {}  # The memoized data grid markup of the track columns (see render_tracks)
+markup_cache_max_entries = 10000  # The markup_cache starts over beyond this many entries
 multi_lines = False
+recursive_scan = False  # Also look for mkv files in the sub folders of default_folder_path
+scan_include = []  # Glob patterns (e.g. "*S01*"):  if there are any, only the mkv files matching one of them are used
+scan_exclude = []  # Glob patterns for the mkv files and sub folders to skip
+scan_max_depth = None  # How many sub folder levels the recursive scan goes down (None = no limit)
+probe_workers = os.cpu_count() or 1  # The number of "mkvmerge --identify" processes that are allowed to run at the same time
+identify_cache_path = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "linux_bulk_mkv_extract", "identify_cache.sqlite")  # Persistent cache of the mkvmerge json data
+identify_cache_max_entries = 50000  # The least recently used entries are evicted from the identify cache beyond this many files
+mkvmerge_version = None  # The "mkvmerge --version" output, which is part of every identify cache entry
+native_identify = True  # Read the track/chapter/attachment information straight from the Matroska headers instead of running mkvmerge (which is still used for anything unusual)
+native_identify_version = "native-2"  # Stored in the identify cache (instead of the mkvmerge version) for natively identified files
+extract_max_jobs = os.cpu_count() or 1  # The number of mkvextract processes that are allowed to run at the same time
+extract_jobs_per_device = 4  # The number of mkvextract processes that are allowed to read from or write to the same (solid state) device at the same time
+extract_jobs_per_rotational_device = 1  # The same for spinning disks, and for devices whose type can't be detected (e.g. network shares)
+device_job_limits = {}  # Holds the detected job limit per st_dev
+output_folder_path = ""  # The folder to extract to (with the same sub folders as the mkv files), e.g. on another disk than the mkv files.  "" = next to the mkv files.
+output_name_template = "{basename}.track_{id}.{name}.{lang}.{ext}"  # The file names of the extracted tracks (see format_output_name).  Tokens:  {basename} (the mkv file name without ".mkv"), {id}, {lang}, {name}, {codec}, {ext}
+output_name_tokens = ("basename", "id", "lang", "name", "codec", "ext")
+check_free_space = True  # Leave out the files whose outputs don't fit on their destination device (see plan_free_space)
+free_space_reserve = 256 * 1000000  # The bytes that plan_free_space keeps free on every destination device
+chapters_size_estimate = 100000  # The bytes that plan_free_space expects a chapters XML file to take
+throughput_history_path = os.path.join(os.path.dirname(identify_cache_path), "throughput_history.json")  # The measured extraction throughput of the recent batches (per source -> destination mount point), for the batch duration estimate
+throughput_history_max_batches = 10  # The number of batches per source -> destination that the throughput history keeps
+job_journal_path = os.path.join(os.path.dirname(identify_cache_path), "job_journal.jsonl")  # The journal of the extraction jobs (see JobJournal)
+job_journal = None  # The JobJournal of the extraction batches (set in __main__)
+extract_max_retries = 2  # How often resuming the job journal retries a failed job (see get_resume_jobs)
+perf_max_samples = 10000  # The number of latency/throughput samples that PerfStats keeps per stage (for the percentiles)
+perf_slow_file_seconds = 1.0  # A file that takes this long to identify is flagged as slow in the data grid
+engine_limits = {"probe": lambda: probe_workers, "extract": lambda: extract_max_jobs}  # The number of processes of each kind that ProcessEngine runs at the same time (read when the engine first runs that kind)
+engine_read_threads = min(32, (os.cpu_count() or 1) + 4)  # The threads that ProcessEngine uses for blocking file reads (the native identify), however many probes are running
+engine_kill_seconds = 5  # How long ProcessEngine waits for a terminated process to exit, before it kills it
+probe_timeout = 300  # The seconds after which a "mkvmerge --identify" is killed (e.g. a file on a hung network share)
+perf_profile_path = None  # --profile:  where the PerfStats report (json) is written on exit ("-" = stderr)
+extract_pass_mode = "auto"  # How plan_extraction_passes groups the extraction of a file:  "single" (one mkvextract pass), "split" (parallel per track passes) or "auto" (split big files on fast storage)
+extract_split_min_size = 2 * 1000000000  # The file size from which "auto" splits a file on fast storage
+watch_folder = False  # Watch default_folder_path for new, changed and removed mkv files (see InotifyWatcher)
+watch_extract = False  # Extract the files that watch_folder finds right away
+watch_debounce = 2.0  # The seconds without new events that InotifyWatcher waits for, before it reports the changed files
+# The inotify event masks (see "man inotify")
+inotify_close_write = 0x00000008
+inotify_moved_from = 0x00000040
+inotify_moved_to = 0x00000080
+inotify_create = 0x00000100
+inotify_delete = 0x00000200
+inotify_delete_self = 0x00000400
+inotify_move_self = 0x00000800
+inotify_q_overflow = 0x00004000
+inotify_ignored = 0x00008000
+inotify_only_dir = 0x01000000
+inotify_is_dir = 0x40000000
 
 
 class Main():
@@ -61,7 +138,7 @@ class Main():
         self.builder.connect_signals(self)
         # Get UI components
         window = self.builder.get_object("main_Window")
-        window.connect("delete-event", gtk.main_quit)
+        window.connect("delete-event", self.main_Window_delete)
         window.set_title('Linux Bulk MKV Extract')
         window.set_default_icon_from_file(os.path.join(sys.path[0], "linux_bulk_mkv_extract.svg"))  # Setting the "default" icon makes it usable in the about dialog. (This will take .ico, .png, and .svg images.)
         # Set the default size of the window
@@ -107,29 +184,75 @@ class Main():
         self.button_Process_image.get_style_context().add_class('spinner')
         button_Process.set_image(self.button_Process_image)
         button_Process.set_image_position(gtk.PositionType.TOP)
+        button_Incremental = self.builder.get_object("button_Incremental")
+        button_Incremental.set_active(incremental_extract)
+        button_Skip_Duplicates = self.builder.get_object("button_Skip_Duplicates")
+        button_Skip_Duplicates.set_active(skip_duplicates)
+        # Set the scan options (which can come from the command line parameters)
+        button_Recursive = self.builder.get_object("button_Recursive")
+        button_Recursive.set_active(recursive_scan)
+        spin_Max_Depth = self.builder.get_object("spin_Max_Depth")
+        spin_Max_Depth.set_value(scan_max_depth or 0)
+        entry_Include = self.builder.get_object("entry_Include")
+        entry_Include.set_text(";".join(scan_include))
+        entry_Exclude = self.builder.get_object("entry_Exclude")
+        entry_Exclude.set_text(";".join(scan_exclude))
+        button_Watch = self.builder.get_object("button_Watch")
+        button_Watch.set_active(watch_folder)
+        button_Watch_Extract = self.builder.get_object("button_Watch_Extract")
+        button_Watch_Extract.set_active(watch_extract)
+        # Set the output options (which can come from the command line parameters)
+        entry_Output_Folder = self.builder.get_object("entry_Output_Folder")
+        entry_Output_Folder.set_text(output_folder_path)
+        entry_Name_Template = self.builder.get_object("entry_Name_Template")
+        entry_Name_Template.set_text(output_name_template)
         # Set combo_Title_Option to default value (i.e. 'Everything')
         combo_Option = self.builder.get_object("combo_Option")
         combo_Option.set_entry_text_column(0)
         combo_Option.set_active(0)
         # Set initial_load to False as the application settings should now be setup correctly
         self.initial_load = False
-        self.repaint_GUI()  # Make sure GUI is up to date
-        watch_cursor = gdk.Cursor(gdk.CursorType.WATCH)
-        window.get_window().set_cursor(watch_cursor)  # Set curror to 'Waiting'
-        self.repaint_GUI()  # Make sure GUI is up to date
         # Setup the data grid
-        self.clear_Data_Grid()
-        populate_files_Full()
-        self.load_Data_Grid()
-        self.resize_column_widths()
-        self.repaint_GUI()  # Make sure GUI is up to date
-        window.get_window().set_cursor(None)  # Set curror back to 'None'
-        self.repaint_GUI()  # Make sure GUI is up to date
+        self.scan_cancel = None  # threading.Event of the background scan that is running
+        self.scheduler = None  # ExtractionScheduler of the extraction batch that is running
+        self.watcher = None  # InotifyWatcher of default_folder_path (with watch_folder)
+        self.watch_pending = None  # The (written, removed) changes that InotifyWatcher reported while a scan was running
+        self.resume_offered = False  # The unfinished jobs of the job journal are offered once, after the first scan (so their files are loaded)
+        self.perf_timer = None  # The glib timeout that refreshes the performance panel while it is expanded
+        self.duplicate_check = None  # The token of the running background duplicate check (see start_duplicate_check)
+        self.duplicate_pending = []  # What to run once the latest duplicate check is done (e.g. extracting the files that watch_extract loaded)
+        self.file_rows = None  # files_Full record:  its data grid row (see get_file_row).  None = files_Full changed, to be built again on the next lookup.
+        self.start_scan()
 
     """ ************************************************************************************************************ """
     #  These are the various widget's signal handler functions:  UI elements other than buttons & dialogs
     """ ************************************************************************************************************ """
 
+    def main_Window_delete(self, widget, event):
+        self.cancel_scan()
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.scheduler is not None:
+            self.scheduler.cancel()
+        if perf_profile_path is not None:
+            write_perf_profile(perf_profile_path)
+        gtk.main_quit()
+
+    def expander_Performance_expanded(self, widget, param):  # Refreshes the performance panel every second while it is expanded
+        if widget.get_expanded() and self.perf_timer is None:
+            self.update_perf_panel()
+            self.perf_timer = glib.timeout_add_seconds(1, self.perf_timer_tick)
+
+    def perf_timer_tick(self):  # Keeps refreshing the performance panel until it is collapsed
+        if not self.builder.get_object("expander_Performance").get_expanded():
+            self.perf_timer = None
+            return False
+        self.update_perf_panel()
+        return True
+
+    def update_perf_panel(self):  # Shows the PerfStats summary in the performance panel
+        self.builder.get_object("label_Performance").set_markup("<tt>" + escape_markup(perf_stats.get_summary()) + "</tt>")
+
     def repaint_GUI(self):
         # Defect #2 - Implement a waiting cursor to give an indication when the data grid is taking a long time to load.
         # Unfortunately, I haven't found an easier/better way to implement this...
@@ -142,11 +265,6 @@ class Main():
 
     def entry_Folder_Path_changed(self, widget):
         if not self.initial_load:
-            self.repaint_GUI()  # Make sure GUI is up to date
-            window = self.builder.get_object("main_Window")
-            watch_cursor = gdk.Cursor(gdk.CursorType.WATCH)
-            window.get_window().set_cursor(watch_cursor)  # Set curror to 'Waiting'
-            self.repaint_GUI()  # Make sure GUI is up to date
             current_path = widget.get_text()
             if os.path.isdir(current_path):
                 widget.get_style_context().remove_class('red-foreground')
@@ -156,16 +274,119 @@ class Main():
                 if current_path[-1:] == "/":  # remove the final "/" from a path
                     current_path = current_path[:-1]
                 default_folder_path = current_path  # Now that the edited text is a folder, set the default_folder_path to use that
-                self.clear_Data_Grid()
-                populate_files_Full()
-                self.load_Data_Grid()
-                self.resize_column_widths()
+                self.start_scan()
             else:
                 # widget.get_style_context().remove_class('black-foreground')
                 widget.get_style_context().add_class('red-foreground')
-            self.repaint_GUI()  # Make sure GUI is up to date
-            window.get_window().set_cursor(None)  # Set curror back to 'None'
-            self.repaint_GUI()  # Make sure GUI is up to date
+
+    def button_Recursive_toggled(self, widget):
+        global recursive_scan
+        recursive_scan = widget.get_active()
+        if not self.initial_load:
+            self.start_scan()
+
+    def spin_Max_Depth_value_changed(self, widget):
+        global scan_max_depth
+        scan_max_depth = widget.get_value_as_int()
+        if scan_max_depth == 0:  # 0 = no limit
+            scan_max_depth = None
+        if recursive_scan and not self.initial_load:
+            self.start_scan()
+
+    def button_Watch_toggled(self, widget):
+        global watch_folder
+        watch_folder = widget.get_active()
+        if not self.initial_load:
+            self.update_watch()
+
+    def button_Watch_Extract_toggled(self, widget):
+        global watch_extract
+        watch_extract = widget.get_active()
+
+    def entry_Scan_Patterns_activate(self, widget):  # Enter was pressed in entry_Include or entry_Exclude
+        global scan_include
+        global scan_exclude
+        scan_include = split_scan_patterns(self.builder.get_object("entry_Include").get_text())
+        scan_exclude = split_scan_patterns(self.builder.get_object("entry_Exclude").get_text())
+        self.start_scan()
+
+    def entry_Track_Filter_changed(self, widget):
+        if not self.initial_load:
+            # The filters only change which tracks are kept, so rebuilding the markup is enough to preview them
+            self.update_track_filters()
+            render_files_Full()
+            self.load_Data_Grid()
+
+    def entry_Track_Filter_icon_press(self, widget, icon_pos, event):  # Pops up the facet values (with their counts) of a filter entry, to add them to or remove them from the entry
+        kind, facet = track_filter_facets[gtk.Buildable.get_name(widget)]
+        selected = [value.strip() for value in widget.get_text().split(",") if value.strip() != ""]
+        menu = gtk.Menu()
+        for value, count in get_track_facet(kind, facet):
+            if facet == "languages":
+                label = value + "  (" + str(count) + " tracks)"
+            else:
+                label = value + "  (" + str(count) + " files)"
+            item = gtk.CheckMenuItem(label=label)
+            item.set_active(value in selected)
+            item.connect("toggled", self.track_facet_toggled, widget, value)
+            menu.append(item)
+        if len(menu.get_children()) == 0:
+            item = gtk.MenuItem(label="No " + kind + " tracks loaded")
+            item.set_sensitive(False)
+            menu.append(item)
+        menu.show_all()
+        menu.attach_to_widget(widget, None)
+        menu.popup_at_pointer(event)
+
+    def track_facet_toggled(self, item, entry, value):  # Adds the facet value to (or removes it from) the comma separated filter entry
+        selected = [selected_value.strip() for selected_value in entry.get_text().split(",") if selected_value.strip() != ""]
+        if item.get_active() and value not in selected:
+            selected.append(value)
+        elif not item.get_active() and value in selected:
+            selected.remove(value)
+        entry.set_text(", ".join(selected))  # Which runs entry_Track_Filter_changed
+
+    def update_track_filters(self):  # Sets track_filters from the filter entries.  An entry with an invalid regular expression turns red and is ignored.
+        for kind, prefix, ids in (("audio", "entry_Audio_", "entry_IDs_Audio"), ("subtitles", "entry_Subtitles_", "entry_IDs_Subtitles")):
+            entry_Languages = self.builder.get_object(prefix + "Languages")
+            entry_Types = self.builder.get_object(prefix + "Types")
+            entry_Name = self.builder.get_object(prefix + "Name")
+            entry_IDs = self.builder.get_object(ids)
+            try:
+                track_filters[kind] = parse_track_filter(entry_Languages.get_text(), entry_Types.get_text(), entry_Name.get_text(), entry_IDs.get_text())
+                entry_Name.get_style_context().remove_class('red-foreground')
+            except re.error:
+                track_filters[kind] = parse_track_filter(entry_Languages.get_text(), entry_Types.get_text(), "", entry_IDs.get_text())
+                entry_Name.get_style_context().add_class('red-foreground')
+
+    def update_output_options(self):  # Sets output_folder_path and output_name_template from their entries.  Returns False (and turns entry_Name_Template red) if the template is invalid.
+        global output_folder_path
+        global output_name_template
+        entry_Output_Folder = self.builder.get_object("entry_Output_Folder")
+        entry_Name_Template = self.builder.get_object("entry_Name_Template")
+        output_folder_path = os.path.expanduser(entry_Output_Folder.get_text().strip())
+        if output_folder_path != "" and not os.path.isabs(output_folder_path):  # Relative to the folder of the mkv files
+            output_folder_path = os.path.join(default_folder_path, output_folder_path)
+        try:
+            check_output_name_template(entry_Name_Template.get_text())
+        except ValueError as error:
+            entry_Name_Template.get_style_context().add_class('red-foreground')
+            self.builder.get_object("progressbar_Progress").set_text("Invalid file names template:  " + str(error))
+            return False
+        entry_Name_Template.get_style_context().remove_class('red-foreground')
+        output_name_template = entry_Name_Template.get_text()
+        return True
+
+    def check_output_collisions(self, files=None):  # Checks the command_lines of files_Full (or of the records in files) for output path collisions before anything is extracted.  Returns False (and shows the collisions) if there are any.
+        problems = get_output_collisions(files)
+        if len(problems) == 0:
+            return True
+        for problem in problems:
+            print("There was a problem with the following output path:  " + problem)
+        progressbar_Progress = self.builder.get_object("progressbar_Progress")
+        progressbar_Progress.set_text("Nothing extracted:  " + str(len(problems)) + " output paths collide (see the tooltip), please change the file names template")
+        progressbar_Progress.set_tooltip_text("\n".join(problems))
+        return False
 
     def set_scrollwindow_Data_Grid_height(self, new_height):  # Set the height of the data grid
         scrollwindow_Data_Grid = self.builder.get_object("scrollwindow_Data_Grid")
@@ -182,79 +403,180 @@ class Main():
         global multi_lines
         button_Multi = self.builder.get_object("button_Multi")
         multi_lines = button_Multi.get_active()
-        populate_files_Full()
-        self.button_Refresh_clicked(self)
+        # The separator is only part of the view, so rebuild the markup from the already parsed data instead of running mkvmerge again
+        render_files_Full()
+        self.load_Data_Grid()
+        self.resize_column_widths()
 
     def button_Process_clicked(self, widget):
         global default_folder_path
         global files_Full
         global command_lines
+        global incremental_extract
+        global skip_duplicates
         combo_Option = self.builder.get_object("combo_Option")
-        entry_Audio_Languages = self.builder.get_object("entry_Audio_Languages")
-        entry_Audio_Name = self.builder.get_object("entry_Audio_Name")
-        entry_Audio_Types = self.builder.get_object("entry_Audio_Types")
-        entry_Subtitles_Languages = self.builder.get_object("entry_Subtitles_Languages")
-        entry_Subtitles_Name = self.builder.get_object("entry_Subtitles_Name")
-        entry_Subtitles_Types = self.builder.get_object("entry_Subtitles_Types")
-        entry_IDs_Audio = self.builder.get_object("entry_IDs_Audio")
-        entry_IDs_Subtitles = self.builder.get_object("entry_IDs_Subtitles")
-        command_lines.clear()
-        command_lines = {}
-        ################################################################################
-        options = ""
-        action = combo_Option.get_active()
-        for i in range(len(files_Full)):
-            options = ""
-            if action == 0:  # Everything
-                options = " tracks "
-                options = options + export_all_videos(files_Full[i])
-                options = options + export_all_audios(files_Full[i])
-                options = options + export_all_subtitles(files_Full[i])
-                options = options + export_chapters(files_Full[i])
-                options = options + export_all_attachments(files_Full[i])
-            elif action == 1:  # Tracks (audio + video + subtitles)
-                options = " tracks "
-                options = options + export_all_videos(files_Full[i])
-                options = options + export_all_audios(files_Full[i])
-                options = options + export_all_subtitles(files_Full[i])
-            elif action == 2:  # Video
-                options = " tracks "
-                options = options + export_all_videos(files_Full[i])
-            elif action == 3:  # Audio
-                options = " tracks "
-                options = options + export_all_audios(files_Full[i])
-            elif action == 4:  # Subtitles
-                options = " tracks "
-                options = options + export_all_subtitles(files_Full[i])
-            elif action == 5:  # Chapters
-                options = options + export_chapters(files_Full[i])
-            elif action == 6:  # Attachments
-                options = options + export_all_attachments(files_Full[i])
-            if len(options.strip()) < 1:
-                command_lines[files_Full[i][0]] = "# Nothing to do..."
-            else:
-                if default_folder_path == "":
-                    command = "mkvextract \"" + file + "\" " + options
-                else:
-                    command = "mkvextract \"" + default_folder_path + "/" + str(files_Full[i][0]) + "\" " + options
-                command_lines[files_Full[i][0]] = command
+        incremental_extract = self.builder.get_object("button_Incremental").get_active()
+        skip_duplicates = self.builder.get_object("button_Skip_Duplicates").get_active()
+        self.update_track_filters()
+        if not self.update_output_options():
+            return
+        build_command_lines(combo_Option.get_active())
         # Execute extraction command
         radio_Commands = self.builder.get_object("radio_Commands")
         radio_Execute = self.builder.get_object("radio_Execute")
         if radio_Commands.get_active() and not radio_Execute.get_active():
+            self.check_output_collisions()
             self.dialog_Results(self)
         else:
-            for file in command_lines:
-                proc = subprocess.call(command_lines[file], shell=True, stdout=subprocess.PIPE)
+            self.start_extraction()
+
+    def start_extraction(self, files=None):  # Runs the command_lines (of files_Full, or of the records in files) with the ExtractionScheduler in a background thread
+        if self.scheduler is not None:  # Only one batch at a time
+            return
+        if not self.check_output_collisions(files):
+            return
+        jobs, left_out, preflight_summary = self.get_preflight_jobs(files)
+        for job in jobs:
+            job.file.status = job.get_status_text()
+            if files is not None:
+                self.extraction_job_changed(job)
+        if files is None:
+            self.load_Data_Grid()
+        if len(jobs) == 0:
+            if incremental_extract:
+                self.builder.get_object("progressbar_Progress").set_text("Nothing to extract:  " + get_skipped_summary())
+            if len(left_out) > 0:
+                self.builder.get_object("progressbar_Progress").set_text("Nothing extracted:  " + preflight_summary)
+            return
+        self.start_jobs(jobs, "Plan:  " + get_plan_summary() + "\nPre-flight:  " + preflight_summary)
+
+    def start_jobs(self, jobs, tooltip):  # Runs ExtractionJobs as a new batch (recorded in the job journal), with tooltip on the progress bar
+        scheduler = ExtractionScheduler(jobs, lambda job: glib.idle_add(self.extraction_job_changed, job),
+                                        lambda: glib.idle_add(self.extraction_finished, scheduler), job_journal)
+        self.scheduler = scheduler
+        self.builder.get_object("button_Cancel").set_sensitive(True)
+        self.builder.get_object("progressbar_Progress").set_tooltip_text(tooltip)
+        self.extraction_job_changed(None)
+        scheduler.start()
+
+    def offer_resume(self):  # Asks if the unfinished jobs of the job journal should be resumed.  If not, they are forgotten.
+        unfinished = get_unfinished_jobs(job_journal_path)
+        if len(unfinished) == 0:
+            return
+        dialog = gtk.MessageDialog(parent=self.builder.get_object("main_Window"), modal=True, message_type=gtk.MessageType.QUESTION,
+                                   buttons=gtk.ButtonsType.YES_NO, text="Resume the unfinished extraction jobs?")
+        dialog.format_secondary_text("The last extraction batch didn't finish:  " + get_unfinished_summary(unfinished) + ".\n\n"
+                                     "Resuming deletes the partial outputs of the interrupted and failed jobs and runs them again (failed jobs up to " + str(extract_max_retries) + " times).  "
+                                     "\"No\" forgets them.")
+        response = dialog.run()
+        dialog.destroy()
+        if response == gtk.ResponseType.YES:
+            self.resume_jobs(unfinished)
+        else:
+            job_journal.clear()
+
+    def resume_jobs(self, unfinished):  # Runs the unfinished jobs of the job journal (see get_resume_jobs)
+        if self.scheduler is not None:  # Only one batch at a time
+            return
+        jobs, given_up = get_resume_jobs(unfinished)
+        for entry in given_up:
+            print("There was a problem resuming the following job (failed " + str(entry["failures"]) + " times, or the mkv file is gone):  " + " ".join(entry["command"]))
+        for job in jobs:
+            job.file.status = job.get_status_text()
+            self.update_file_status(job.file)
+        if len(jobs) == 0:
+            self.builder.get_object("progressbar_Progress").set_text("Nothing resumed:  " + str(len(given_up)) + " jobs failed too often (or their mkv files are gone)")
+            return
+        self.start_jobs(jobs, "Resumed:  " + get_unfinished_summary(unfinished) + ("" if len(given_up) == 0 else ",  " + str(len(given_up)) + " given up"))
+
+    def queue_extraction(self, files):  # Extracts the records in files (e.g. the new files of watch_extract) with the current options, as part of the running extraction batch if there is one
+        global incremental_extract
+        global skip_duplicates
+        combo_Option = self.builder.get_object("combo_Option")
+        incremental_extract = self.builder.get_object("button_Incremental").get_active()
+        skip_duplicates = self.builder.get_object("button_Skip_Duplicates").get_active()
+        self.update_track_filters()
+        if not self.update_output_options():
+            return
+        build_command_lines(combo_Option.get_active(), files)
+        if self.scheduler is not None:
+            if not self.check_output_collisions(files):
+                return
+            jobs, left_out, preflight_summary = self.get_preflight_jobs(files)  # (Without the outputs of the running batch that are still on their way)
+            if self.scheduler.add_jobs(jobs):
+                for job in jobs:
+                    self.extraction_job_changed(job)
+                return
+            self.scheduler = None  # That batch is already done (its extraction_finished() is still on the way), so start a new one
+        self.start_extraction(files)
+
+    def get_preflight_jobs(self, files=None):  # Runs the free space pre-flight (see plan_free_space) on the command_lines of files_Full (or of the records in files).  Returns (the ExtractionJobs of the files that fit, {file name: reason} of the files that don't or can't be read, the pre-flight summary).
+        left_out = {}
+        devices = []
+        if check_free_space:
+            left_out, devices = plan_free_space(files)
+        for name in left_out:
+            print("There was a problem with the free space for the following file:  " + str(name) + "  (" + left_out[name] + ")")
+            command_lines[name] = "# " + left_out[name] + "..."
+        jobs, failed = get_extraction_jobs(files)
+        for file in (files_Full if files is None else files):
+            if file.name in left_out:
+                file.status = "not enough free space"
+            if files is not None and (file.name in left_out or file.name in failed):
+                self.update_file_status(file)
+        summary = get_preflight_summary(devices, left_out, jobs, failed)
+        left_out.update(failed)
+        return jobs, left_out, summary
+
+    def update_file_status(self, file):  # Shows the status of a files_Full record in its data grid row
+        i = self.get_file_row(file)
+        if i is not None:
+            self.builder.get_object("liststore_Data_Grid")[i][6] = file.status
+
+    def get_file_row(self, file):  # The data grid row of a files_Full record (None if it isn't in files_Full anymore).  Called for every progress update of the extraction jobs, so the rows are indexed once per change of files_Full.
+        if self.file_rows is None:
+            self.file_rows = {files_Full[i]: i for i in range(len(files_Full))}
+        return self.file_rows.get(file)
+
+    def extraction_job_changed(self, job):  # Shows the status of an extraction job in the data grid and the overall status in the progress bar
+        if job is not None:
+            job.file.status = job.get_status_text()
+            self.update_file_status(job.file)
+        if self.scheduler is not None:
+            finished = self.scheduler.get_status_count("done", "failed", "cancelled")
+            running = self.scheduler.get_status_count("running")
+            totals = self.scheduler.get_totals()
+            progressbar_Progress = self.builder.get_object("progressbar_Progress")
+            progressbar_Progress.set_fraction(totals[0])
+            progressbar_Progress.set_text("Extracting...  " + str(finished) + " / " + str(len(self.scheduler.jobs)) + " files done (" + str(running) + " running)  |  " + format_extraction_totals(totals))
+        return False  # Only run once
+
+    def extraction_finished(self, scheduler):  # Called from the main loop once all extraction jobs are done
+        if scheduler is not self.scheduler:
+            return False
+        self.scheduler = None
+        self.builder.get_object("button_Cancel").set_sensitive(False)
+        done = scheduler.get_status_count("done")
+        failed = scheduler.get_status_count("failed")
+        cancelled = scheduler.get_status_count("cancelled")
+        progressbar_Progress = self.builder.get_object("progressbar_Progress")
+        progressbar_Progress.set_fraction(1)
+        totals = scheduler.get_totals()
+        text = "Extraction finished:  " + str(done) + " done, " + str(failed) + " failed, " + str(cancelled) + " cancelled  |  " + str(datetime.timedelta(seconds=int(totals[3])))
+        if incremental_extract:
+            text = text + "  |  " + get_skipped_summary()
+        progressbar_Progress.set_text(text)
+        self.update_perf_panel()
+        return False  # Only run once
 
     def dialog_Results(self, widget):  # Creates the "Results" dialog that displays the command line
         global command_lines
         global output
         # Make output
-        output = ""
-        for command in command_lines:
-            output = output + "# " + str(command) + "\n"
-            output = output + str(command_lines[command]) + "\n"
+        output = get_command_lines_output()
+        output = "# Plan:  " + get_plan_summary() + "\n" + output
+        if incremental_extract:
+            output = "# Incremental:  " + get_skipped_summary() + "\n" + output
         # Create Dialog
         dialog = gtk.Dialog(title="Command Lines", parent=None)
         dialog.set_modal(True)
@@ -287,18 +609,17 @@ class Main():
         self.clipboard.set_text(output, -1)
 
     def button_Refresh_clicked(self, widget):
-        self.repaint_GUI()  # Make sure GUI is up to date
-        window = self.builder.get_object("main_Window")
-        watch_cursor = gdk.Cursor(gdk.CursorType.WATCH)
-        window.get_window().set_cursor(watch_cursor)  # Set curror to 'Waiting'
-        self.repaint_GUI()  # Make sure GUI is up to date
-        self.clear_Data_Grid()
-        populate_files_Full()
-        self.load_Data_Grid()
-        self.resize_column_widths()
-        self.repaint_GUI()  # Make sure GUI is up to date
-        window.get_window().set_cursor(None)  # Set curror back to 'None'
-        self.repaint_GUI()  # Make sure GUI is up to date
+        self.start_scan()
+
+    def button_Cancel_clicked(self, widget):  # Cancels the extraction batch or the background scan
+        if self.scheduler is not None:
+            self.scheduler.cancel()  # extraction_finished() updates the progress bar once the running jobs are stopped
+        elif self.scan_cancel is not None:
+            self.cancel_scan()
+            progressbar_Progress = self.builder.get_object("progressbar_Progress")
+            progressbar_Progress.set_text("Scan cancelled (" + str(len(files_Full)) + " files loaded)")
+            self.builder.get_object("button_Cancel").set_sensitive(False)
+            self.resize_column_widths()
 
     def button_About_clicked(self, widget):  # Creates the About Dialog
         about = gtk.AboutDialog()
@@ -347,6 +668,222 @@ class Main():
     # These are the various class functions
     """ ************************************************************************************************************ """
 
+    def start_scan(self):  # Reloads the data grid from default_folder_path in a background thread.  A scan that is already running is cancelled first.
+        self.cancel_scan()
+        self.update_watch()  # Before the scan, so no file is missed in between
+        self.clear_Data_Grid()
+        clear_track_facets()
+        perf_stats.clear(PerfStats.load_stages)
+        self.duplicate_check = None
+        self.duplicate_pending = []  # (The records of those files are replaced by the scan)
+        cancel = threading.Event()
+        self.scan_cancel = cancel
+        progressbar_Progress = self.builder.get_object("progressbar_Progress")
+        progressbar_Progress.set_fraction(0)
+        progressbar_Progress.set_text("Scanning...")
+        self.builder.get_object("button_Cancel").set_sensitive(True)
+        # The scan thread queues every file for the Gtk main loop, which owns files_Full and the data grid, and takes them over in batches every 0.1 seconds
+        # (on a timer, so the files that are already loaded don't wait for a slow file to be identified)
+        loaded = queue.Queue()
+        thread = threading.Thread(target=scan_files_Full, daemon=True,
+                                  args=(default_folder_path, cancel,
+                                        lambda entry, index: loaded.put((entry, index)),
+                                        lambda cancelled: glib.idle_add(self.scan_finished, cancel, cancelled, loaded)))
+        glib.timeout_add(100, self.scan_timer_tick, cancel, loaded)
+        thread.start()
+
+    def cancel_scan(self):  # Tells the background scan (if there is one) to stop.  Files it already handed over to the main loop are ignored.
+        if self.scan_cancel is not None:
+            self.scan_cancel.set()
+            self.scan_cancel = None
+
+    def scan_timer_tick(self, cancel, loaded):  # Adds the files that the background scan queued since the last tick to files_Full and the data grid, until the scan is done (or cancelled)
+        if cancel is not self.scan_cancel:  # The files belong to a scan that has been cancelled (or scan_finished already took them)
+            return False
+        entries = []
+        index = 0
+        while True:
+            try:
+                entry, index = loaded.get_nowait()
+            except queue.Empty:
+                break
+            entries.append(entry)
+        if len(entries) > 0:
+            self.scan_files_loaded(entries, index)
+        return True  # Keep going
+
+    def scan_files_loaded(self, entries, index):  # Adds a batch of files from the background scan to files_Full and the data grid
+        multi_lines_string = get_multi_lines_string()
+        liststore_Data_Grid = self.builder.get_object("liststore_Data_Grid")
+        start = time.perf_counter()
+        self.file_rows = None
+        for file in entries:
+            files_Full.append(file)
+            update_track_facets(file)
+            render_file(file, multi_lines_string)
+        perf_stats.add("render", time.perf_counter() - start, len(entries))
+        start = time.perf_counter()
+        # Detach the store while the batch is added (like load_Data_Grid), so the data grid lays out the rows once per batch instead of on every row insert.
+        # The rows are only added at the end, so the scroll position and the selection are put back as they were.
+        treeview_Data_Grid = self.builder.get_object("treeview_Data_Grid")
+        visible_range = treeview_Data_Grid.get_visible_range()
+        selected_rows = treeview_Data_Grid.get_selection().get_selected_rows()[1]
+        treeview_Data_Grid.set_model(None)
+        for file in entries:
+            row = get_Data_Grid_row(file)
+            files.append(row)
+            liststore_Data_Grid.append(row)
+        treeview_Data_Grid.set_model(liststore_Data_Grid)
+        for path in selected_rows:
+            treeview_Data_Grid.get_selection().select_path(path)
+        if visible_range is not None:
+            treeview_Data_Grid.scroll_to_cell(visible_range[0], None, True, 0, 0)
+        perf_stats.add("grid load", time.perf_counter() - start, len(entries))
+        progressbar_Progress = self.builder.get_object("progressbar_Progress")
+        progressbar_Progress.pulse()
+        progressbar_Progress.set_text("Scanning...  " + str(index) + " files")
+        return False  # Only run once
+
+    def scan_finished(self, cancel, cancelled, loaded):  # Called from the main loop once the background scan is done
+        if cancel is not self.scan_cancel:  # This scan has already been cancelled (and replaced)
+            return False
+        self.scan_timer_tick(cancel, loaded)  # The files that were queued since the last tick
+        self.scan_cancel = None
+        self.builder.get_object("button_Cancel").set_sensitive(False)
+        progressbar_Progress = self.builder.get_object("progressbar_Progress")
+        progressbar_Progress.set_fraction(1)
+        progressbar_Progress.set_text(str(len(files_Full)) + " files loaded")
+        self.resize_column_widths()
+        self.update_perf_panel()
+        if not cancelled:
+            self.start_duplicate_check()
+        if not self.resume_offered:
+            self.resume_offered = True
+            self.offer_resume()
+        if self.watch_pending is not None:
+            written, removed = self.watch_pending
+            self.watch_pending = None
+            self.watch_changed(self.watcher, written, removed)
+        return False  # Only run once
+
+    def update_watch(self):  # (Re)starts the InotifyWatcher of default_folder_path if watch_folder is on, otherwise stops it
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+        self.watch_pending = None
+        if not watch_folder:
+            return
+        try:
+            watcher = InotifyWatcher(default_folder_path, lambda written, removed: glib.idle_add(self.watch_changed, watcher, written, removed))
+        except OSError as error:
+            print("There was a problem watching the following folder:  " + str(default_folder_path) + "  (" + str(error) + ")")
+            self.builder.get_object("button_Watch").set_active(False)
+            return
+        self.watcher = watcher
+        watcher.start()
+
+    def watch_changed(self, watcher, written, removed):  # Called from the main loop with the files that InotifyWatcher reported:  removes the deleted ones and loads the new/changed ones
+        if watcher is not self.watcher:  # A watcher that has been stopped (and replaced)
+            return False
+        if written is None:  # Events were lost, so scan everything again (the identify cache keeps that quick)
+            self.start_scan()
+            return False
+        if self.scan_cancel is not None:  # Wait for the running scan, which may still load these files itself
+            if self.watch_pending is None:
+                self.watch_pending = (set(), set())
+            pending_written, pending_removed = self.watch_pending
+            for path in [path for path in pending_written if is_removed_path(path, removed)]:
+                pending_written.discard(path)
+            pending_removed.difference_update(written)
+            pending_written.update(written)
+            pending_removed.update(removed)
+            return False
+        self.remove_files(removed)
+        if len(written) > 0:
+            # Probe them in the background, the identify cache makes sure that only new or changed files are run through mkvmerge
+            thread = threading.Thread(target=load_watched_files, daemon=True,
+                                      args=(default_folder_path, written, lambda entries: glib.idle_add(self.watch_files_loaded, watcher, entries)))
+            thread.start()
+        return False
+
+    def remove_files(self, removed):  # Removes the files_Full records (and data grid rows) of the files and folders that InotifyWatcher reported as removed
+        if len(removed) == 0:
+            return
+        liststore_Data_Grid = self.builder.get_object("liststore_Data_Grid")
+        self.file_rows = None
+        for i in reversed(range(len(files_Full))):
+            if is_removed_path(files_Full[i].name, removed):
+                update_track_facets(files_Full[i], -1)
+                del files_Full[i]
+                del files[i]
+                liststore_Data_Grid.remove(liststore_Data_Grid.get_iter(i))
+        self.start_duplicate_check()  # (A group may be down to one copy)
+
+    def watch_files_loaded(self, watcher, entries):  # Adds the new files (or replaces the changed files) that InotifyWatcher reported to files_Full and the data grid
+        if watcher is not self.watcher:
+            return False
+        multi_lines_string = get_multi_lines_string()
+        liststore_Data_Grid = self.builder.get_object("liststore_Data_Grid")
+        indexes = {files_Full[i].name: i for i in range(len(files_Full))}
+        self.file_rows = None
+        for file in entries:
+            render_file(file, multi_lines_string)
+            row = get_Data_Grid_row(file)
+            update_track_facets(file)
+            if file.name in indexes:  # A changed file
+                i = indexes[file.name]
+                update_track_facets(files_Full[i], -1)
+                files_Full[i] = file
+                files[i] = row
+                liststore_Data_Grid[i] = row
+            else:
+                indexes[file.name] = len(files_Full)
+                files_Full.append(file)
+                files.append(row)
+                liststore_Data_Grid.append(row)
+        if self.scheduler is None:
+            self.builder.get_object("progressbar_Progress").set_text(str(len(entries)) + " new or changed files loaded (" + str(len(files_Full)) + " files)")
+        if watch_extract and len(entries) > 0:  # Once the duplicates are known, so skip_duplicates leaves out the new copies of known files
+            self.start_duplicate_check(lambda: self.queue_extraction(entries))
+        else:
+            self.start_duplicate_check()
+        return False
+
+    def start_duplicate_check(self, then=None):  # Finds the duplicate groups of files_Full in a background thread (reading the candidates can take a while on slow storage), see duplicates_found.  then() is called (from the main loop) once the groups are shown.
+        if then is not None:
+            self.duplicate_pending.append(then)
+        check = object()
+        self.duplicate_check = check
+        snapshot = list(files_Full)
+        folder_path = default_folder_path
+        thread = threading.Thread(target=lambda: glib.idle_add(self.duplicates_found, check, find_duplicate_groups(snapshot, folder_path)), daemon=True)
+        thread.start()
+
+    def duplicates_found(self, check, groups):  # Called from the main loop with the duplicate groups that start_duplicate_check found
+        if check is not self.duplicate_check or self.scan_cancel is not None:  # files_Full has changed since (and was checked again, or will be)
+            return False
+        self.duplicate_check = None
+        groups = self.show_duplicates(groups)
+        if self.scheduler is None and len(groups) > 0:
+            self.builder.get_object("progressbar_Progress").set_text(str(len(files_Full)) + " files loaded  |  " + get_duplicates_summary(groups))
+        pending = self.duplicate_pending
+        self.duplicate_pending = []
+        for then in pending:
+            then()
+        return False
+
+    def show_duplicates(self, groups):  # Shows the duplicate groups in the data grid, with the copies of every group right after its first copy.  Returns the groups (without the files that are gone since).
+        present = set(id(file) for file in files_Full)
+        groups = [[file for file in group if id(file) in present] for group in groups]
+        groups = [group for group in groups if len(group) > 1]
+        before = [(id(file), file.duplicate) for file in files_Full]
+        set_duplicate_groups(files_Full, groups)
+        files_Full[:] = get_grouped_order(files_Full)
+        self.file_rows = None
+        if [(id(file), file.duplicate) for file in files_Full] != before:  # (The rows are only loaded again if something changed, which keeps the selection otherwise)
+            self.load_Data_Grid()
+        return groups
+
     def entry_Add_File_Name_changed(self, widget):
         self.load_Data_Grid()
         self.resize_column_widths()
@@ -365,6 +902,10 @@ class Main():
         treeviewcolumn_Chapters.queue_resize()
         treeviewcolumn_Attachments = self.builder.get_object("treeviewcolumn_Attachments")
         treeviewcolumn_Attachments.queue_resize()
+        treeviewcolumn_Duplicates = self.builder.get_object("treeviewcolumn_Duplicates")
+        treeviewcolumn_Duplicates.queue_resize()
+        treeviewcolumn_Status = self.builder.get_object("treeviewcolumn_Status")
+        treeviewcolumn_Status.queue_resize()
 
     def clear_Data_Grid(self):  # Clears out the data grid and global files lists
         # treeview_Data_Grid = Select None
@@ -373,40 +914,50 @@ class Main():
         selection.unselect_all()
         # Do the rest of the original clear_Data_Grid bits
         liststore_Data_Grid = self.builder.get_object("liststore_Data_Grid")
+        treeview_Data_Grid.set_model(None)  # Otherwise the data grid handles the removal of every row on its own
         liststore_Data_Grid.clear()
+        treeview_Data_Grid.set_model(liststore_Data_Grid)
         global files
         global files_Full
         files.clear()
         files_Full.clear()
+        self.file_rows = None
 
     def load_Data_Grid(self):  # Loads data grid with files list
-        # files_Full[0] = Current_Name
-        # files_Full[1] = New_Name
-        # files_Full[2] = File_Size
-        # files_Full[3] = File_Date
-        # files_Full[4] = Audio
-        # files_Full[5] = Subtitles
-        # files_Full[6] = Status
-        # files_Full[7] = (json data) {}
-        # files_Full[8] = (video tracks) {}
-        # files_Full[9] = (audio tracks) {}
-        # files_Full[10] = (subtitle tracks) {}
-        # files_Full[11] = Default tracks []
-        # files_Full[12] = Chapters ""
-        # files_Full[13] = Attachments []
+        # files_Full holds MkvFile records, see get_Data_Grid_row for the data grid columns
         global files
         files.clear()
+        treeview_Data_Grid = self.builder.get_object("treeview_Data_Grid")
         liststore_Data_Grid = self.builder.get_object("liststore_Data_Grid")
+        # Detach the store while it is refilled:  the data grid then lays out the rows once when it gets the store back, instead of on every row insert
+        treeview_Data_Grid.set_model(None)
         liststore_Data_Grid.clear()
+        start = time.perf_counter()
         # Build files from files_Full
-        # Get prefix and suffix for new file names
         for file in files_Full:
-            if file[12] == 1: has_chapters = "Yes"
-            else: has_chapters = "No"
-            files.append([file[0], file[5], file[2], file[3], has_chapters, file[13]])
+            files.append(get_Data_Grid_row(file))
         # Build data grid from files
         for file in files:
             liststore_Data_Grid.append(file)
+        self.update_fixed_height_mode()
+        treeview_Data_Grid.set_model(liststore_Data_Grid)
+        perf_stats.add("grid load", time.perf_counter() - start, len(files))
+
+    def update_fixed_height_mode(self):  # Without multi_lines all rows have the same height, so the data grid only has to measure the rows that are visible
+        # Fixed height mode needs fixed width columns, so the columns keep the width they have when multi_lines is switched off.
+        treeview_Data_Grid = self.builder.get_object("treeview_Data_Grid")
+        if treeview_Data_Grid.get_fixed_height_mode() == (not multi_lines):
+            return
+        if multi_lines:
+            treeview_Data_Grid.set_fixed_height_mode(False)
+        for column in treeview_Data_Grid.get_columns():
+            if multi_lines:
+                column.set_sizing(gtk.TreeViewColumnSizing.GROW_ONLY)
+            else:
+                column.set_fixed_width(max(column.get_width(), 50))
+                column.set_sizing(gtk.TreeViewColumnSizing.FIXED)
+        if not multi_lines:
+            treeview_Data_Grid.set_fixed_height_mode(True)
 
 
 """ **************************************************************************************************************** """
@@ -415,263 +966,2009 @@ class Main():
 """ **************************************************************************************************************** """
 
 
-def get_list_of_mkv_files():  # Gets the list of all files and folder from the default_folder_path
-    global default_folder_path
-    file_list = []  # Temp list to be sorted
-    file_list.clear()
-    for filename in os.listdir(default_folder_path):
-        if str(filename[-4:]).lower() == ".mkv":
-            if os.path.isfile(default_folder_path + "/" + str(filename)):
-                file_list.append(str(filename))
-    file_list.sort()  # Get a sorted list of the files
-    return file_list
+def build_command_lines(action, files=None):  # Builds the mkvextract passes (argument lists) for every files_Full record (or for the records in files) in command_lines.  action is the combo_Option index (see extract_actions).
+    global command_lines
+    command_lines.clear()
+    command_lines = {}
+    extraction_plans.clear()
+    skipped_outputs.clear()
+    if files is None:
+        files = files_Full
+    ################################################################################
+    for i in range(len(files)):
+        tracks = []
+        header_options = []
+        skipped_before = len(skipped_outputs)
+        if skip_duplicates and files[i].duplicate is not None and files[i].duplicate[1] > 1:  # Only the first copy is extracted
+            command_lines[files[i].name] = "# Duplicate of " + str(files[i].duplicate[3]) + ", skipped..."
+            continue
+        if action in (0, 1, 2):  # Everything, Tracks (audio + video + subtitles), Video
+            tracks = tracks + export_all_videos(files[i])
+        if action in (0, 1, 3):  # Everything, Tracks (audio + video + subtitles), Audio
+            tracks = tracks + export_all_audios(files[i])
+        if action in (0, 1, 4):  # Everything, Tracks (audio + video + subtitles), Subtitles
+            tracks = tracks + export_all_subtitles(files[i])
+        if action in (0, 5):  # Everything, Chapters
+            header_options = header_options + export_chapters(files[i])
+        if action in (0, 6):  # Everything, Attachments
+            header_options = header_options + export_all_attachments(files[i])
+        if len(tracks) + len(header_options) < 1 and len(skipped_outputs) > skipped_before:  # The "tracks" mode is left out if the track filters left no tracks
+            command_lines[files[i].name] = "# Up to date, nothing to do..."
+        elif len(tracks) + len(header_options) < 1:
+            command_lines[files[i].name] = "# Nothing to do..."
+        else:
+            if default_folder_path == "":
+                source_path = str(files[i].name)
+            else:
+                source_path = default_folder_path + "/" + str(files[i].name)
+            passes, reason = plan_extraction_passes(files[i], source_path, tracks, header_options)
+            command_lines[files[i].name] = [["mkvextract", source_path] + options for options in passes]
+            extraction_plans[files[i].name] = reason
+    return command_lines
+
+
+def plan_extraction_passes(file, source_path, tracks, header_options):  # Groups the mkvextract options of a file into passes (argument lists without "mkvextract SOURCE").  Returns (passes, the reason for the plan).
+    # mkvextract takes several modes per invocation.  The header modes (chapters, attachments) only read the headers, every "tracks" pass reads the whole file.
+    # So by default everything goes into a single pass, with the header modes first (their outputs are there right away) and a single sequential read for the tracks.
+    # On fast storage, big files are split into parallel "tracks" passes (see get_extraction_pass_count), with the tracks spread over them by size.
+    count, reason = get_extraction_pass_count(source_path, len(tracks))
+    if count <= 1:
+        options = list(header_options)
+        if len(tracks) > 0:
+            options = options + ["tracks"] + tracks
+        return [options], reason
+    track_bytes = {str(track.id): track.bytes or 0 for track in file.video + file.audio + file.subtitles}
+    groups = [[] for i in range(count)]
+    sizes = [0] * count
+    for spec in sorted(tracks, key=lambda spec: track_bytes.get(spec.split(":")[0], 0), reverse=True):  # Largest first, into the smallest pass so far
+        i = sizes.index(min(sizes))
+        groups[i].append(spec)
+        sizes[i] = sizes[i] + max(1, track_bytes.get(spec.split(":")[0], 0))  # Tracks of unknown size are spread evenly
+    passes = [["tracks"] + sorted(group, key=tracks.index) for group in groups]
+    smallest = sizes.index(min(sizes))
+    passes[smallest] = list(header_options) + passes[smallest]
+    return passes, reason
+
+
+def get_extraction_pass_count(source_path, track_count):  # The number of "tracks" passes for a file (see plan_extraction_passes).  Returns (count, the reason).
+    if track_count < 2:
+        return 1, "single pass"
+    if extract_pass_mode == "single":
+        return 1, "single pass"
+    if extract_pass_mode == "split":
+        return min(track_count, max(1, int(extract_max_jobs))), "split"
+    try:
+        size = os.path.getsize(source_path)
+        limit = get_device_job_limit(get_device(source_path))
+    except OSError:
+        return 1, "single pass"
+    if size < extract_split_min_size:
+        return 1, "single pass (small file)"
+    if limit < 2:  # Parallel reads of the same spinning disk only make it seek
+        return 1, "single pass (rotational or unknown storage)"
+    return min(track_count, limit, max(1, int(extract_max_jobs))), "split (fast storage)"
+
+
+def get_plan_summary():  # The summary of the passes that plan_extraction_passes chose, e.g. "10 files in 1 pass (single pass (small file)), 2 files in 4 passes (split (fast storage))"
+    plans = {}
+    for name in command_lines:
+        if isinstance(command_lines[name], list):
+            key = (len(command_lines[name]), extraction_plans.get(name, ""))
+            plans[key] = plans.get(key, 0) + 1
+    summary = []
+    for passes, reason in sorted(plans):
+        summary.append(str(plans[(passes, reason)]) + " files in " + str(passes) + (" pass (" if passes == 1 else " passes (") + reason + ")")
+    return ",  ".join(summary) if len(summary) > 0 else "nothing to extract"
+
+
+def is_output_up_to_date(path, file, expected_size):  # Checks (for incremental_extract) if an output of a files_Full entry was already extracted.  Skipped outputs are added to skipped_outputs.
+    # The output has to be newer than the mkv file, and at least 90% of the expected size (e.g. the NUMBER_OF_BYTES statistics tag of a track) if it is known.
+    # The 10% leeway is for the container/header differences between the track data in the mkv file and the extracted file.
+    source_path = file.name if default_folder_path == "" else default_folder_path + "/" + file.name
+    try:
+        output_stat = os.stat(path)
+        source_stat = os.stat(source_path)
+    except OSError:
+        return False
+    if output_stat.st_mtime_ns < source_stat.st_mtime_ns or output_stat.st_size == 0:
+        return False
+    if expected_size is not None and output_stat.st_size < int(expected_size) * 0.9:
+        return False
+    skipped_outputs.append((file.name, path, output_stat.st_size))
+    return True
+
+
+def get_skipped_summary():  # The summary of what incremental_extract skipped, e.g. "12 files / 34.5 GB skipped (56 outputs up to date)"
+    skipped_files = [name for name in command_lines if command_lines[name] == "# Up to date, nothing to do..."]
+    skipped_bytes = sum(output[2] for output in skipped_outputs)
+    return str(len(skipped_files)) + " files / " + "{:.1f}".format(skipped_bytes / 1000000000) + " GB skipped (" + str(len(skipped_outputs)) + " outputs up to date)"
+
+
+def get_command_lines_output():  # The command_lines as the text of the "Command Lines" dialog (or of the --cli output).  The argument lists are shell quoted, so they can be pasted into a terminal.
+    output = []
+    for command in command_lines:
+        output.append("# " + str(command) + "\n")
+        output.append(get_command_line_text(command_lines[command]) + "\n")
+    return "".join(output)
+
+
+def get_command_line_text(command):  # A command_lines value as text:  the shell quoted argument list of every pass (one per line), or the "# ..." comment as is
+    if isinstance(command, list):
+        return "\n".join(shlex.join(command_pass) for command_pass in command)
+    return str(command)
+
+
+def get_Data_Grid_row(file):  # Builds the data grid row of a (rendered) files_Full record
+    if file.chapters: has_chapters = "Yes"
+    else: has_chapters = "No"
+    if file.duplicate is None: duplicate = ""
+    else: duplicate = "group " + str(file.duplicate[0]) + ", copy " + str(file.duplicate[1]) + " of " + str(file.duplicate[2])
+    return [file.name, file.video_markup, file.audio_markup, file.subtitles_markup, has_chapters, file.attachments_markup, file.status, duplicate]
+
+
+def get_list_of_mkv_files(folder_path=None):  # Gets the list of all files and folder from the default_folder_path (or folder_path)
+    if folder_path is None:
+        folder_path = default_folder_path
+    return list(iter_mkv_files(folder_path))
+
+
+def iter_mkv_files(folder_path, relative_path="", depth=0):  # Yields the mkv files of folder_path (relative to folder_path), in sorted order, as the folders are being read
+    # os.scandir() gets the file type from the folder entries, so (apart from symlinks) there is no stat call per file.
+    # The sub folders are only entered with recursive_scan, up to scan_max_depth levels.  scan_include/scan_exclude apply to the relative path and the name.
+    # Symlinked folders are not entered (as with the InotifyWatcher), so a symlink to a parent folder doesn't list the same files again and again.
+    try:
+        with os.scandir(folder_path + "/" + relative_path if relative_path != "" else folder_path) as folder:
+            entries = sorted(folder, key=lambda entry: entry.name)
+    except OSError as error:
+        print("There was a problem reading the following folder:  " + str(error))
+        return
+    for entry in entries:
+        file = relative_path + "/" + entry.name if relative_path != "" else entry.name
+        if matches_scan_patterns(file, entry.name, scan_exclude):
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if recursive_scan and (scan_max_depth is None or depth < scan_max_depth):
+                    yield from iter_mkv_files(folder_path, file, depth + 1)
+            elif str(entry.name[-4:]).lower() == ".mkv" and entry.is_file():
+                if len(scan_include) == 0 or matches_scan_patterns(file, entry.name, scan_include):
+                    yield file
+        except OSError:  # e.g. a broken symlink
+            continue
+
+
+def split_scan_patterns(text):  # Splits the ";" separated glob patterns of entry_Include/entry_Exclude
+    return [pattern.strip() for pattern in text.split(";") if pattern.strip() != ""]
+
+
+def matches_scan_patterns(relative_path, name, patterns):  # Checks if the relative path or the name matches one of the glob patterns
+    for pattern in patterns:
+        if fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+class NativeIdentifyError(Exception):  # Raised by native_identify_mkv_file() for anything it can't (or won't) handle, so that mkvmerge is used instead
+    pass
 
 
-def populate_files_Full():
+# The EBML/Matroska element IDs that native_identify_mkv_file() reads (https://www.matroska.org/technical/elements.html)
+ebml_id_header = 0x1A45DFA3
+ebml_id_doc_type = 0x4282
+ebml_id_segment = 0x18538067
+ebml_id_seek_head = 0x114D9B74
+ebml_id_seek = 0x4DBB
+ebml_id_seek_id = 0x53AB
+ebml_id_seek_position = 0x53AC
+ebml_id_info = 0x1549A966
+ebml_id_segment_uid = 0x73A4
+ebml_id_timestamp_scale = 0x2AD7B1
+ebml_id_duration = 0x4489
+ebml_id_title = 0x7BA9
+ebml_id_muxing_app = 0x4D80
+ebml_id_writing_app = 0x5741
+ebml_id_tracks = 0x1654AE6B
+ebml_id_track_entry = 0xAE
+ebml_id_track_number = 0xD7
+ebml_id_track_uid = 0x73C5
+ebml_id_track_type = 0x83
+ebml_id_flag_default = 0x88
+ebml_id_flag_forced = 0x55AA
+ebml_id_name = 0x536E
+ebml_id_language = 0x22B59C
+ebml_id_language_bcp47 = 0x22B59D
+ebml_id_codec_id = 0x86
+ebml_id_video = 0xE0
+ebml_id_pixel_width = 0xB0
+ebml_id_pixel_height = 0xBA
+ebml_id_display_width = 0x54B0
+ebml_id_display_height = 0x54BA
+ebml_id_display_unit = 0x54B2
+ebml_id_audio = 0xE1
+ebml_id_sampling_frequency = 0xB5
+ebml_id_channels = 0x9F
+ebml_id_chapters = 0x1043A770
+ebml_id_edition_entry = 0x45B9
+ebml_id_chapter_atom = 0xB6
+ebml_id_attachments = 0x1941A469
+ebml_id_attached_file = 0x61A7
+ebml_id_file_description = 0x467E
+ebml_id_file_name = 0x466E
+ebml_id_file_mime_type = 0x4660
+ebml_id_file_data = 0x465C
+ebml_id_file_uid = 0x46AE
+ebml_id_tags = 0x1254C367
+ebml_id_tag = 0x7373
+ebml_id_targets = 0x63C0
+ebml_id_tag_track_uid = 0x63C5
+ebml_id_simple_tag = 0x67C8
+ebml_id_tag_name = 0x45A3
+ebml_id_tag_string = 0x4487
+ebml_id_cluster = 0x1F43B675
+ebml_max_element_size = 16 * 1024 * 1024  # Level 1 elements bigger than this (apart from Attachments, whose file data is skipped) are left to mkvmerge
+# The mkvmerge codec names of the Matroska codec IDs (the export_* functions pick the file extensions from these).  The "/*" entries match on the prefix.
+matroska_codecs = {"V_MPEG1": "MPEG-1", "V_MPEG2": "MPEG-2", "V_MPEG4/ISO/AVC": "AVC/H.264/MPEG-4p10", "V_MPEGH/ISO/HEVC": "HEVC/H.265/MPEG-H",
+                   "V_MPEG4/ISO/ASP": "MPEG-4p2", "V_MPEG4/ISO/SP": "MPEG-4p2", "V_MPEG4/ISO/AP": "MPEG-4p2", "V_MS/VFW/FOURCC": "VfW",
+                   "V_THEORA": "Theora", "V_VP8": "VP8", "V_VP9": "VP9", "V_AV1": "AV1", "V_REAL/*": "RealVideo",
+                   "A_AAC": "AAC", "A_AAC/*": "AAC", "A_AC3": "AC-3", "A_EAC3": "E-AC-3", "A_DTS": "DTS", "A_FLAC": "FLAC", "A_OPUS": "Opus",
+                   "A_VORBIS": "Vorbis", "A_MPEG/L2": "MP2", "A_MPEG/L3": "MP3", "A_PCM/*": "PCM", "A_TRUEHD": "TrueHD", "A_MLP": "MLP",
+                   "A_ALAC": "ALAC", "A_TTA1": "TTA", "A_WAVPACK4": "WavPack4", "A_REAL/*": "RealAudio",
+                   "S_TEXT/UTF8": "SubRip/SRT", "S_TEXT/ASCII": "SubRip/SRT", "S_TEXT/SSA": "SubStationAlpha", "S_TEXT/ASS": "SubStationAlpha",
+                   "S_SSA": "SubStationAlpha", "S_ASS": "SubStationAlpha", "S_HDMV/PGS": "HDMV PGS", "S_HDMV/TEXTST": "HDMV TextST",
+                   "S_VOBSUB": "VobSub", "S_TEXT/USF": "USF", "S_TEXT/WEBVTT": "WebVTT", "S_DVBSUB": "DVBSUB", "S_KATE": "Kate"}
+# The ISO 639-1 codes of the ISO 639-2 languages (all of them, including the bibliographic codes), so "language_ietf" matches what mkvmerge reports for files without a LanguageBCP47 element
+# Other codes (apart from iso_639_2_languages) are left to mkvmerge, which knows how to normalize them
+iso_639_1_languages = {"aar": "aa", "abk": "ab", "ave": "ae", "afr": "af", "aka": "ak", "amh": "am", "arg": "an", "ara": "ar", "asm": "as", "ava": "av", "aym": "ay",
+                       "aze": "az", "bak": "ba", "bel": "be", "bul": "bg", "bis": "bi", "bam": "bm", "ben": "bn", "bod": "bo", "tib": "bo", "bre": "br", "bos": "bs",
+                       "cat": "ca", "che": "ce", "cha": "ch", "cos": "co", "cre": "cr", "ces": "cs", "cze": "cs", "chu": "cu", "chv": "cv", "cym": "cy", "wel": "cy",
+                       "dan": "da", "deu": "de", "ger": "de", "div": "dv", "dzo": "dz", "ewe": "ee", "ell": "el", "gre": "el", "eng": "en", "epo": "eo", "spa": "es",
+                       "est": "et", "eus": "eu", "baq": "eu", "fas": "fa", "per": "fa", "ful": "ff", "fin": "fi", "fij": "fj", "fao": "fo", "fra": "fr", "fre": "fr",
+                       "fry": "fy", "gle": "ga", "gla": "gd", "glg": "gl", "grn": "gn", "guj": "gu", "glv": "gv", "hau": "ha", "heb": "he", "hin": "hi", "hmo": "ho",
+                       "hrv": "hr", "hat": "ht", "hun": "hu", "hye": "hy", "arm": "hy", "her": "hz", "ina": "ia", "ind": "id", "ile": "ie", "ibo": "ig", "iii": "ii",
+                       "ipk": "ik", "ido": "io", "isl": "is", "ice": "is", "ita": "it", "iku": "iu", "jpn": "ja", "jav": "jv", "kat": "ka", "geo": "ka", "kon": "kg",
+                       "kik": "ki", "kua": "kj", "kaz": "kk", "kal": "kl", "khm": "km", "kan": "kn", "kor": "ko", "kau": "kr", "kas": "ks", "kur": "ku", "kom": "kv",
+                       "cor": "kw", "kir": "ky", "lat": "la", "ltz": "lb", "lug": "lg", "lim": "li", "lin": "ln", "lao": "lo", "lit": "lt", "lub": "lu", "lav": "lv",
+                       "mlg": "mg", "mah": "mh", "mri": "mi", "mao": "mi", "mkd": "mk", "mac": "mk", "mal": "ml", "mon": "mn", "mar": "mr", "msa": "ms", "may": "ms",
+                       "mlt": "mt", "mya": "my", "bur": "my", "nau": "na", "nob": "nb", "nde": "nd", "nep": "ne", "ndo": "ng", "nld": "nl", "dut": "nl", "nno": "nn",
+                       "nor": "no", "nbl": "nr", "nav": "nv", "nya": "ny", "oci": "oc", "oji": "oj", "orm": "om", "ori": "or", "oss": "os", "pan": "pa", "pli": "pi",
+                       "pol": "pl", "pus": "ps", "por": "pt", "que": "qu", "roh": "rm", "run": "rn", "ron": "ro", "rum": "ro", "rus": "ru", "kin": "rw", "san": "sa",
+                       "srd": "sc", "snd": "sd", "sme": "se", "sag": "sg", "sin": "si", "slk": "sk", "slo": "sk", "slv": "sl", "smo": "sm", "sna": "sn", "som": "so",
+                       "sqi": "sq", "alb": "sq", "srp": "sr", "ssw": "ss", "sot": "st", "sun": "su", "swe": "sv", "swa": "sw", "tam": "ta", "tel": "te", "tgk": "tg",
+                       "tha": "th", "tir": "ti", "tuk": "tk", "tgl": "tl", "tsn": "tn", "ton": "to", "tur": "tr", "tso": "ts", "tat": "tt", "twi": "tw", "tah": "ty",
+                       "uig": "ug", "ukr": "uk", "urd": "ur", "uzb": "uz", "ven": "ve", "vie": "vi", "vol": "vo", "wln": "wa", "wol": "wo", "xho": "xh", "yid": "yi",
+                       "yor": "yo", "zha": "za", "zho": "zh", "chi": "zh", "zul": "zu"}
+iso_639_2_languages = {"und", "mul", "zxx", "mis"}  # The ISO 639-2 codes without an ISO 639-1 code that mkvmerge reports unchanged
+
+
+def read_ebml_vint(data, pos, keep_marker):  # Reads an EBML variable size integer at data[pos].  Returns (value, length, is the "unknown size" value)
+    if pos >= len(data) or data[pos] == 0:
+        raise NativeIdentifyError("Invalid or truncated EBML data")
+    length = 9 - data[pos].bit_length()
+    if pos + length > len(data):
+        raise NativeIdentifyError("Truncated EBML data")
+    value = data[pos] if keep_marker else data[pos] & (0xFF >> length)  # Element IDs keep the length marker bit, sizes don't
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    return value, length, not keep_marker and value == (1 << (7 * length)) - 1
+
+
+def iter_ebml_elements(data, start=0, end=None):  # Yields (id, data start, size) of the EBML elements in data[start:end]
+    if end is None:
+        end = len(data)
+    pos = start
+    while pos < end:
+        element_id, id_length, unknown = read_ebml_vint(data, pos, True)
+        size, size_length, unknown = read_ebml_vint(data, pos + id_length, False)
+        data_start = pos + id_length + size_length
+        if unknown or data_start + size > end:
+            raise NativeIdentifyError("EBML element with an unknown or invalid size")
+        yield element_id, data_start, size
+        pos = data_start + size
+
+
+def read_ebml_header(file, pos):  # Reads the element header at pos of an open file.  Returns (id, data position, size), with a size of None for "unknown size"
+    file.seek(pos)
+    head = file.read(12)
+    element_id, id_length, unknown = read_ebml_vint(head, 0, True)
+    size, size_length, unknown = read_ebml_vint(head, id_length, False)
+    return element_id, pos + id_length + size_length, None if unknown else size
+
+
+def read_ebml_element(file, pos, expected_id):  # Reads the data of the (level 1) element at pos of an open file
+    element_id, data_pos, size = read_ebml_header(file, pos)
+    if element_id != expected_id or size is None or size > ebml_max_element_size:
+        raise NativeIdentifyError("Unexpected, unknown size or too big element " + hex(element_id))
+    file.seek(data_pos)
+    data = file.read(size)
+    if len(data) != size:
+        raise NativeIdentifyError("Truncated element " + hex(element_id))
+    return data
+
+
+def get_ebml_uint(data, start, size):
+    return int.from_bytes(data[start:start + size], "big")
+
+
+def get_ebml_string(data, start, size):
+    return data[start:start + size].decode("utf-8", "replace").rstrip("\x00")
+
+
+def get_ebml_float(data, start, size):
+    if size == 4:
+        return struct.unpack(">f", data[start:start + 4])[0]
+    if size == 8:
+        return struct.unpack(">d", data[start:start + 8])[0]
+    if size == 0:
+        return 0.0
+    raise NativeIdentifyError("Invalid float size")
+
+
+def native_identify_mkv_file(path):  # Reads the same json data as "mkvmerge --identify" (the parts parse_file_json uses) straight from the Matroska headers
+    # Only the EBML header, the SeekHead(s) and the Info/Tracks/Chapters/Attachments/Tags elements are read, with bounded reads (the attachment data is skipped).
+    # NativeIdentifyError is raised for anything unusual (not Matroska, unknown track types or codecs, unknown sizes...), so the caller can use mkvmerge instead.
+    with open(path, "rb") as file:
+        file_size = os.fstat(file.fileno()).st_size
+        header = read_ebml_element(file, 0, ebml_id_header)
+        doc_type = ""
+        for element_id, start, size in iter_ebml_elements(header):
+            if element_id == ebml_id_doc_type:
+                doc_type = get_ebml_string(header, start, size)
+        if doc_type not in ("matroska", "webm"):
+            raise NativeIdentifyError("Not a Matroska file")
+        element_id, segment_start, segment_size = read_ebml_header(file, file.tell())
+        if element_id != ebml_id_segment:
+            raise NativeIdentifyError("No Segment found")
+        segment_end = file_size if segment_size is None else min(file_size, segment_start + segment_size)
+        # Walk the level 1 elements up to the first Cluster.  The SeekHead(s) point to the ones after the Clusters (e.g. the Tags).
+        wanted = (ebml_id_info, ebml_id_tracks, ebml_id_chapters, ebml_id_attachments, ebml_id_tags)
+        positions = {}
+        seek_heads = []
+        pos = segment_start
+        for count in range(64):
+            if pos >= segment_end:
+                break
+            element_id, data_pos, size = read_ebml_header(file, pos)
+            if element_id == ebml_id_cluster:
+                break
+            if size is None:
+                raise NativeIdentifyError("Level 1 element with an unknown size")
+            if element_id in wanted and element_id not in positions:
+                positions[element_id] = pos
+            elif element_id == ebml_id_seek_head:
+                seek_heads.append(pos)
+            pos = data_pos + size
+        seek_heads_read = []
+        while len(seek_heads) > 0:
+            pos = seek_heads.pop(0)
+            if pos in seek_heads_read or len(seek_heads_read) >= 4:
+                continue
+            seek_heads_read.append(pos)
+            data = read_ebml_element(file, pos, ebml_id_seek_head)
+            for element_id, start, size in iter_ebml_elements(data):
+                if element_id != ebml_id_seek:
+                    continue
+                seek_id = None
+                seek_position = None
+                for child_id, child_start, child_size in iter_ebml_elements(data, start, start + size):
+                    if child_id == ebml_id_seek_id:
+                        seek_id = get_ebml_uint(data, child_start, child_size)
+                    elif child_id == ebml_id_seek_position:
+                        seek_position = get_ebml_uint(data, child_start, child_size)
+                if seek_id is None or seek_position is None or segment_start + seek_position >= segment_end:
+                    continue
+                if seek_id == ebml_id_seek_head:
+                    seek_heads.append(segment_start + seek_position)
+                elif seek_id in wanted and seek_id not in positions:
+                    positions[seek_id] = segment_start + seek_position
+        if ebml_id_tracks not in positions:
+            raise NativeIdentifyError("No Tracks found")
+        json_data = {"container": {"recognized": True, "supported": True, "type": "Matroska", "properties": {}}, "tracks": [], "chapters": [], "attachments": []}
+        if ebml_id_info in positions:
+            json_data["container"]["properties"] = parse_ebml_info(read_ebml_element(file, positions[ebml_id_info], ebml_id_info))
+        track_uids = {}
+        json_data["tracks"] = parse_ebml_tracks(read_ebml_element(file, positions[ebml_id_tracks], ebml_id_tracks), track_uids)
+        if ebml_id_chapters in positions:
+            data = read_ebml_element(file, positions[ebml_id_chapters], ebml_id_chapters)
+            for element_id, start, size in iter_ebml_elements(data):
+                if element_id == ebml_id_edition_entry:
+                    atoms = [child_id for child_id, child_start, child_size in iter_ebml_elements(data, start, start + size) if child_id == ebml_id_chapter_atom]
+                    json_data["chapters"].append({"num_entries": len(atoms)})
+        if ebml_id_attachments in positions:
+            json_data["attachments"] = read_ebml_attachments(file, positions[ebml_id_attachments])
+        if ebml_id_tags in positions:
+            parse_ebml_track_tags(read_ebml_element(file, positions[ebml_id_tags], ebml_id_tags), track_uids)
+    return json_data
+
+
+def parse_ebml_info(data):  # Parses the Info element into mkvmerge's container properties
+    properties = {}
+    timestamp_scale = 1000000
+    duration = None
+    for element_id, start, size in iter_ebml_elements(data):
+        if element_id == ebml_id_segment_uid:
+            properties["segment_uid"] = data[start:start + size].hex()
+        elif element_id == ebml_id_timestamp_scale:
+            timestamp_scale = get_ebml_uint(data, start, size)
+        elif element_id == ebml_id_duration:
+            duration = get_ebml_float(data, start, size)
+        elif element_id == ebml_id_title:
+            properties["title"] = get_ebml_string(data, start, size)
+        elif element_id == ebml_id_muxing_app:
+            properties["muxing_application"] = get_ebml_string(data, start, size)
+        elif element_id == ebml_id_writing_app:
+            properties["writing_application"] = get_ebml_string(data, start, size)
+    if duration is not None:
+        properties["duration"] = int(duration * timestamp_scale)  # In nanoseconds, like mkvmerge
+    return properties
+
+
+def parse_ebml_tracks(data, track_uids):  # Parses the Tracks element into mkvmerge's tracks (with mkvmerge's track IDs:  0, 1, 2... in file order).  Fills track_uids {TrackUID: track}.
+    tracks = []
+    for element_id, start, size in iter_ebml_elements(data):
+        if element_id != ebml_id_track_entry:
+            continue
+        properties = {"default_track": True, "forced_track": False, "language": "eng"}
+        track_type = None
+        video = None
+        audio = None
+        for child_id, child_start, child_size in iter_ebml_elements(data, start, start + size):
+            if child_id == ebml_id_track_number:
+                properties["number"] = get_ebml_uint(data, child_start, child_size)
+            elif child_id == ebml_id_track_uid:
+                properties["uid"] = get_ebml_uint(data, child_start, child_size)
+            elif child_id == ebml_id_track_type:
+                track_type = get_ebml_uint(data, child_start, child_size)
+            elif child_id == ebml_id_flag_default:
+                properties["default_track"] = get_ebml_uint(data, child_start, child_size) == 1
+            elif child_id == ebml_id_flag_forced:
+                properties["forced_track"] = get_ebml_uint(data, child_start, child_size) == 1
+            elif child_id == ebml_id_name:
+                properties["track_name"] = get_ebml_string(data, child_start, child_size)
+            elif child_id == ebml_id_language:
+                properties["language"] = get_ebml_string(data, child_start, child_size)
+            elif child_id == ebml_id_language_bcp47:
+                properties["language_ietf"] = get_ebml_string(data, child_start, child_size)
+            elif child_id == ebml_id_codec_id:
+                properties["codec_id"] = get_ebml_string(data, child_start, child_size)
+            elif child_id == ebml_id_video:
+                video = {}
+                for video_id, video_start, video_size in iter_ebml_elements(data, child_start, child_start + child_size):
+                    video[video_id] = get_ebml_uint(data, video_start, video_size)
+            elif child_id == ebml_id_audio:
+                audio = {}
+                for audio_id, audio_start, audio_size in iter_ebml_elements(data, child_start, child_start + child_size):
+                    if audio_id == ebml_id_sampling_frequency:
+                        audio["audio_sampling_frequency"] = int(get_ebml_float(data, audio_start, audio_size))
+                    elif audio_id == ebml_id_channels:
+                        audio["audio_channels"] = get_ebml_uint(data, audio_start, audio_size)
+        if track_type == 1:
+            type = "video"
+        elif track_type == 2:
+            type = "audio"
+        elif track_type == 17:
+            type = "subtitles"
+        else:
+            raise NativeIdentifyError("Unsupported track type " + str(track_type))
+        codec_id = properties.get("codec_id", "")
+        codec = matroska_codecs.get(codec_id)
+        if codec is None and "/" in codec_id:
+            codec = matroska_codecs.get(codec_id.split("/")[0] + "/*")
+        if codec is None:
+            raise NativeIdentifyError("Unknown codec " + codec_id)
+        if "language_ietf" not in properties:
+            if properties["language"] in iso_639_1_languages:
+                properties["language_ietf"] = iso_639_1_languages[properties["language"]]
+            elif properties["language"] in iso_639_2_languages:
+                properties["language_ietf"] = properties["language"]
+            else:
+                raise NativeIdentifyError("Language without a known ISO 639-1 code " + properties["language"])
+        if codec_id == "S_TEXT/UTF8":
+            properties["encoding"] = "UTF-8"
+        if video is not None:
+            if video.get(ebml_id_display_unit, 0) != 0:  # mkvmerge converts other display units, leave that to it
+                raise NativeIdentifyError("Unsupported display unit")
+            if ebml_id_pixel_width in video and ebml_id_pixel_height in video:
+                properties["pixel_dimensions"] = str(video[ebml_id_pixel_width]) + "x" + str(video[ebml_id_pixel_height])
+                properties["display_dimensions"] = str(video.get(ebml_id_display_width, video[ebml_id_pixel_width])) + "x" + str(video.get(ebml_id_display_height, video[ebml_id_pixel_height]))
+        if audio is not None:
+            properties.update(audio)
+        track = {"id": len(tracks), "type": type, "codec": codec, "properties": properties}
+        if "uid" in properties:
+            track_uids[properties["uid"]] = track
+        tracks.append(track)
+    return tracks
+
+
+def read_ebml_attachments(file, pos):  # Reads the Attachments element of an open file into mkvmerge's attachments (IDs 1, 2, 3...), without reading the file data
+    element_id, data_pos, size = read_ebml_header(file, pos)
+    if element_id != ebml_id_attachments or size is None:
+        raise NativeIdentifyError("Invalid Attachments element")
+    attachments = []
+    pos = data_pos
+    while pos < data_pos + size:
+        element_id, file_pos, file_size = read_ebml_header(file, pos)
+        if file_size is None:
+            raise NativeIdentifyError("Attachment with an unknown size")
+        if element_id == ebml_id_attached_file:
+            attachment = {"id": len(attachments) + 1, "file_name": "", "content_type": "", "description": "", "size": 0, "properties": {}}
+            child_pos = file_pos
+            while child_pos < file_pos + file_size:
+                child_id, child_data_pos, child_size = read_ebml_header(file, child_pos)
+                if child_size is None:
+                    raise NativeIdentifyError("Attachment with an unknown size")
+                if child_id == ebml_id_file_data:
+                    attachment["size"] = child_size
+                elif child_id in (ebml_id_file_name, ebml_id_file_mime_type, ebml_id_file_description, ebml_id_file_uid) and child_size <= 65536:
+                    file.seek(child_data_pos)
+                    value = file.read(child_size)
+                    if child_id == ebml_id_file_name:
+                        attachment["file_name"] = get_ebml_string(value, 0, child_size)
+                    elif child_id == ebml_id_file_mime_type:
+                        attachment["content_type"] = get_ebml_string(value, 0, child_size)
+                    elif child_id == ebml_id_file_description:
+                        attachment["description"] = get_ebml_string(value, 0, child_size)
+                    else:
+                        attachment["properties"]["uid"] = get_ebml_uint(value, 0, child_size)
+                child_pos = child_data_pos + child_size
+            attachments.append(attachment)
+        pos = file_pos + file_size
+    return attachments
+
+
+def parse_ebml_track_tags(data, track_uids):  # Adds the track statistics tags (e.g. NUMBER_OF_BYTES) to the track properties as "tag_number_of_bytes"... like mkvmerge
+    for element_id, start, size in iter_ebml_elements(data):
+        if element_id != ebml_id_tag:
+            continue
+        uids = []
+        simple_tags = {}
+        for child_id, child_start, child_size in iter_ebml_elements(data, start, start + size):
+            if child_id == ebml_id_targets:
+                for target_id, target_start, target_size in iter_ebml_elements(data, child_start, child_start + child_size):
+                    if target_id == ebml_id_tag_track_uid:
+                        uids.append(get_ebml_uint(data, target_start, target_size))
+            elif child_id == ebml_id_simple_tag:
+                name = None
+                value = None
+                for tag_id, tag_start, tag_size in iter_ebml_elements(data, child_start, child_start + child_size):
+                    if tag_id == ebml_id_tag_name:
+                        name = get_ebml_string(data, tag_start, tag_size)
+                    elif tag_id == ebml_id_tag_string:
+                        value = get_ebml_string(data, tag_start, tag_size)
+                if name in ("BPS", "DURATION", "NUMBER_OF_BYTES", "NUMBER_OF_FRAMES") and value is not None:
+                    simple_tags["tag_" + name.lower()] = value
+        for uid in uids:
+            if uid in track_uids:
+                track_uids[uid]["properties"].update(simple_tags)
+
+
+ProcessResult = collections.namedtuple("ProcessResult", ["exit_code", "stdout", "stderr", "timed_out", "seconds"])  # The result of ProcessEngine.run_process().  stdout/stderr are only captured with capture=True.
+
+
+class ProcessEngine():  # Runs the mkvmerge and mkvextract processes of the whole application on one asyncio event loop (in a background thread), instead of a thread per process
+    # Every kind of process (engine_limits) has its own concurrency limit, which is shared by all the scans and extraction batches.
+    # The output is read in chunks and handed to on_line line by line, and a pipe is only read as fast as on_line returns, so a slow consumer makes the process wait (back-pressure) instead of piling up output.
+    # The results are concurrent.futures.Futures, so the scan and scheduler threads (and GLib callbacks) can wait on them or add done callbacks (which run on the event loop thread).
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+        self.limits = {}  # kind: asyncio.Semaphore (created on the event loop)
+        self.tasks = {}  # Future: the asyncio.Task of a submit()
+        self.read_executor = None  # The threads for the blocking file reads of the coroutines (see read_in_thread)
+
+    def get_loop(self):  # Starts the event loop thread on first use
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                if sys.version_info < (3, 12) and hasattr(os, "pidfd_open"):  # The default child watcher before Python 3.12 waits for every process in a thread of its own
+                    try:
+                        os.close(os.pidfd_open(os.getpid()))  # (Linux 5.3 and later)
+                        watcher = asyncio.PidfdChildWatcher()
+                        watcher.attach_loop(self.loop)
+                        asyncio.set_child_watcher(watcher)
+                    except OSError:
+                        pass
+                self.read_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(engine_read_threads)))
+                thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+                thread.start()
+            return self.loop
+
+    def submit(self, coroutine):  # Runs a coroutine on the event loop.  Returns a concurrent.futures.Future of its result, which is cancelled with cancel() (not Future.cancel()).
+        future = concurrent.futures.Future()
+        loop = self.get_loop()
+
+        def start():
+            task = loop.create_task(coroutine)
+            self.tasks[future] = task
+            task.add_done_callback(lambda task: self.task_done(future, task))
+
+        loop.call_soon_threadsafe(start)
+        return future
+
+    def task_done(self, future, task):  # Passes the outcome of a submit() coroutine on to its Future
+        del self.tasks[future]
+        if task.cancelled():
+            future.cancel()
+            future.set_running_or_notify_cancel()  # (Wakes up concurrent.futures.wait() as well)
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def cancel(self, future):  # Cancels a submit() coroutine.  Its process is terminated (and killed after engine_kill_seconds), and the Future is done once it has exited.
+        def cancel_task():
+            if future in self.tasks:
+                self.tasks[future].cancel()
+
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(cancel_task)
+
+    def run(self, argv, kind, on_line=None, capture=False, stderr="stdout", timeout=None):  # Runs a process (see run_process).  Returns a concurrent.futures.Future of its ProcessResult.
+        return self.submit(self.run_process(argv, kind, on_line, capture, stderr, timeout))
+
+    def shutdown(self, timeout=None):  # Cancels everything that is still running and waits (up to timeout seconds) until the processes have exited, e.g. before the application exits
+        if self.loop is None:
+            return
+        futures = list(self.tasks)
+        for future in futures:
+            self.cancel(future)
+        concurrent.futures.wait(futures, timeout=timeout)
+
+    def get_limit(self, kind):  # The semaphore of a kind of process (this runs on the event loop)
+        if kind not in self.limits:
+            self.limits[kind] = asyncio.Semaphore(max(1, int(engine_limits.get(kind, lambda: 1)())))  # Other kinds run one at a time
+        return self.limits[kind]
+
+    async def read_in_thread(self, function, *args):  # Runs a blocking function (e.g. reading the Matroska headers) in the read threads
+        return await asyncio.get_running_loop().run_in_executor(self.read_executor, function, *args)
+
+    async def run_process(self, argv, kind, on_line=None, capture=False, stderr="stdout", timeout=None):  # Runs the argument list (no shell) once a slot of kind is free.  Returns a ProcessResult.
+        # on_line(stream, line) gets every line ("\n" or "\r" terminated, like the mkvextract progress updates) of "stdout" and "stderr".
+        # stderr:  "stdout" (merged into stdout), "pipe" (read on its own) or None (inherited, e.g. shown in the terminal).
+        # After timeout seconds the process is killed and the result is timed_out.  Raises OSError if the process can't be started.
+        async with self.get_limit(kind):
+            start = time.perf_counter()
+            process = await asyncio.create_subprocess_exec(*argv, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                                           stderr={"stdout": subprocess.STDOUT, "pipe": subprocess.PIPE, None: None}[stderr])
+            readers = [self.read_stream(process.stdout, "stdout", on_line, capture)]
+            if process.stderr is not None:
+                readers.append(self.read_stream(process.stderr, "stderr", on_line, capture))
+            try:
+                outputs = await asyncio.wait_for(asyncio.gather(*readers), timeout)
+                await process.wait()
+                timed_out = False
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                outputs = [b"", b""]
+                timed_out = True
+            except asyncio.CancelledError:  # Let the process exit (and write what it has) before the task is cancelled
+                await self.stop_process(process)
+                raise
+            return ProcessResult(process.returncode, outputs[0], outputs[1] if len(outputs) > 1 else b"", timed_out, time.perf_counter() - start)
+
+    async def stop_process(self, process):  # Terminates a process, and kills it if it hasn't exited after engine_kill_seconds
+        if process.returncode is not None:
+            return
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), engine_kill_seconds)
+        except ProcessLookupError:
+            pass
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+    async def read_stream(self, stream, name, on_line, capture):  # Reads a process pipe until it is closed.  Returns the output if capture, otherwise b"".
+        output = bytearray()
+        partial = b""
+        while True:
+            chunk = await stream.read(65536)
+            if len(chunk) == 0:
+                break
+            if capture:
+                output.extend(chunk)
+            if on_line is not None:
+                lines = re.split(b"[\r\n]", partial + chunk)
+                partial = lines.pop()
+                for line in lines:
+                    if len(line) > 0:
+                        on_line(name, line.decode("utf-8", errors="replace"))
+        if on_line is not None and len(partial) > 0:
+            on_line(name, partial.decode("utf-8", errors="replace"))
+        return bytes(output)
+
+
+process_engine = ProcessEngine()  # The engine of all the mkvmerge and mkvextract processes
+
+
+async def probe_mkv_file(path):  # Gets information from the mkv file in json format.  Returns (json data, identify cache version).  This runs on the ProcessEngine (see iter_probe_files())
+    if native_identify:
+        start = time.perf_counter()
+        try:
+            json_data = await process_engine.read_in_thread(native_identify_mkv_file, path)
+            perf_stats.add("probe (native)", time.perf_counter() - start, path=path)
+            return json_data, native_identify_version
+        except (NativeIdentifyError, OSError, struct.error) as error:  # Let mkvmerge handle it
+            perf_stats.add("probe (native)", time.perf_counter() - start, 0)
+    cmd = ["mkvmerge", "--identify", "--identification-format", "json", path]
+    result = await process_engine.run_process(cmd, "probe", capture=True, stderr=None, timeout=probe_timeout)
+    if result.timed_out:
+        raise TimeoutError("mkvmerge took longer than " + str(probe_timeout) + " s")
+    perf_stats.add("probe (mkvmerge)", result.seconds, path=path)
+    start = time.perf_counter()
+    json_data = json.loads(result.stdout.decode("utf-8"))  # json information of all objects in the mkv file
+    perf_stats.add("probe (json)", time.perf_counter() - start)
+    # mkvmerge exits with 1 for warnings, but with 2 for files it can't read (with the errors in the json data instead of the file information), which must not end up in the identify cache
+    if result.exit_code not in (0, 1) or not isinstance(json_data.get("container"), dict) or json_data["container"].get("recognized") is False or "properties" not in json_data["container"]:
+        raise ValueError("mkvmerge exit code " + str(result.exit_code) + ":  " + "  ".join(str(error) for error in json_data.get("errors", [])))
+    return json_data, await process_engine.read_in_thread(get_mkvmerge_version)
+
+
+def get_mkvmerge_version():  # Gets the "mkvmerge --version" output once per session, so cached json data from a different mkvmerge version isn't used
+    global mkvmerge_version
+    if mkvmerge_version is None:
+        try:
+            proc = subprocess.Popen(["mkvmerge", "--version"], stdout=subprocess.PIPE)
+            version, err = proc.communicate()
+            mkvmerge_version = version.decode("utf-8").strip()
+        except OSError:
+            mkvmerge_version = ""
+    return mkvmerge_version
+
+
+def get_identify_cache_key(path):  # The identify cache key of a file:  (absolute path, size, mtime_ns, inode)
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def open_identify_cache():  # Opens (and creates if needed) the identify cache.  Returns None if the cache can't be used, in which case every file is probed.
+    try:
+        os.makedirs(os.path.dirname(identify_cache_path), exist_ok=True)
+        cache = sqlite3.connect(identify_cache_path)
+        cache.execute("CREATE TABLE IF NOT EXISTS identify (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, inode INTEGER, version TEXT, json TEXT, last_used REAL)")
+        cache.execute("CREATE INDEX IF NOT EXISTS identify_last_used ON identify (last_used)")
+        return cache
+    except (OSError, sqlite3.Error) as error:
+        print("The identify cache couldn't be opened:  " + str(error))
+        return None
+
+
+def identify_cache_lookup(cache, cache_keys):  # Returns {file: json data} for every file in cache_keys {file: cache key} that has an up to date cache entry
+    hits = {}
+    if cache is None:
+        return hits
+    versions = [get_mkvmerge_version()]  # Entries from a different mkvmerge version are out of date
+    if native_identify:
+        versions.append(native_identify_version)
+    paths = {cache_keys[file][0]: file for file in cache_keys}
+    path_list = list(paths)
+    try:
+        for start in range(0, len(path_list), 500):  # Stay below the sqlite parameter limit
+            chunk = path_list[start:start + 500]
+            rows = cache.execute("SELECT path, size, mtime_ns, inode, version, json FROM identify WHERE path IN (" + ",".join("?" * len(chunk)) + ")", chunk)
+            for path, size, mtime_ns, inode, row_version, row_json in rows:
+                file = paths[path]
+                if (path, size, mtime_ns, inode) == cache_keys[file] and row_version in versions:
+                    data = json.loads(row_json)
+                    if isinstance(data.get("container"), dict) and "properties" in data["container"]:  # (Older versions cached the mkvmerge errors as well, those files are identified again)
+                        hits[file] = data
+        # Mark the hits as recently used for the LRU eviction
+        now = time.time()
+        cache.executemany("UPDATE identify SET last_used = ? WHERE path = ?", [(now, cache_keys[file][0]) for file in hits])
+        cache.commit()
+    except (sqlite3.Error, ValueError) as error:
+        print("The identify cache couldn't be read:  " + str(error))
+    return hits
+
+
+def identify_cache_store(cache, entries):  # Stores {file: (cache key, json data, version)} in the identify cache and evicts the least recently used entries beyond identify_cache_max_entries
+    if cache is None:
+        return
+    now = time.time()
+    try:
+        cache.executemany("INSERT OR REPLACE INTO identify (path, size, mtime_ns, inode, version, json, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          [(key[0], key[1], key[2], key[3], version, json.dumps(data), now) for key, data, version in entries.values()])
+        count = cache.execute("SELECT COUNT(*) FROM identify").fetchone()[0]
+        if count > identify_cache_max_entries:
+            cache.execute("DELETE FROM identify WHERE path IN (SELECT path FROM identify ORDER BY last_used LIMIT ?)", (count - identify_cache_max_entries,))
+        cache.commit()
+    except sqlite3.Error as error:
+        print("The identify cache couldn't be written:  " + str(error))
+
+
+def iter_probe_files(folder_path, file_list, cancel=None):  # Yields (file, json data) for every file in file_list (any iterable), in the same order as file_list
+    # The files are looked up in the identify cache first, so only new or changed files have to be run through mkvmerge.
+    # The rest are run through "mkvmerge --identify" concurrently on the ProcessEngine (probe_workers at a time).
+    # file_list is consumed in chunks while the probes run, so a (recursive) folder listing streams straight into the probing.
+    # Setting the cancel event (threading.Event) stops the probing after the current file.
+    workers = max(1, int(probe_workers))
+    cache = open_identify_cache()
+    pending = collections.deque()  # (file, cache key, json data or the Future of its probe), in file_list order
+    probed = {}
+    file_list = iter(file_list)
+    try:
+        while True:
+            if cancel is not None and cancel.is_set():
+                break
+            # Read the next chunk of files, as long as not too many probes are waiting
+            if file_list is not None and len(pending) < workers * 4:
+                start = time.perf_counter()
+                chunk = list(itertools.islice(file_list, 64))  # (A folder listing only lists as far as it is read)
+                perf_stats.add("scan", time.perf_counter() - start, len(chunk))
+                if len(chunk) == 0:
+                    file_list = None
+                    continue
+                start = time.perf_counter()
+                cache_keys = {}
+                for file in chunk:
+                    try:
+                        cache_keys[file] = get_identify_cache_key(folder_path + "/" + file)
+                    except OSError as error:  # The file disappeared since the folder was listed
+                        print("There was a problem reading the following file:  " + str(error))
+                json_data = identify_cache_lookup(cache, cache_keys)
+                perf_stats.add("probe (cache)", time.perf_counter() - start, len(cache_keys))
+                for file in cache_keys:
+                    if file in json_data:
+                        pending.append((file, cache_keys[file], json_data[file]))
+                    else:
+                        pending.append((file, cache_keys[file], process_engine.submit(probe_mkv_file(folder_path + "/" + file))))
+                continue
+            if len(pending) == 0:
+                break
+            file, cache_key, json_data = pending.popleft()
+            if isinstance(json_data, concurrent.futures.Future):
+                try:
+                    json_data, version = json_data.result()
+                except (OSError, ValueError) as error:  # mkvmerge failed or didn't return valid json
+                    print("There was a problem identifying the following file:  " + str(file) + "  (" + str(error) + ")")
+                    continue
+                probed[file] = (cache_key, json_data, version)
+                if len(probed) >= 500:  # Store the results along the way, so they aren't lost if the scan is cancelled
+                    identify_cache_store(cache, probed)
+                    probed = {}
+            yield file, json_data
+    finally:
+        for file, cache_key, json_data in pending:  # The probes that are no longer needed (cancelled scan)
+            if isinstance(json_data, concurrent.futures.Future):
+                process_engine.cancel(json_data)
+        if len(probed) > 0:
+            identify_cache_store(cache, probed)
+        if cache is not None:
+            cache.close()
+
+
+class PerfStats():  # Lightweight instrumentation of the stages (scan, probe, parse, render, grid load, extract):  counters, wall and total seconds, and the percentiles of the per file latencies and per job throughputs
+    stages = ("scan", "probe (cache)", "probe (native)", "probe (mkvmerge)", "probe (json)", "parse", "render", "grid load", "extract")  # In pipeline order
+    load_stages = stages[:-1]  # The stages that start over with every scan
+
+    def __init__(self):
+        self.lock = threading.Lock()  # add() is called from the scan, probe and scheduler threads
+        self.counts = collections.Counter()  # stage: number of files (or jobs)
+        self.seconds = collections.Counter()  # stage: total seconds (the sum of the per file times, which overlap for the concurrent probes and jobs)
+        self.wall = collections.Counter()  # stage: the seconds in which the stage was busy (the union of the per file times), up to busy
+        self.busy = {}  # stage: [start, end] (time.perf_counter) of the busy period that is still growing
+        self.busy_until = {}  # stage: the end of the busy periods that are in wall
+        self.sizes = collections.Counter()  # stage: total bytes
+        self.latencies = {}  # stage: the seconds of the single files (the last perf_max_samples)
+        self.rates = {}  # stage: the bytes per second of the single jobs (the last perf_max_samples)
+        self.slow_files = {}  # path:  why it is flagged as slow
+
+    def add(self, stage, seconds, count=1, path=None, size=None):  # Records a stage that took seconds for count files.  A single file (count=1) is a latency sample, and a slow one (with its path) is flagged.  With size, the throughput is recorded.
+        with self.lock:
+            self.counts[stage] = self.counts[stage] + count
+            self.seconds[stage] = self.seconds[stage] + seconds
+            now = time.perf_counter()
+            self.add_busy(stage, now - seconds, now)
+            if count == 1:
+                self.latencies.setdefault(stage, collections.deque(maxlen=perf_max_samples)).append(seconds)
+            if path is not None and seconds >= perf_slow_file_seconds:
+                self.slow_files[path] = "slow:  " + stage + " took " + "{:.1f}".format(seconds) + " s"
+            if size is not None:
+                self.sizes[stage] = self.sizes[stage] + size
+                if seconds > 0:
+                    self.rates.setdefault(stage, collections.deque(maxlen=perf_max_samples)).append(size / seconds)
+
+    def add_busy(self, stage, start, end):  # Adds the period from start to end (which ended just now) to the wall time of a stage (the lock must be held)
+        # The periods come in by their end, so a period that starts before the end of the growing busy period overlaps it.  Anything before busy_until is already counted.
+        block = self.busy.get(stage)
+        if block is not None and start <= block[1]:
+            block[0] = max(min(block[0], start), self.busy_until.get(stage, 0))
+            block[1] = max(block[1], end)
+            return
+        if block is not None:
+            self.wall[stage] = self.wall[stage] + block[1] - block[0]
+            self.busy_until[stage] = block[1]
+        self.busy[stage] = [start, end]
+
+    def get_wall_seconds(self, stage):  # (The lock must be held)
+        block = self.busy.get(stage)
+        return self.wall[stage] + (0 if block is None else block[1] - block[0])
+
+    def clear(self, stages=None):  # Starts the stages (default:  all) over
+        with self.lock:
+            for stage in (self.stages if stages is None else stages):
+                for counter in (self.counts, self.seconds, self.wall, self.busy, self.busy_until, self.sizes, self.latencies, self.rates):
+                    counter.pop(stage, None)
+            if stages is None or "probe (mkvmerge)" in stages:
+                self.slow_files.clear()
+
+    def get_report(self):  # The counters and percentiles as a dict (the --profile json):  {"stages": {stage: {...}}, "slow_files": {path: why}}
+        with self.lock:
+            report = {}
+            for stage in self.stages:
+                if self.counts[stage] == 0 and self.seconds[stage] == 0:
+                    continue
+                report[stage] = {"files": self.counts[stage], "wall_seconds": round(self.get_wall_seconds(stage), 4), "total_seconds": round(self.seconds[stage], 4)}
+                latencies = sorted(self.latencies.get(stage, ()))
+                if len(latencies) > 0:
+                    report[stage]["p50_ms"] = round(get_percentile(latencies, 50) * 1000, 3)
+                    report[stage]["p95_ms"] = round(get_percentile(latencies, 95) * 1000, 3)
+                if self.sizes[stage] > 0:
+                    report[stage]["bytes"] = self.sizes[stage]
+                rates = sorted(self.rates.get(stage, ()))
+                if len(rates) > 0:
+                    report[stage]["p50_bytes_per_second"] = round(get_percentile(rates, 50))
+                    report[stage]["p95_bytes_per_second"] = round(get_percentile(rates, 95))
+            return {"stages": report, "slow_files": dict(self.slow_files)}
+
+    def get_summary(self):  # The report as a text table (for the performance panel)
+        report = self.get_report()
+        lines = ["{:<18}{:>10}{:>10}{:>12}{:>12}{:>12}".format("Stage", "Files", "Wall s", "Sum s", "p50", "p95")]
+        for stage in report["stages"]:
+            values = report["stages"][stage]
+            if "p50_bytes_per_second" in values:  # The throughput of the jobs is more telling than their duration
+                p50 = "{:.1f} MB/s".format(values["p50_bytes_per_second"] / 1000000)
+                p95 = "{:.1f} MB/s".format(values["p95_bytes_per_second"] / 1000000)
+            elif "p50_ms" in values:
+                p50 = "{:.1f} ms".format(values["p50_ms"])
+                p95 = "{:.1f} ms".format(values["p95_ms"])
+            else:
+                p50 = p95 = ""
+            lines.append("{:<18}{:>10,}{:>10.3f}{:>12.3f}{:>12}{:>12}".format(stage, values["files"], values["wall_seconds"], values["total_seconds"], p50, p95))
+        if len(report["stages"]) == 0:
+            lines.append("Nothing measured yet")
+        lines.append("(Wall s:  how long the stage was busy.  Sum s:  the time of its files added up, which is more for the concurrent probes and jobs.)")
+        lines.append(str(len(report["slow_files"])) + " slow files (identifying took at least " + "{:.1f}".format(perf_slow_file_seconds) + " s, see the Status column)")
+        return "\n".join(lines)
+
+
+perf_stats = PerfStats()  # The instrumentation of this session
+
+
+def get_percentile(values, percent):  # The nearest rank percentile of sorted values
+    return values[max(0, min(len(values), -(-percent * len(values) // 100)) - 1)]
+
+
+def write_perf_profile(path):  # Writes the PerfStats report (json) to path ("-" = stderr)
+    text = json.dumps(perf_stats.get_report(), indent=2)
+    if path == "-":
+        print(text, file=sys.stderr)
+        return
+    try:
+        with open(path, "w") as profile_file:
+            profile_file.write(text + "\n")
+    except OSError as error:
+        print("There was a problem writing the profile:  " + str(error), file=sys.stderr)
+
+
+class Track():  # A single video, audio or subtitle track of an MkvFile
+    # __slots__ keep the records small (there is one per track of every scanned file).  The type, codec and language strings are interned, as they repeat across the whole library.
+    __slots__ = ("id", "type", "codec", "language", "name", "default", "bytes", "display_dimensions", "encoding")
+
+    def __init__(self, id, type, codec, language, name, default, bytes, display_dimensions="", encoding=""):
+        self.id = id  # The mkvmerge/mkvextract track ID
+        self.type = sys.intern(type)  # video, audio, subtitles
+        self.codec = sys.intern(codec)  # The mkvmerge codec name, e.g. "AC-3"
+        self.language = sys.intern(language)  # The IETF language (or the ISO 639-2 language if there is none)
+        self.name = name
+        self.default = default  # The default track flag
+        self.bytes = bytes  # The NUMBER_OF_BYTES statistics tag (used by incremental_extract), or None
+        self.display_dimensions = display_dimensions  # Video tracks only
+        self.encoding = encoding  # Subtitle tracks only
+
+
+class Attachment():  # A single attachment of an MkvFile
+    __slots__ = ("id", "file_name", "content_type", "size")
+
+    def __init__(self, id, file_name, content_type, size):
+        self.id = id  # The mkvextract attachment ID
+        self.file_name = file_name
+        self.content_type = sys.intern(content_type)
+        self.size = size
+
+
+class MkvFile():  # The files_Full record of a single mkv file:  its parsed tracks, chapters and attachments, the data grid markup, and the extraction status
+    # Only what the data grid and the export_* functions use is kept, the mkvmerge json data is dropped once it is parsed (it stays in the identify cache).
+    __slots__ = ("name", "title", "segment_uid", "duration", "video", "audio", "subtitles", "chapters", "attachments", "status", "duplicate",
+                 "video_markup", "audio_markup", "subtitles_markup", "attachments_markup")
+
+    def __init__(self, name):
+        self.name = name  # The path relative to default_folder_path
+        self.title = ""
+        self.segment_uid = ""  # (Hex)
+        self.duration = None  # In nanoseconds
+        self.video = ()  # Tracks
+        self.audio = ()
+        self.subtitles = ()
+        self.chapters = False
+        self.attachments = ()  # Attachments
+        self.status = ""  # The status of the extraction job
+        self.duplicate = None  # (group number, copy number, copies, name of the first copy) if there are other copies of the file (see set_duplicate_groups)
+        self.video_markup = ""  # The data grid markup (see render_file)
+        self.audio_markup = ""
+        self.subtitles_markup = ""
+        self.attachments_markup = ""
+
+
+def new_files_Full_entry(file, json_data, folder_path):  # Creates the (parsed, but not yet rendered) files_Full record of a mkv file (relative to folder_path) from its mkvmerge json data.  A file that was slow to identify is flagged in its status.
+    start = time.perf_counter()
+    entry = MkvFile(file)
+    parse_file_json(entry, json_data)
+    perf_stats.add("parse", time.perf_counter() - start)
+    entry.status = perf_stats.slow_files.get(folder_path + "/" + file, "")  # (The path that iter_probe_files probed)
+    return entry
+
+
+def iter_files_Full_entries(folder_path, file_list, cancel=None):  # Yields the files_Full records of the files in file_list (see iter_probe_files).  Files whose json data can't be parsed are reported and left out, instead of ending the whole scan.
+    for file, json_data in iter_probe_files(folder_path, file_list, cancel):
+        try:
+            entry = new_files_Full_entry(file, json_data, folder_path)
+        except (KeyError, IndexError, TypeError, ValueError, AttributeError) as error:
+            print("There was a problem reading the information of the following file:  " + str(file) + "  (" + type(error).__name__ + ":  " + str(error) + ")")
+            continue
+        yield entry
+
+
+def populate_files_Full(file_list=None):
     # This populates the files_Full list with all file/folder information, which is the basis of the data grid
+    # file_list (names relative to default_folder_path) defaults to all of the mkv files in default_folder_path
     global files_Full
-    # files_Full[0] = Current_Name
-    # files_Full[1] = Title
-    # files_Full[2] = Audio
-    # files_Full[3] = Subtitles
-    # files_Full[4] = Defaults
-    # files_Full[5] = Video
-    # files_Full[6] = ""
-    # files_Full[7] = (json data) {}
-    # files_Full[8] = (video tracks) {}
-    # files_Full[9] = (audio tracks) {}
-    # files_Full[10] = (subtitle tracks) {}
-    # files_Full[11] = Default tracks
-    # files_Full[12] = Chapters
-    # files_Full[13] = Attachments
     files_Full.clear()
-    files_temp = []
-    files_temp = get_list_of_mkv_files()
-    files_temp.sort()
-    for file in files_temp:
-        part0 = file
-        part1 = ""
-        part2 = ""
-        part3 = ""
-        part4 = ""
-        part5 = ""
-        part6 = ""
-        # Get information from mkv file in json format:
-        cmd = ["mkvmerge --identify --identification-format json \"" + default_folder_path + "/" + file + "\""]
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        json_data, err = proc.communicate()
-        json_data = json_data.decode("utf-8")
-        part7 = json.loads(json_data)  # json information of all objects in the mkv file
-        part8 = {}
-        part9 = {}
-        part10 = {}
-        part11 = []
-        part12 = ""
-        part13 = ""
-        files_Full.append([part0, part1, part2, part3, part4, part5, part6, part7, part8, part9, part10, part11, part12, part13])
-    # Get the track information
+    if file_list is None:
+        file_list = get_list_of_mkv_files()
+    for entry in iter_files_Full_entries(default_folder_path, file_list):
+        files_Full.append(entry)  # The json data is parsed (and dropped) file by file
+    # Build the facet index (the data grid markup is left to render_files_Full(), the --cli mode doesn't need it)
     parse_json_data()
 
 
-def parse_json_data():
+def scan_files_Full(folder_path, cancel, file_loaded, scan_finished):  # The background scan of folder_path that is run by Main.start_scan()
+    # file_loaded(entry, index) is called with every parsed files_Full record and scan_finished(cancelled) when done (after the last file_loaded).
+    # Neither of them touch files_Full here, that is left to the callbacks (Main.start_scan queues the records, and its main loop timer takes them over in batches).
+    # The folder listing is streamed into the probing, so the total number of files isn't known until the end.
+    index = 0
+    try:
+        for entry in iter_files_Full_entries(folder_path, iter_mkv_files(folder_path), cancel):
+            index = index + 1
+            file_loaded(entry, index)
+    finally:
+        scan_finished(cancel.is_set())
+
+
+class InotifyWatcher():  # Watches a folder (and with recursive_scan its sub folders) for new, changed and removed mkv files, with the Linux inotify API (through ctypes)
+    # changed(written, removed) is called from the watcher thread with the sets of paths (relative to folder_path) once no new events arrived for watch_debounce seconds.
+    # written are the mkv files that were written (IN_CLOSE_WRITE) or moved in (IN_MOVED_TO), removed are the mkv files and folders that were deleted or moved out.
+    # If the kernel dropped events (IN_Q_OVERFLOW), changed(None, None) is called and the whole folder has to be scanned again.
+    # OSError is raised if inotify isn't available.
+    def __init__(self, folder_path, changed):
+        self.folder_path = folder_path
+        self.changed = changed
+        self.folders = {}  # Watch descriptor:  (folder path relative to folder_path, depth)
+        self.pending = {}  # Relative path:  "written" or "removed" (the last event wins)
+        self.stopped = threading.Event()
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.inotify_add_watch = libc.inotify_add_watch
+        self.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        try:
+            self.add_folder("", 0)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def add_folder(self, relative_path, depth):  # Watches a folder, and with recursive_scan its sub folders (up to scan_max_depth levels, skipping scan_exclude)
+        path = self.folder_path + "/" + relative_path if relative_path != "" else self.folder_path
+        mask = inotify_close_write | inotify_moved_to | inotify_moved_from | inotify_delete | inotify_create | inotify_delete_self | inotify_move_self | inotify_only_dir
+        wd = self.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        self.folders[wd] = (relative_path, depth)
+        if recursive_scan and (scan_max_depth is None or depth < scan_max_depth):
+            with os.scandir(path) as folder:
+                for entry in folder:
+                    relative = relative_path + "/" + entry.name if relative_path != "" else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False) and not matches_scan_patterns(relative, entry.name, scan_exclude):
+                            self.add_folder(relative, depth + 1)
+                    except OSError:  # The folder disappeared in the meantime
+                        continue
+
+    def start(self):  # Watches in a background thread, until stop() is called
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        last_event = None
+        first_event = None
+        try:
+            while not self.stopped.is_set():
+                timeout = 0.5
+                if last_event is not None:
+                    timeout = min(timeout, max(0, last_event + watch_debounce - time.monotonic()))
+                readable, writable, exceptional = select.select([self.fd], [], [], timeout)
+                if len(readable) > 0:
+                    try:
+                        data = os.read(self.fd, 65536)
+                    except BlockingIOError:
+                        data = b""
+                    if self.read_events(data):
+                        self.pending.clear()
+                        last_event = None
+                        first_event = None
+                        self.changed(None, None)
+                        continue
+                    if len(self.pending) > 0:
+                        last_event = time.monotonic()
+                        if first_event is None:
+                            first_event = last_event
+                # Wait for watch_debounce seconds without new events (but not longer than 10 times that, for folders that keep changing)
+                now = time.monotonic()
+                if last_event is not None and (now - last_event >= watch_debounce or now - first_event >= watch_debounce * 10):
+                    written = set(path for path in self.pending if self.pending[path] == "written")
+                    removed = set(path for path in self.pending if self.pending[path] == "removed")
+                    self.pending.clear()
+                    last_event = None
+                    first_event = None
+                    self.changed(written, removed)
+        finally:
+            os.close(self.fd)
+
+    def read_events(self, data):  # Adds the events in data (struct inotify_event) to pending.  Returns True if events were lost.
+        pos = 0
+        while pos + 16 <= len(data):
+            wd, mask, cookie, length = struct.unpack_from("iIII", data, pos)
+            name = os.fsdecode(data[pos + 16:pos + 16 + length].rstrip(b"\x00"))
+            pos = pos + 16 + length
+            if mask & inotify_q_overflow:
+                return True
+            if wd not in self.folders:
+                continue
+            relative_path, depth = self.folders[wd]
+            if mask & (inotify_ignored | inotify_delete_self | inotify_move_self):  # The folder itself is gone (its parent reports it as removed)
+                del self.folders[wd]
+                continue
+            relative = relative_path + "/" + name if relative_path != "" else name
+            if mask & inotify_is_dir:
+                if matches_scan_patterns(relative, name, scan_exclude):
+                    continue
+                if mask & (inotify_create | inotify_moved_to):
+                    if recursive_scan and (scan_max_depth is None or depth < scan_max_depth):
+                        try:
+                            self.add_folder(relative, depth + 1)
+                        except OSError:
+                            continue
+                        for file in iter_mkv_files(self.folder_path, relative, depth + 1):  # A folder that was moved in (or filled before its watch was added)
+                            self.pending[file] = "written"
+                elif mask & (inotify_delete | inotify_moved_from):
+                    for path in list(self.pending):
+                        if path.startswith(relative + "/"):
+                            del self.pending[path]
+                    self.pending[relative] = "removed"
+                continue
+            if str(name[-4:]).lower() != ".mkv" or matches_scan_patterns(relative, name, scan_exclude):
+                continue
+            if mask & (inotify_close_write | inotify_moved_to):
+                if len(scan_include) == 0 or matches_scan_patterns(relative, name, scan_include):
+                    self.pending[relative] = "written"
+            elif mask & (inotify_delete | inotify_moved_from):
+                self.pending[relative] = "removed"
+        return False
+
+
+def is_removed_path(file, removed):  # Checks if a files_Full name is one of the removed paths of InotifyWatcher, or is in one of its removed folders
+    if file in removed:
+        return True
+    return any(file.startswith(path + "/") for path in removed)
+
+
+def load_watched_files(folder_path, file_list, files_loaded):  # Probes the files that InotifyWatcher reported as written (in a background thread) and calls files_loaded(entries) with their files_Full records
+    entries = []
+    for entry in iter_files_Full_entries(folder_path, sorted(file_list)):
+        entries.append(entry)
+    files_loaded(entries)
+
+
+def parse_json_data():  # Rebuilds the facet index from the files_Full records (in one pass)
     global files_Full
-    global languages_video
-    global types_video
-    global ids_video
-    global languages_audio
-    global types_audio
-    global ids_audio
-    global languages_subtitle
-    global types_subtitle
-    global ids_subtitle
-    global multi_lines
-    # Clear the lists
-    languages_video.clear()
-    languages_audio.clear()
-    languages_subtitle.clear()
-    types_video.clear()
-    types_audio.clear()
-    types_subtitle.clear()
-    ids_video.clear()
-    ids_audio.clear()
-    ids_subtitle.clear()
-    # Parse the json data to get the individual tracks for the various types
+    clear_track_facets()
     for i in range(len(files_Full)):
-        if "title" in files_Full[i][7]["container"]["properties"]:
-            files_Full[i][1] = files_Full[i][7]["container"]["properties"]["title"]
-        if not (files_Full[i][7].get("tracks") is None):
-            command = ""
-            for track in files_Full[i][7]["tracks"]:
-                # track_type = track["properties"]["codec_id"]
-                track_type = track["codec"]
-                track_id = track["id"]
-                if track["properties"].get("default_track") == True:
-                    files_Full[i][11].append(str(track_id))
-                    if len(files_Full[i][4]) == 0:
-                        files_Full[i][4] = "<b>" + str(track_id) + "</b>-" + str(track["type"])
-                    else:
-                        files_Full[i][4] = files_Full[i][4] + "\n<b>" + str(track_id) + "</b>-" + str(track["type"])
-                if track["type"] == "video":  # Populate the track IDs for the video tracks
-                    if str(track_id) not in ids_audio:
-                        ids_video.append(str(track_id))
-                if track["type"] == "audio":  # Populate the track IDs for the audio tracks
-                    if str(track_id) not in ids_audio:
-                        ids_audio.append(str(track_id))
-                if track["type"] == "subtitles":  # Populate the track IDs for the subtitle tracks
-                    if str(track_id) not in ids_subtitle:
-                        ids_subtitle.append(str(track_id))
-                if "language_ietf" in track["properties"]:  # "language_ietf" isn't always a property...
-                    track_lang = track["properties"]["language_ietf"]
-                elif "language" in track["properties"]:
-                    track_lang = track["properties"]["language"]
-                else:
-                    track_lang = ""
-                if not (track["properties"].get("track_name") is None):
-                    track_name = track["properties"]["track_name"]
-                else:
-                    track_name = ""
-                if track["type"] == "video":
-                    if "display_dimensions" in track["properties"]:
-                        track_disdim = track["properties"]["display_dimensions"]
-                    else:
-                        track_disdim = ""
-                    if track_lang not in languages_video:
-                        languages_video.append(track_lang)
-                    if track_type not in types_video:
-                        types_video.append(track_type)
-                    files_Full[i][8][track_id] = {"track_type": track_type, "track_lang": track_lang, "track_name": track_name, "track_disdim": track_disdim}
-                elif track["type"] == "audio":
-                    if track_lang not in languages_audio:
-                        languages_audio.append(track_lang)
-                    if track_type not in types_audio:
-                        types_audio.append(track_type)
-                    files_Full[i][9][track_id] = {"track_type": track_type, "track_lang": track_lang, "track_name": track_name}
-                elif track["type"] == "subtitles":
-                    if "encoding" in track["properties"]:
-                        track_encode = track["properties"]["encoding"]
-                    else:
-                        track_encode = ""
-                    if track_lang not in languages_subtitle:
-                        languages_subtitle.append(track_lang)
-                    if track_type not in types_subtitle:
-                        types_subtitle.append(track_type)
-                    files_Full[i][10][track_id] = {"track_type": track_type, "track_lang": track_lang, "track_name": track_name, "track_encode": track_encode}
-                else:
-                    print("Unknown track type = " + str(file))
-    # Sort the lists
-    languages_video.sort()
-    languages_audio.sort()
-    languages_subtitle.sort()
-    types_video.sort()
-    types_audio.sort()
-    types_subtitle.sort()
-    ids_video.sort()
-    ids_audio.sort()
-    ids_subtitle.sort()
-    # Parse the individual tracks to get the easy list of audio and subtitles
-    # files_Full[0] = Current_Name
-    # files_Full[1] = Title
-    # files_Full[2] = Audio
-    # files_Full[3] = Subtitles
-    # files_Full[4] = Defaults
+        update_track_facets(files_Full[i])
+
+
+def parse_file_json(file, json_data):  # Parses the mkvmerge json data of a single mkv file into its MkvFile record.  This doesn't use any globals, so it can run in the scan thread.
+    if "title" in json_data["container"]["properties"]:
+        file.title = json_data["container"]["properties"]["title"]
+    file.segment_uid = json_data["container"]["properties"].get("segment_uid", "")
+    file.duration = json_data["container"]["properties"].get("duration")
+    video = []
+    audio = []
+    subtitles = []
+    if not (json_data.get("tracks") is None):
+        for track in json_data["tracks"]:
+            # track_type = track["properties"]["codec_id"]
+            track_type = track["codec"]
+            track_id = track["id"]
+            track_default = track["properties"].get("default_track") == True
+            if "language_ietf" in track["properties"]:  # "language_ietf" isn't always a property...
+                track_lang = track["properties"]["language_ietf"]
+            elif "language" in track["properties"]:
+                track_lang = track["properties"]["language"]
+            else:
+                track_lang = ""
+            if not (track["properties"].get("track_name") is None):
+                track_name = track["properties"]["track_name"]
+            else:
+                track_name = ""
+            if track["properties"].get("tag_number_of_bytes") is not None:  # The NUMBER_OF_BYTES statistics tag (used by incremental_extract)
+                track_bytes = int(track["properties"]["tag_number_of_bytes"])
+            else:
+                track_bytes = None
+            if track["type"] == "video":
+                track_disdim = track["properties"].get("display_dimensions", "")
+                video.append(Track(track_id, "video", track_type, track_lang, track_name, track_default, track_bytes, display_dimensions=track_disdim))
+            elif track["type"] == "audio":
+                audio.append(Track(track_id, "audio", track_type, track_lang, track_name, track_default, track_bytes))
+            elif track["type"] == "subtitles":
+                track_encode = track["properties"].get("encoding", "")
+                subtitles.append(Track(track_id, "subtitles", track_type, track_lang, track_name, track_default, track_bytes, encoding=track_encode))
+            else:
+                print("Unknown track type = " + str(file.name))
+    file.video = tuple(video)
+    file.audio = tuple(audio)
+    file.subtitles = tuple(subtitles)
+    # Chapters
+    file.chapters = len(json_data["chapters"]) > 0
+    # Attachments
+    file.attachments = tuple(Attachment(item["id"], item["file_name"], item.get("content_type", ""), item.get("size")) for item in json_data.get("attachments", []))
+
+
+def clear_track_facets():  # Clears the facet index
+    for kind in track_facets:
+        for facet in track_facets[kind]:
+            track_facets[kind][facet].clear()
+
+
+def update_track_facets(file, count=1):  # Adds (count=1) or removes (count=-1) the tracks of a single files_Full record to/from the facet index
+    for kind, tracks in (("video", file.video), ("audio", file.audio), ("subtitles", file.subtitles)):
+        if len(tracks) == 0:
+            continue
+        facets = track_facets[kind]
+        facets["languages"].update({language: count * number for language, number in collections.Counter(track.language for track in tracks).items()})  # Tracks
+        facets["types"].update({codec: count for codec in set(track.codec for track in tracks)})  # Files
+        facets["ids"].update({str(track.id): count for track in tracks})  # Files (a track ID is unique within a file)
+        if count < 0:
+            for facet in facets.values():
+                facet += collections.Counter()  # Drops the values that are down to 0
+
+
+def get_track_facet(kind, facet):  # Returns the [(value, count)] of a facet, sorted by value (track IDs numerically)
+    if facet == "ids":
+        return sorted(track_facets[kind][facet].items(), key=lambda item: int(item[0]))
+    return sorted(track_facets[kind][facet].items())
+
+
+def get_duplicate_signature(file):  # The cheap fingerprint of a files_Full record, from its mkvmerge json data:  (segment UID, duration, (type, codec, bytes) of the tracks, attachment sizes)
+    tracks = tuple((track.type, track.codec, track.bytes) for track in file.video + file.audio + file.subtitles)
+    return (file.segment_uid, file.duration, tracks, tuple(item.size for item in file.attachments))
+
+
+def get_content_hash(path):  # Returns (size, hash of the first and last duplicate_hash_bytes) of a file, read through mmap.  Memoized in content_hashes by the identify cache key, so unchanged files aren't read again.
+    key = get_identify_cache_key(path)
+    with content_hashes_lock:
+        content_hash = content_hashes.get(key)
+    if content_hash is not None:
+        return content_hash
+    digest = hashlib.blake2b(digest_size=16)
+    if key[1] > 0:  # (An empty file can't be mapped)
+        with open(path, "rb") as mkv_file:
+            with mmap.mmap(mkv_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest.update(data[:duplicate_hash_bytes])
+                digest.update(data[max(duplicate_hash_bytes, len(data) - duplicate_hash_bytes):])
+    content_hash = (key[1], digest.hexdigest())
+    with content_hashes_lock:
+        if len(content_hashes) >= identify_cache_max_entries:
+            content_hashes.clear()
+        content_hashes[key] = content_hash
+    return content_hash
+
+
+def find_duplicate_groups(files, folder_path):  # Finds the files_Full records with the same content (e.g. the same episode under different names or folders).  Returns the groups (lists of at least 2 records in files order), in the order of their first copy.
+    # Only the records with the same signature (see get_duplicate_signature) are candidates, and only those are read to confirm it by their size and get_content_hash().
+    candidates = collections.defaultdict(list)
+    for file in files:
+        candidates[get_duplicate_signature(file)].append(file)
+    groups = {}
+    for signature in candidates:
+        if len(candidates[signature]) < 2:
+            continue
+        for file in candidates[signature]:
+            try:
+                groups.setdefault((signature, get_content_hash(folder_path + "/" + file.name)), []).append(file)
+            except (OSError, ValueError) as error:  # The file disappeared (or can't be read) since it was scanned
+                print("There was a problem reading the following file:  " + str(error))
+    positions = {id(file): i for i, file in enumerate(files)}
+    return sorted([group for group in groups.values() if len(group) > 1], key=lambda group: positions[id(group[0])])
+
+
+def set_duplicate_groups(files, groups):  # Sets the duplicate (group number, copy number, copies, name of the first copy) of the files_Full records in files, None for the records that aren't in any of the groups
+    for file in files:
+        file.duplicate = None
+    for number, group in enumerate(groups, 1):
+        for copy, file in enumerate(group, 1):
+            file.duplicate = (number, copy, len(group), group[0].name)
+
+
+def get_grouped_order(files):  # The files_Full records in files, with the copies of every duplicate group right after its first copy
+    copies = collections.defaultdict(list)
+    for file in files:
+        if file.duplicate is not None and file.duplicate[1] > 1:
+            copies[file.duplicate[0]].append(file)
+    order = []
+    for file in files:
+        if file.duplicate is None:
+            order.append(file)
+        elif file.duplicate[1] == 1:
+            order.append(file)
+            order.extend(copies[file.duplicate[0]])
+    return order
+
+
+def get_duplicates_summary(groups):  # The summary of the duplicate groups, e.g. "3 duplicate groups (4 extra copies, 12.3 GB)"
+    extra = [file for group in groups for file in group[1:]]
+    size = 0
+    for file in extra:
+        try:
+            size = size + os.path.getsize(default_folder_path + "/" + file.name)
+        except OSError:
+            continue
+    return str(len(groups)) + " duplicate groups (" + str(len(extra)) + " extra copies, " + "{:.1f}".format(size / 1000000000) + " GB)"
+
+
+def render_files_Full():  # Builds the data grid markup from the parsed track information.  This is the only part that depends on multi_lines (and the track filters), so it doesn't need mkvmerge.
+    global files_Full
+    start = time.perf_counter()
+    multi_lines_string = get_multi_lines_string()
+    for i in range(len(files_Full)):
+        render_file(files_Full[i], multi_lines_string)
+    perf_stats.add("render", time.perf_counter() - start, len(files_Full))
+
+
+def get_multi_lines_string():  # The separator between the tracks in the data grid cells
+    global multi_lines
     if multi_lines == True:
         multi_lines_string = "\n"
     else:
         multi_lines_string = ",  "
-    for i in range(len(files_Full)):
-        ##########################################################################################################################################
-        video = ""
-        for track in files_Full[i][8]:
-            name = str(files_Full[i][8][track]["track_name"])
-            if name == "":
-                if len(video) > 0:
-                    if str(track) in files_Full[i][11]:
-                        video = video + str(multi_lines_string) + "<b>" + str(track) + "-" + str(files_Full[i][8][track]["track_lang"]) + " (" + str(files_Full[i][8][track]["track_type"]) + ")</b>"
-                    else:
-                        video = video + str(multi_lines_string) + str(track) + "-" + str(files_Full[i][8][track]["track_lang"]) + " (" + str(files_Full[i][8][track]["track_type"]) + ")"
-                else:
-                    if str(track) in files_Full[i][11]:
-                        video = video + "<b>" + str(track) + "-" + str(files_Full[i][8][track]["track_lang"]) + " (" + str(files_Full[i][8][track]["track_type"]) + ")</b>"
-                    else:
-                        video = video + str(track) + "-" + str(files_Full[i][8][track]["track_lang"]) + " (" + str(files_Full[i][8][track]["track_type"]) + ")"
-            else:
-                if len(video) > 0:
-                    if str(track) in files_Full[i][11]:
-                        video = video + str(multi_lines_string) + "<b>" + str(track) + "-" + str(files_Full[i][8][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][8][track]["track_type"]) + ")</b>"
-                    else:
-                        video = video + str(multi_lines_string) + str(track) + "-" + str(files_Full[i][8][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][8][track]["track_type"]) + ")"
-                else:
-                    if str(track) in files_Full[i][11]:
-                        video = video + "<b>" + str(track) + "-" + str(files_Full[i][8][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][8][track]["track_type"]) + ")</b>"
-                    else:
-                        video = video + str(track) + "-" + str(files_Full[i][8][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][8][track]["track_type"]) + ")"
-        files_Full[i][5] = video
-        ##########################################################################################################################################
-        audio = ""
-        for track in files_Full[i][9]:
-            name = str(files_Full[i][9][track]["track_name"])
-            name = name.replace("&", "&amp;")
-            if name == "":
-                if len(audio) > 0:
-                    if str(track) in files_Full[i][11]:
-                        audio = audio + str(multi_lines_string) + "<b>" + str(track) + "-" + str(files_Full[i][9][track]["track_lang"]) + " (" + str(files_Full[i][9][track]["track_type"]) + ")</b>"
-                    else:
-                        audio = audio + str(multi_lines_string) + str(track) + "-" + str(files_Full[i][9][track]["track_lang"]) + " (" + str(files_Full[i][9][track]["track_type"]) + ")"
-                else:
-                    if str(track) in files_Full[i][11]:
-                        audio = audio + "<b>" + str(track) + "-" + str(files_Full[i][9][track]["track_lang"]) + " (" + str(files_Full[i][9][track]["track_type"]) + ")</b>"
-                    else:
-                        audio = audio + str(track) + "-" + str(files_Full[i][9][track]["track_lang"]) + " (" + str(files_Full[i][9][track]["track_type"]) + ")"
-            else:
-                if len(audio) > 0:
-                    if str(track) in files_Full[i][11]:
-                        audio = audio + str(multi_lines_string) + "<b>" + str(track) + "-" + str(files_Full[i][9][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][9][track]["track_type"]) + ")</b>"
-                    else:
-                        audio = audio + str(multi_lines_string) + str(track) + "-" + str(files_Full[i][9][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][9][track]["track_type"]) + ")"
-                else:
-                    if str(track) in files_Full[i][11]:
-                        audio = audio + "<b>" + str(track) + "-" + str(files_Full[i][9][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][9][track]["track_type"]) + ")</b>"
-                    else:
-                        audio = audio + str(track) + "-" + str(files_Full[i][9][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][9][track]["track_type"]) + ")"
-        files_Full[i][2] = audio
-        subtitles = ""
-        for track in files_Full[i][10]:
-            name = str(files_Full[i][10][track]["track_name"])
-            name = name.replace("&", "&amp;")
-            if name == "":
-                if len(subtitles) > 0:
-                    if str(track) in files_Full[i][11]:
-                        subtitles = subtitles + str(multi_lines_string) + "<b>" + str(track) + "-" + str(files_Full[i][10][track]["track_lang"]) + " (" + str(files_Full[i][10][track]["track_type"]) + ")</b>"
-                    else:
-                        subtitles = subtitles + str(multi_lines_string) + str(track) + "-" + str(files_Full[i][10][track]["track_lang"]) + " (" + str(files_Full[i][10][track]["track_type"]) + ")"
-                else:
-                    if str(track) in files_Full[i][11]:
-                        subtitles = subtitles + "<b>" + str(track) + "-" + str(files_Full[i][10][track]["track_lang"]) + " (" + str(files_Full[i][10][track]["track_type"]) + ")</b>"
-                    else:
-                        subtitles = subtitles + str(track) + "-" + str(files_Full[i][10][track]["track_lang"]) + " (" + str(files_Full[i][10][track]["track_type"]) + ")"
+    return multi_lines_string
+
+
+def render_file(file, multi_lines_string):  # Builds the data grid markup of a single files_Full record
+    file.video_markup = render_tracks(file.video, multi_lines_string, None)
+    file.audio_markup = render_tracks(file.audio, multi_lines_string, track_filters["audio"])  # The tracks that the track filters leave out are greyed out and struck through
+    file.subtitles_markup = render_tracks(file.subtitles, multi_lines_string, track_filters["subtitles"])
+    file.attachments_markup = multi_lines_string.join(escape_markup(str(item.file_name) + " (" + str(item.content_type) + ")") for item in file.attachments)
+
+
+def render_tracks(tracks, multi_lines_string, track_filter):  # Builds the data grid markup of a track column, e.g. "<b>1-jpn ('Main' AAC)</b>,  2-eng (AC-3)"
+    # The markup is memoized per (shown track information, separator, track filter), so the many files with the same tracks (e.g. the episodes of a season) share it,
+    # and re-rendering the whole data grid (e.g. for button_Multi) is mostly dictionary lookups.
+    key = (tuple((track.id, track.language, track.name, track.codec, track.default) for track in tracks), multi_lines_string, get_track_filter_key(track_filter))
+    markup = markup_cache.get(key)
+    if markup is None:
+        if len(markup_cache) >= markup_cache_max_entries:
+            markup_cache.clear()
+        markup = multi_lines_string.join(render_track(track, track_filter) for track in tracks)
+        markup_cache[key] = markup
+    return markup
+
+
+def render_track(track, track_filter):  # Builds the markup of a single track:  bold for a default track, greyed out and struck through if the track filter leaves it out
+    if track.name == "":
+        text = escape_markup(str(track.id) + "-" + str(track.language) + " (" + str(track.codec) + ")")
+    else:
+        text = escape_markup(str(track.id) + "-" + str(track.language) + " ('" + str(track.name) + "' " + str(track.codec) + ")")
+    if not track_matches_filter(track, track_filter):
+        return "<span foreground=\"grey\"><s>" + text + "</s></span>"
+    if track.default:
+        return "<b>" + text + "</b>"
+    return text
+
+
+def escape_markup(text):  # Escapes text for the Pango markup of the data grid (GLib is only there once the GUI imported it)
+    if glib is not None:
+        return glib.markup_escape_text(text, -1)
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;").replace("'", "&#39;").replace("\"", "&quot;")
+
+
+def get_device(path):  # Gets the st_dev of path, or of its closest existing parent folder (for output folders that don't exist yet)
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return os.stat(path).st_dev
+
+
+def get_device_job_limit(device):  # The number of extraction jobs that are allowed to use a device (st_dev) at the same time
+    if device not in device_job_limits:
+        # /sys/dev/block/MAJOR:MINOR is the disk itself or one of its partitions (in which case the "queue" folder is on the parent)
+        rotational = None
+        sys_path = "/sys/dev/block/" + str(os.major(device)) + ":" + str(os.minor(device))
+        for queue_path in (sys_path + "/queue/rotational", sys_path + "/../queue/rotational"):
+            try:
+                with open(queue_path) as queue_file:
+                    rotational = queue_file.read().strip() == "1"
+                break
+            except OSError:
+                continue
+        if rotational is None or rotational:  # Be careful with spinning disks and unknown (e.g. network) devices
+            device_job_limits[device] = max(1, int(extract_jobs_per_rotational_device))
+        else:
+            device_job_limits[device] = max(1, int(extract_jobs_per_device))
+    return device_job_limits[device]
+
+
+class ExtractionJob():  # A single mkvextract pass (argument list), the devices it reads from and writes to, and its status
+    def __init__(self, file, command, source_path, pass_label=""):
+        self.file = file  # The files_Full record (MkvFile)
+        self.command = command
+        self.source_path = source_path
+        self.pass_label = pass_label  # e.g. "pass 2/3" if the file is extracted in several passes
+        self.output_paths = [path for mode, id, path in get_command_outputs(command)]
+        self.output_folders = sorted(set(os.path.dirname(os.path.abspath(path)) for path in self.output_paths))  # Created (if needed) when the job starts
+        # The source device and the device(s) of the output folders (just one if they are on the same device), e.g. reading from a spinning disk while writing to an SSD
+        self.devices = {get_device(source_path)} | {get_device(folder_path) for folder_path in self.output_folders}
+        self.throughput_key = get_mount_point(source_path) + " -> " + get_mount_point(self.output_folders[0] if len(self.output_folders) > 0 else source_path)  # See record_throughput
+        self.size = os.path.getsize(source_path)  # Used to weight the progress of the job in the batch
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.exit_code = None
+        self.progress = 0  # Percentage, as reported by mkvextract
+        self.start_time = None
+        self.end_time = None
+        self.journal_key = None  # [batch, job] in the JobJournal
+
+    def get_status_text(self):
+        if self.status == "failed" and self.exit_code is not None:
+            text = "failed (exit code " + str(self.exit_code) + ")"
+        elif self.status == "running":
+            text = "running " + str(self.progress) + "%"
+        else:
+            text = self.status
+        if self.pass_label != "":
+            text = text + " (" + self.pass_label + ")"
+        return text
+
+
+class ExtractionScheduler():  # Runs ExtractionJobs concurrently:  at most extract_max_jobs in total, and at most get_device_job_limit() per source/destination device
+    def __init__(self, jobs, job_changed=None, finished=None, journal=None):
+        self.jobs = list(jobs)
+        self.job_changed = job_changed  # Called with the job (from the scheduler threads) whenever a job changes status
+        self.finished = finished  # Called (from the scheduler thread) once all jobs are done
+        self.journal = journal  # The JobJournal that records the jobs (None = no journal)
+        if self.journal is not None:
+            self.journal.begin_batch(self.jobs)
+        self.condition = threading.Condition()
+        self.device_jobs = {}  # st_dev: number of running jobs using it
+        self.processes = {}  # job: the ProcessEngine Future of the running jobs
+        self.cancelled = False
+        self.finished_jobs = False  # Set once run() is done, after which add_jobs() doesn't take any more jobs
+        self.start_time = None
+        # The totals of the batch, kept up to date by set_job_status() and set_job_progress() (instead of going through all jobs on every progress update)
+        self.status_counts = collections.Counter()  # status: number of jobs
+        self.total_bytes = 0  # The size of the jobs that aren't cancelled
+        self.done_bytes = 0  # The size of the done and failed jobs, plus the progress of the others
+        self.count_jobs(self.jobs)
+
+    def start(self):  # Runs the jobs in a background thread
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def run(self):  # Runs the jobs and returns once all of them are done
+        self.start_time = time.monotonic()
+        with self.condition:
+            while True:
+                queued = [job for job in self.jobs if job.status == "queued"]
+                running = len(self.processes)
+                if self.cancelled:
+                    for job in queued:
+                        self.set_job_status(job, "cancelled")
+                        self.notify(job)
+                    queued = []
+                for job in queued:
+                    if running >= max(1, int(extract_max_jobs)):
+                        break
+                    if all(self.device_jobs.get(device, 0) < get_device_job_limit(device) for device in job.devices):
+                        self.start_job(job)
+                        running = running + 1
+                if running == 0 and len(queued) == 0:
+                    self.finished_jobs = True
+                    break
+                self.condition.wait()
+        record_throughput(self.jobs)
+        if self.finished is not None:
+            self.finished()
+
+    def start_job(self, job):  # Starts a job (the condition must be held)
+        for device in job.devices:
+            self.device_jobs[device] = self.device_jobs.get(device, 0) + 1
+        self.set_job_status(job, "running")
+        job.start_time = time.monotonic()
+        if self.journal is not None:
+            self.journal.job_started(job)
+        self.notify(job)
+        try:
+            for folder_path in job.output_folders:  # e.g. the sub folders of output_folder_path, or the folders of an output_name_template with a "/"
+                os.makedirs(folder_path, exist_ok=True)
+        except OSError:
+            future = concurrent.futures.Future()
+            future.set_exception(sys.exc_info()[1])
+        else:
+            # The argument list is run directly (no shell), so any file name works as is.  The progress lines are followed by job_output(), on the ProcessEngine thread.
+            future = process_engine.run(job.command, "extract", on_line=lambda stream, line: self.job_output(job, line))
+        self.processes[job] = future
+        future.add_done_callback(lambda future: self.job_done(job, future))
+
+    def job_output(self, job, line):  # Follows the progress that the mkvextract process of a job reports
+        progress = get_extraction_progress(line)
+        if progress is not None and progress != job.progress:
+            with self.condition:
+                self.set_job_progress(job, progress)
+            self.notify(job)
+
+    def job_done(self, job, future):  # Records the exit code of a job and then lets the scheduler start the next jobs
+        try:
+            exit_code = future.result().exit_code
+        except (OSError, concurrent.futures.CancelledError):  # mkvextract couldn't be started, or the job was cancelled before it started
+            exit_code = -1
+        job.end_time = time.monotonic()
+        if exit_code in (0, 1):  # Failed and cancelled jobs would skew the throughput
+            perf_stats.add("extract", job.end_time - job.start_time, size=job.size)
+        with self.condition:
+            del self.processes[job]
+            for device in job.devices:
+                self.device_jobs[device] = self.device_jobs[device] - 1
+            job.exit_code = exit_code
+            if self.cancelled and exit_code < 0:
+                self.set_job_status(job, "cancelled")
+            elif exit_code in (0, 1):  # mkvextract exits with 1 for warnings
+                self.set_job_status(job, "done")
+                job.progress = 100
             else:
-                if len(subtitles) > 0:
-                    if str(track) in files_Full[i][11]:
-                        subtitles = subtitles + str(multi_lines_string) + "<b>" + str(track) + "-" + str(files_Full[i][10][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][10][track]["track_type"]) + ")</b>"
-                    else:
-                        subtitles = subtitles + str(multi_lines_string) + str(track) + "-" + str(files_Full[i][10][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][10][track]["track_type"]) + ")"
+                self.set_job_status(job, "failed")
+            if self.journal is not None:
+                self.journal.job_finished(job)
+            self.notify(job)
+            self.condition.notify_all()
+
+    def count_jobs(self, jobs):  # Adds new jobs to the totals of the batch (the condition must be held, or the scheduler not started yet)
+        for job in jobs:
+            self.status_counts[job.status] = self.status_counts[job.status] + 1
+            if job.status == "cancelled":
+                continue
+            self.total_bytes = self.total_bytes + job.size
+            self.done_bytes = self.done_bytes + self.get_done_bytes(job)
+
+    def get_done_bytes(self, job):  # How much of a job counts as done
+        if job.status in ("done", "failed"):
+            return job.size
+        if job.status == "cancelled":
+            return 0
+        return job.size * job.progress / 100
+
+    def set_job_status(self, job, status):  # Changes the status of a job and the totals of the batch (the condition must be held)
+        self.status_counts[job.status] = self.status_counts[job.status] - 1
+        self.status_counts[status] = self.status_counts[status] + 1
+        self.done_bytes = self.done_bytes - self.get_done_bytes(job)
+        if status == "cancelled":
+            self.total_bytes = self.total_bytes - job.size
+        job.status = status
+        self.done_bytes = self.done_bytes + self.get_done_bytes(job)
+
+    def set_job_progress(self, job, progress):  # Changes the progress of a running job and the totals of the batch (the condition must be held)
+        self.done_bytes = self.done_bytes + job.size * (progress - job.progress) / 100
+        job.progress = progress
+
+    def get_totals(self):  # Returns (fraction done, bytes done, total bytes, seconds elapsed) for the whole batch, weighted by file size
+        elapsed = 0 if self.start_time is None else time.monotonic() - self.start_time
+        return (self.done_bytes / self.total_bytes if self.total_bytes > 0 else 1), self.done_bytes, self.total_bytes, elapsed
+
+    def get_status_count(self, *statuses):  # The number of jobs with one of the statuses
+        return sum(self.status_counts[status] for status in statuses)
+
+    def add_jobs(self, jobs):  # Adds jobs to the running batch.  Returns False if the batch is already done (or cancelled), in which case the jobs need a new scheduler.
+        with self.condition:
+            if self.finished_jobs or self.cancelled:
+                return False
+            if self.journal is not None:
+                self.journal.add_jobs(jobs)
+            self.jobs.extend(jobs)
+            self.count_jobs(jobs)
+            self.condition.notify_all()
+            return True
+
+    def cancel(self):  # Stops starting new jobs and terminates the running ones
+        with self.condition:
+            self.cancelled = True
+            for future in self.processes.values():
+                process_engine.cancel(future)
+            self.condition.notify_all()
+
+    def notify(self, job):
+        if self.job_changed is not None:
+            self.job_changed(job)
+
+
+class JobJournal():  # The append only journal (JSON lines) of the extraction jobs:  every planned job, its start and end, its exit code and its outputs, so that an interrupted batch can be resumed (see get_unfinished_jobs)
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.batch = None  # The ID of the current batch
+        self.next_job = 0
+
+    def begin_batch(self, jobs):  # Records the jobs of a new batch.  The journal starts over if everything in it is finished.
+        with self.lock:
+            if len(get_unfinished_jobs(self.path)) == 0:
+                self.clear()
+            self.batch = datetime.datetime.now().isoformat(timespec="seconds") + "-" + str(os.getpid())
+            self.next_job = 0
+            self.write([{"event": "batch", "batch": self.batch, "time": time.time()}] + self.get_planned_records(jobs))
+
+    def add_jobs(self, jobs):  # Records the jobs that are added to the running batch
+        with self.lock:
+            self.write(self.get_planned_records(jobs))
+
+    def get_planned_records(self, jobs):  # Gives the new jobs their journal_key.  Resumed jobs keep theirs (and aren't planned again).
+        records = []
+        for job in jobs:
+            if job.journal_key is None:
+                job.journal_key = [self.batch, self.next_job]
+                self.next_job = self.next_job + 1
+                records.append({"event": "planned", "batch": self.batch, "job": job.journal_key[1], "file": job.file.name, "source": os.path.abspath(job.source_path),
+                                "command": job.command, "outputs": [os.path.abspath(path) for path in job.output_paths], "pass": job.pass_label})
+        return records
+
+    def job_started(self, job):
+        with self.lock:
+            self.write([{"event": "start", "batch": job.journal_key[0], "job": job.journal_key[1], "time": time.time()}])
+
+    def job_finished(self, job):
+        with self.lock:
+            self.write([{"event": "end", "batch": job.journal_key[0], "job": job.journal_key[1], "status": job.status, "exit_code": job.exit_code, "time": time.time()}])
+
+    def give_up(self, entry):  # Records that an unfinished job (see get_unfinished_jobs) won't be resumed
+        with self.lock:
+            self.write([{"event": "end", "batch": entry["batch"], "job": entry["job"], "status": "given up", "exit_code": None, "time": time.time()}])
+
+    def write(self, records):  # Appends records and makes sure they are on disk, so they survive a crash right after this
+        if len(records) == 0:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a") as journal_file:
+                for record in records:
+                    journal_file.write(json.dumps(record) + "\n")
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+        except OSError as error:
+            print("The job journal couldn't be written:  " + str(error))
+
+    def clear(self):  # Starts the journal over, e.g. when its unfinished jobs aren't wanted
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            print("The job journal couldn't be cleared:  " + str(error))
+
+
+def get_unfinished_jobs(journal_path):  # Reads the job journal.  Returns the planned jobs that didn't finish (in order), as their "planned" records with "started", "failures" and "status" added.
+    jobs = {}
+    try:
+        with open(journal_path) as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:  # e.g. the last line of a crash
+                    continue
+                key = (record.get("batch"), record.get("job"))
+                if record.get("event") == "planned":
+                    jobs[key] = dict(record, started=False, failures=0, status="queued")
+                elif key in jobs and record.get("event") == "start":
+                    jobs[key]["started"] = True
+                    jobs[key]["status"] = "running"  # Until its end is recorded
+                elif key in jobs and record.get("event") == "end":
+                    jobs[key]["status"] = record.get("status")
+                    if record.get("status") == "failed":
+                        jobs[key]["failures"] = jobs[key]["failures"] + 1
+    except OSError:
+        return []
+    return [job for job in jobs.values() if job["status"] not in ("done", "given up")]
+
+
+def get_unfinished_summary(unfinished):  # e.g. "5 jobs of 3 files (1 failed, 2 interrupted, 2 not started)"
+    failed = len([entry for entry in unfinished if entry["status"] == "failed"])
+    interrupted = len([entry for entry in unfinished if entry["status"] == "running" or (entry["status"] == "cancelled" and entry["started"])])
+    return str(len(unfinished)) + " jobs of " + str(len(set(entry["source"] for entry in unfinished))) + " files (" + str(failed) + " failed, " + str(interrupted) + " interrupted, " + \
+        str(len(unfinished) - failed - interrupted) + " not started)"
+
+
+def get_resume_jobs(unfinished):  # Creates the ExtractionJobs that resume the unfinished jobs of the job journal.  Returns (jobs, the entries that aren't resumed).
+    # The outputs of the jobs that were started are partial, so they are deleted first.  A job that failed more than extract_max_retries times (or whose mkv file is gone) is given up.
+    jobs = []
+    given_up = []
+    files = {os.path.abspath(os.path.join(default_folder_path, file.name)): file for file in files_Full}  # So the data grid shows the status of the loaded files
+    for entry in unfinished:
+        if entry["failures"] > extract_max_retries or not os.path.isfile(entry["source"]):
+            given_up.append(entry)
+            if job_journal is not None:
+                job_journal.give_up(entry)
+            continue
+        if entry["started"]:
+            for path in entry["outputs"]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as error:
+                    print("There was a problem deleting the following partial output:  " + str(path) + "  (" + str(error) + ")")
+        if entry["source"] not in files:
+            files[entry["source"]] = MkvFile(entry["file"])
+        try:
+            job = ExtractionJob(files[entry["source"]], entry["command"], entry["source"], entry["pass"])
+        except OSError:  # The mkv file is gone (or can't be read) since the check above
+            given_up.append(entry)
+            if job_journal is not None:
+                job_journal.give_up(entry)
+            continue
+        job.journal_key = [entry["batch"], entry["job"]]
+        jobs.append(job)
+    return jobs, given_up
+
+
+def get_extraction_jobs(files=None):  # Creates the ExtractionJobs for the command_lines of files_Full (or of the records in files), skipping the files with nothing to do.  Returns (jobs, {file name: reason} of the files that can't be read).
+    # A mkv file that is gone (or can't be read) since the scan is marked as failed, instead of ending the whole batch.
+    jobs = []
+    failed = {}
+    if files is None:
+        files = files_Full
+    for file in files:
+        if not isinstance(command_lines.get(file.name), list):  # Nothing to do (or up to date)
+            continue
+        passes = command_lines[file.name]
+        try:
+            file_jobs = []
+            for i in range(len(passes)):
+                command = passes[i][:1] + ["--gui-mode"] + passes[i][1:]  # --gui-mode gives "#GUI#progress NN%" lines
+                pass_label = "pass " + str(i + 1) + "/" + str(len(passes)) if len(passes) > 1 else ""
+                file_jobs.append(ExtractionJob(file, command, passes[i][1], pass_label))
+        except OSError as error:
+            print("There was a problem reading the following mkv file:  " + str(file.name) + "  (" + str(error) + ")")
+            failed[file.name] = "the mkv file can't be read (" + (error.strerror or str(error)) + ")"
+            file.status = "failed (" + failed[file.name] + ")"
+            command_lines[file.name] = "# The mkv file can't be read..."
+            continue
+        jobs.extend(file_jobs)
+    return jobs, failed
+
+
+def get_mount_point(path):  # The mount point of path (or of its closest existing parent folder), e.g. "/mnt/hdd"
+    path = os.path.abspath(path)
+    while not os.path.ismount(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    return path
+
+
+def get_free_space(path):  # The bytes available (to non-root users) on the device of path (or of its closest existing parent folder).  None if that can't be checked.
+    path = os.path.abspath(path)
+    while not os.path.exists(path) and os.path.dirname(path) != path:
+        path = os.path.dirname(path)
+    try:
+        stat = os.statvfs(path)
+    except OSError:
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+def get_output_size_estimates(file, source_path):  # The expected output sizes of a files_Full record:  ({track ID: bytes}, {attachment ID: bytes}), with the IDs as strings (like in the mkvextract arguments)
+    # The track sizes are the NUMBER_OF_BYTES statistics tags.  Tracks without them share what is left of the file size.
+    tracks = file.video + file.audio + file.subtitles
+    track_sizes = {str(track.id): track.bytes for track in tracks if track.bytes is not None}
+    attachment_sizes = {str(attachment.id): attachment.size or 0 for attachment in file.attachments}
+    unknown = [track for track in tracks if track.bytes is None]
+    if len(unknown) > 0:
+        try:
+            rest = os.path.getsize(source_path) - sum(track_sizes.values()) - sum(attachment_sizes.values())
+        except OSError:
+            rest = 0
+        for track in unknown:
+            track_sizes[str(track.id)] = max(0, rest) // len(unknown)
+    return track_sizes, attachment_sizes
+
+
+def plan_free_space(files=None):  # The free space pre-flight of the command_lines of files_Full (or of the records in files):  checks the estimated output sizes against the free space of the destination devices
+    # Returns ({file name: reason} of the files that don't fit, [(mount point, bytes needed, bytes free)] of the destination devices).
+    # The files are fitted in batch order.  A file that doesn't fit is left out, but the (smaller) files after it still get their turn.
+    needed = {}  # st_dev: bytes needed by the files that fit
+    free = {}  # st_dev: (mount point, bytes free)
+    left_out = {}
+    if files is None:
+        files = files_Full
+    for file in files:
+        if not isinstance(command_lines.get(file.name), list):
+            continue
+        track_sizes, attachment_sizes = get_output_size_estimates(file, command_lines[file.name][0][1])
+        file_needs = {}
+        for command in command_lines[file.name]:
+            for mode, id, path in get_command_outputs(command):
+                if mode == "tracks":
+                    size = track_sizes.get(id, 0)
+                elif mode == "attachments":
+                    size = attachment_sizes.get(id, 0)
                 else:
-                    if str(track) in files_Full[i][11]:
-                        subtitles = subtitles + "<b>" + str(track) + "-" + str(files_Full[i][10][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][10][track]["track_type"]) + ")</b>"
-                    else:
-                        subtitles = subtitles + str(track) + "-" + str(files_Full[i][10][track]["track_lang"]) + " ('" + str(name) + "' " + str(files_Full[i][10][track]["track_type"]) + ")"
-        files_Full[i][3] = subtitles
-        # Chapters
-        if len(files_Full[i][7]['chapters']) > 0:
-            files_Full[i][12] = 1
+                    size = chapters_size_estimate
+                try:
+                    size = max(0, size - os.path.getsize(path))  # Overwriting an output frees its space
+                except OSError:
+                    pass
+                folder_path = os.path.dirname(os.path.abspath(path))
+                device = get_device(folder_path)
+                if device not in free:
+                    free[device] = (get_mount_point(folder_path), get_free_space(folder_path))
+                file_needs[device] = file_needs.get(device, 0) + size
+        for device in file_needs:
+            mount_point, free_bytes = free[device]
+            if free_bytes is not None and needed.get(device, 0) + file_needs[device] > free_bytes - free_space_reserve:
+                left_out[file.name] = "Not enough free space on " + mount_point + " (needs " + "{:.1f}".format(file_needs[device] / 1000000000) + " GB, " + \
+                                      "{:.1f}".format(max(0, free_bytes - free_space_reserve - needed.get(device, 0)) / 1000000000) + " GB left)"
+                break
+        else:
+            for device in file_needs:
+                needed[device] = needed.get(device, 0) + file_needs[device]
+    return left_out, [(free[device][0], needed.get(device, 0), free[device][1]) for device in free]
+
+
+def get_preflight_summary(devices, left_out, jobs, failed=()):  # The summary of plan_free_space, the files that get_extraction_jobs failed, and estimate_batch_seconds, e.g. "/mnt/ssd:  120.5 GB of 300.2 GB free  |  1 files left out (not enough free space)  |  about 0:45:00 (at 180.0 MB/s)"
+    summary = []
+    for mount_point, needed_bytes, free_bytes in devices:
+        if free_bytes is None:
+            summary.append(mount_point + ":  " + "{:.1f}".format(needed_bytes / 1000000000) + " GB (free space unknown)")
         else:
-            files_Full[i][12] = 0
-        # Attachments
-        attachments = ""
-        for item in files_Full[i][7]["attachments"]:
-            if attachments == "": attachments = attachments + str(item['file_name']) + " (" + str(item['content_type']) + ")"
-            else: attachments = attachments + str(multi_lines_string) + str(item['file_name']) + " (" + str(item['content_type']) + ")"
-        files_Full[i][13] = attachments
+            summary.append(mount_point + ":  " + "{:.1f}".format(needed_bytes / 1000000000) + " GB of " + "{:.1f}".format(free_bytes / 1000000000) + " GB free")
+    if len(left_out) > 0:
+        summary.append(str(len(left_out)) + " files left out (not enough free space)")
+    if len(failed) > 0:
+        summary.append(str(len(failed)) + " files failed (the mkv file can't be read)")
+    seconds, throughput = estimate_batch_seconds(jobs)
+    if seconds is None:
+        summary.append("no throughput history for an estimate yet")
+    else:
+        summary.append("about " + str(datetime.timedelta(seconds=int(seconds))) + " (at {:.1f} MB/s)".format(throughput / 1000000))
+    return "  |  ".join(summary)
+
+
+def load_throughput_history():  # The throughput history {"source mount point -> destination mount point": [[bytes, seconds] of the recent batches]}
+    try:
+        with open(throughput_history_path) as history_file:
+            history = json.load(history_file)
+    except (OSError, ValueError):
+        return {}
+    return history if isinstance(history, dict) else {}
+
+
+def record_throughput(jobs):  # Adds the throughput of the done jobs of a batch (per source -> destination mount point) to the throughput history
+    measured = {}
+    for job in jobs:
+        if job.status == "done" and job.start_time is not None and job.end_time is not None:
+            measured.setdefault(job.throughput_key, []).append(job)
+    if len(measured) == 0:
+        return
+    history = load_throughput_history()
+    for key in measured:
+        # The seconds that at least one job was running (parallel jobs count once), so the throughput includes the parallelism of the batch
+        seconds = 0
+        end_time = None
+        for job in sorted(measured[key], key=lambda job: job.start_time):
+            if end_time is None or job.start_time > end_time:
+                seconds = seconds + job.end_time - job.start_time
+                end_time = job.end_time
+            elif job.end_time > end_time:
+                seconds = seconds + job.end_time - end_time
+                end_time = job.end_time
+        if seconds > 0:
+            history[key] = (history.get(key, []) + [[sum(job.size for job in measured[key]), seconds]])[-throughput_history_max_batches:]
+    try:
+        os.makedirs(os.path.dirname(throughput_history_path), exist_ok=True)
+        with open(throughput_history_path + ".tmp", "w") as history_file:
+            json.dump(history, history_file)
+        os.replace(throughput_history_path + ".tmp", throughput_history_path)
+    except OSError as error:
+        print("The throughput history couldn't be saved:  " + str(error))
+
+
+def estimate_batch_seconds(jobs):  # Predicts the duration of a batch from the throughput history.  Returns (seconds, bytes per second), or (None, None) without any history.
+    history = load_throughput_history()
+    all_batches = [batch for batches in history.values() for batch in batches if isinstance(batch, list) and len(batch) == 2]
+    sizes = {}
+    for job in jobs:
+        sizes[job.throughput_key] = sizes.get(job.throughput_key, 0) + job.size
+    seconds = 0
+    for key in sizes:
+        batches = history.get(key) or all_batches  # The average of the other source -> destination pairs is better than nothing
+        if len(batches) == 0 or sum(batch[1] for batch in batches) <= 0:
+            return None, None
+        seconds = seconds + sizes[key] / (sum(batch[0] for batch in batches) / sum(batch[1] for batch in batches))  # The pairs are counted one after the other, as they share extract_max_jobs
+    if seconds <= 0:
+        return None, None
+    return seconds, sum(sizes.values()) / seconds
+
+
+def get_extraction_progress(line):  # Gets the percentage from a mkvextract output line ("#GUI#progress 45%" in --gui-mode, otherwise "Progress: 45%")
+    match = re.search(r"(?:#GUI#progress|Progress:)\s*(\d+)%", line)
+    if match is None:
+        return None
+    return min(100, int(match.group(1)))
+
+
+def format_extraction_totals(totals):  # Formats the ExtractionScheduler.get_totals() as "45.0%  |  120.5 MB/s  |  ETA 0:12:34"
+    fraction, done_bytes, total_bytes, elapsed = totals
+    text = "{:.1f}%".format(fraction * 100)
+    if elapsed > 0 and done_bytes > 0:
+        throughput = done_bytes / elapsed
+        text = text + "  |  {:.1f} MB/s".format(throughput / 1000000)
+        text = text + "  |  ETA " + str(datetime.timedelta(seconds=int((total_bytes - done_bytes) / throughput)))
+    return text
+
+
+def parse_track_filter(languages, types, name, ids):  # Builds a track filter from the texts of the filter entries.  Returns None if there is nothing to filter on.
+    # languages, types and ids are comma separated lists and name is a (case insensitive) regular expression.  re.error is raised for an invalid name.
+    track_filter = {}
+    track_filter["languages"] = [language.strip().lower() for language in languages.split(",") if language.strip() != ""]
+    track_filter["types"] = [type.strip().upper() for type in types.split(",") if type.strip() != ""]
+    track_filter["name"] = re.compile(name, re.IGNORECASE) if name.strip() != "" else None
+    track_filter["ids"] = [id.strip() for id in ids.split(",") if id.strip() != ""]
+    if len(track_filter["languages"]) == 0 and len(track_filter["types"]) == 0 and track_filter["name"] is None and len(track_filter["ids"]) == 0:
+        return None
+    return track_filter
+
+
+def get_track_filter_key(track_filter):  # A hashable version of a track filter (for the markup_cache keys)
+    if track_filter is None:
+        return None
+    return (tuple(track_filter["languages"]), tuple(track_filter["types"]), None if track_filter["name"] is None else track_filter["name"].pattern, tuple(track_filter["ids"]))
+
+
+def track_matches_filter(track, track_filter):  # Checks if a Track (of MkvFile.audio or MkvFile.subtitles) passes a track filter
+    if track_filter is None:
+        return True
+    if len(track_filter["languages"]) > 0:
+        language = str(track.language).lower()
+        # "en" also matches the IETF variants like "en-US"
+        if language not in track_filter["languages"] and language.split("-")[0] not in track_filter["languages"]:
+            return False
+    if len(track_filter["types"]) > 0:
+        # Codecs match on a part of the name, just like the file extensions in the export_* functions (e.g. "AC-3" matches "E-AC-3")
+        if not any(type in str(track.codec).upper() for type in track_filter["types"]):
+            return False
+    if track_filter["name"] is not None and track_filter["name"].search(str(track.name)) is None:
+        return False
+    if len(track_filter["ids"]) > 0 and str(track.id) not in track_filter["ids"]:
+        return False
+    return True
 
 
 def update_parameter_files_at_start(command_line_parameters):  # Fix and Validate the command lind parameter files list and add to parameter_files
@@ -719,18 +3016,98 @@ def update_parameter_files_at_start(command_line_parameters):  # Fix and Validat
             print("There was a problem adding the following path from the command line parameters:  " + str(temp_file_address))
 
 
+def get_output_path(file, name):  # The path of an output of a files_Full record:  next to the mkv file, or in the same sub folder of output_folder_path
+    path = os.path.join(os.path.dirname(file.name), name)
+    folder_path = output_folder_path if output_folder_path != "" else default_folder_path
+    if folder_path == "":
+        return str(path)
+    return str(folder_path) + "/" + str(path)
+
+
+def get_track_tokens(file, track, extension):  # The output_name_template tokens of a track
+    return {"basename": os.path.basename(file.name)[0:len(os.path.basename(file.name)) - 4], "id": track.id, "lang": str(track.language),
+            "name": "" if track.name is None else track.name, "codec": str(track.codec), "ext": extension}
+
+
+def format_output_name(template, tokens):  # Fills in the {token}s (and format specs, e.g. "{id:02}") of an output file name template.  Raises ValueError for an invalid template.
+    # An empty {ext} (a codec without a known extension) also drops the "." in front of it
+    name = ""
+    for literal, field, format_spec, conversion in string.Formatter().parse(template):
+        name = name + literal
+        if field is None:
+            continue
+        if field not in output_name_tokens:
+            raise ValueError("Unknown token {" + field + "}")
+        value = format(tokens[field], format_spec).replace("/", "_")  # A token can't add sub folders, e.g. for a track name like "AC-3 5.1/2.0"
+        if field == "ext" and value == "" and name[-1:] == ".":
+            name = name[:-1]
+        name = name + value
+    if name.strip(". ") == "":
+        raise ValueError("Empty file name")
+    return name
+
+
+def check_output_name_template(template):  # Raises ValueError if an output_name_template can't be used
+    format_output_name(template, {"basename": "a", "id": 1, "lang": "eng", "name": "", "codec": "AAC", "ext": "aac"})
+    if os.path.isabs(template):
+        raise ValueError("The file names template has to be relative (to the output folder)")
+
+
+def get_command_outputs(command):  # The (mode, ID, output path) of every output of a mkvextract argument list, e.g. ("tracks", "2", "/out/a.track_2.eng.ac3") or ("chapters", None, "/out/a.chapters.xml")
+    arguments = [argument for argument in command[1:] if argument != "--gui-mode"]
+    outputs = []
+    mode = None
+    i = 1  # After the source path
+    while i < len(arguments):
+        if arguments[i] in ("tracks", "attachments"):
+            mode = arguments[i]
+        elif arguments[i] == "chapters" and i + 1 < len(arguments):
+            mode = None
+            outputs.append(("chapters", None, arguments[i + 1]))
+            i = i + 1
+        elif mode is not None and ":" in arguments[i]:
+            id, path = arguments[i].split(":", 1)
+            outputs.append((mode, id, path))
+        i = i + 1
+    return outputs
+
+
+def get_output_collisions(files=None):  # Checks the command_lines of files_Full (or of the records in files) for outputs that would overwrite each other or a mkv file.  Returns the problems (empty if there are none).
+    sources = {}
+    outputs = {}
+    if files is None:
+        files = files_Full
+    for file in files:
+        if not isinstance(command_lines.get(file.name), list):
+            continue
+        for command in command_lines[file.name]:
+            sources[os.path.abspath(command[1])] = file.name
+            for mode, id, path in get_command_outputs(command):
+                if mode == "tracks":
+                    description = str(file.name) + " (track " + str(id) + ")"
+                elif mode == "attachments":
+                    description = str(file.name) + " (attachment " + str(id) + ")"
+                else:
+                    description = str(file.name) + " (chapters)"
+                outputs.setdefault(os.path.abspath(path), []).append((mode, description))
+    problems = []
+    for path in outputs:
+        descriptions = [description for mode, description in outputs[path]]
+        if path in sources:
+            problems.append(path + "  would overwrite the mkv file itself:  " + ",  ".join(descriptions))
+        elif len(outputs[path]) > 1 and any(mode != "attachments" for mode, description in outputs[path]):  # Attachments of the same name (e.g. the fonts of every episode) are the same file
+            problems.append(path + "  is the output of " + str(len(outputs[path])) + " tracks/attachments:  " + ",  ".join(descriptions))
+    return problems
+
+
 def export_all_audios(file):
-    filename = file[0][0:len(file[0]) - 4]
-    if len(file[9]) > 0:
-        command = ""
-        for track in file[9]:
-            track_type = str(file[9][track]["track_type"]).upper()
-            track_id = track
-            track_lang = file[9][track]["track_lang"]
-            if not (file[9][track]["track_name"] is None):
-                track_filename = filename + ".track_" + str(track_id) + "." + file[9][track]["track_name"] + "." + str(track_lang)
-            else:
-                track_filename = filename + ".track_" + str(track_id) + "." + str(track_lang)
+    if len(file.audio) > 0:
+        command = []
+        for track in file.audio:
+            if not track_matches_filter(track, track_filters["audio"]):
+                continue
+            track_type = str(track.codec).upper()
+            extension = ""
             # Give the subtitles file a proper extension
             """
             A_AAC/MPEG2/*, A_AAC/MPEG4/*, A_AAC 	All AAC files will be written into an AAC file with ADTS headers before each packet. The ADTS headers will not contain the deprecated emphasis field.
@@ -749,57 +3126,51 @@ def export_all_audios(file):
             A_WAVPACK4 	WavPack(tm) tracks are written to WV files.
             """
             if "AAC" in track_type:
-                track_filename = track_filename + ".aac"
+                extension = "aac"
             elif ("AC3" in track_type or "AC-3" in track_type):
-                track_filename = track_filename + ".ac3"
+                extension = "ac3"
             elif "ALAC" in track_type:
-                track_filename = track_filename + ".caf"
+                extension = "caf"
             elif "DTS" in track_type:
-                track_filename = track_filename + ".dts"
+                extension = "dts"
             elif "FLAC" in track_type:
-                track_filename = track_filename + ".flac"
+                extension = "flac"
             elif ("MPEG/L2" in track_type or "MP2" in track_type):
-                track_filename = track_filename + ".mp2"
+                extension = "mp2"
             elif ("MPEG/L3" in track_type or "MP3" in track_type):
-                track_filename = track_filename + ".mp3"
+                extension = "mp3"
             elif "OPUS" in track_type:
-                track_filename = track_filename + ".ogg"
+                extension = "ogg"
             elif "PCM" in track_type:
-                track_filename = track_filename + ".wav"
+                extension = "wav"
             elif "REAL" in track_type:
-                track_filename = track_filename + ".ra"
+                extension = "ra"
             elif "TRUEHD" in track_type:
-                track_filename = track_filename + ".thd"
+                extension = "thd"
             elif "MLP" in track_type:
-                track_filename = track_filename + ".mlp"
+                extension = "mlp"
             elif "TTA1" in track_type:
-                track_filename = track_filename + ".tta"
+                extension = "tta"
             elif "VORBIS" in track_type:
-                track_filename = track_filename + ".ogg"
+                extension = "ogg"
             elif "WAVPACK4" in track_type:
-                track_filename = track_filename + ".wv"
+                extension = "wv"
             # Build command line for current track
-            if default_folder_path == "":
-                command = command + "\"" + str(track_id) + ":" + str(track_filename) + "\" "
-            else:
-                command = command + "\"" + str(track_id) + ":" + str(default_folder_path) + "/" + str(track_filename) + "\" "
+            track_path = get_output_path(file, format_output_name(output_name_template, get_track_tokens(file, track, extension)))
+            if incremental_extract and is_output_up_to_date(track_path, file, track.bytes):
+                continue
+            command.append(str(track.id) + ":" + track_path)
     else:
-        command = ""
+        command = []
     return command
 
 
 def export_all_videos(file):
-    filename = file[0][0:len(file[0]) - 4]
-    if len(file[8]) > 0:
-        command = ""
-        for track in file[8]:
-            track_type = str(file[8][track]["track_type"]).upper()
-            track_id = track
-            track_lang = file[8][track]["track_lang"]
-            if not (file[8][track]["track_name"] is None):
-                track_filename = filename + ".track_" + str(track_id) + "." + file[8][track]["track_name"] + "." + str(track_lang)
-            else:
-                track_filename = filename + ".track_" + str(track_id) + "." + str(track_lang)
+    if len(file.video) > 0:
+        command = []
+        for track in file.video:
+            track_type = str(track.codec).upper()
+            extension = ""
             # Give the video file a proper extension
             """
             V_MPEG1, V_MPEG2 	MPEG-1 and MPEG-2 video tracks will be written as MPEG elementary streams.
@@ -811,41 +3182,37 @@ def export_all_videos(file):
             V_VP8, V_VP9 	VP8 / VP9 tracks are written to IVF files. 
             """
             if "V_MPEG1" in track_type or "V_MPEG2" in track_type:
-                track_filename = track_filename + ".mpg"
+                extension = "mpg"
             elif "AVC" in track_type:
-                track_filename = track_filename + ".h264"
+                extension = "h264"
             elif "HEVC" in track_type:
-                track_filename = track_filename + ".h265"
+                extension = "h265"
             elif "FOURCC" in track_type:
-                track_filename = track_filename + ".avi"
+                extension = "avi"
             elif "V_REAL" in track_type:
-                track_filename = track_filename + ".rm"
+                extension = "rm"
             elif track_type == "V_THEORA":
-                track_filename = track_filename + ".ogg"
+                extension = "ogg"
             elif "V_VP8" in track_type or "V_VP9" in track_type:
-                track_filename = track_filename + ".ivf"
+                extension = "ivf"
             # Build command line for current track
-            if default_folder_path == "":
-                command = command + "\"" + str(track_id) + ":" + str(track_filename) + "\" "
-            else:
-                command = command + "\"" + str(track_id) + ":" + str(default_folder_path) + "/" + str(track_filename) + "\" "
+            track_path = get_output_path(file, format_output_name(output_name_template, get_track_tokens(file, track, extension)))
+            if incremental_extract and is_output_up_to_date(track_path, file, track.bytes):
+                continue
+            command.append(str(track.id) + ":" + track_path)
     else:
-        command = ""
+        command = []
     return command
 
 
 def export_all_subtitles(file):
-    filename = file[0][0:len(file[0]) - 4]
-    if len(file[10]) > 0:
-        command = ""
-        for track in file[10]:
-            track_type = str(file[10][track]["track_type"]).upper()
-            track_id = track
-            track_lang = file[10][track]["track_lang"]
-            if not (file[10][track]["track_name"] is None):
-                track_filename = filename + ".track_" + str(track_id) + "." + file[10][track]["track_name"] + "." + str(track_lang)
-            else:
-                track_filename = filename + ".track_" + str(track_id) + "." + str(track_lang)
+    if len(file.subtitles) > 0:
+        command = []
+        for track in file.subtitles:
+            if not track_matches_filter(track, track_filters["subtitles"]):
+                continue
+            track_type = str(track.codec).upper()
+            extension = ""
             # Give the subtitles file a proper extension
             """
             S_HDMV/PGS 	PGS subtitles will be written as SUP files.
@@ -856,68 +3223,305 @@ def export_all_subtitles(file):
             S_TEXT/WEBVTT 	WebVTT text subtitles will be written as WebVTT files.
             """
             if "PGS" in track_type:
-                track_filename = track_filename + ".sup"
+                extension = "sup"
             elif "ASS" in track_type:
-                track_filename = track_filename + ".ass"
+                extension = "ass"
             elif "SSA" in track_type or 'SubStationAlpha'.upper() in track_type.upper():
-                track_filename = track_filename + ".ssa"
+                extension = "ssa"
             elif "SubRip".upper() in track_type.upper() or "SRT".upper() in track_type.upper():
-                track_filename = track_filename + ".srt"
+                extension = "srt"
             elif "VOBSUB" in track_type:
-                track_filename = track_filename + ".sub"
+                extension = "sub"
             elif "USF" in track_type:
-                track_filename = track_filename + ".usf"
+                extension = "usf"
             elif "WEBVTT" in track_type:
-                track_filename = track_filename + ".vtt"
+                extension = "vtt"
             # Build command line for current track
-            if default_folder_path == "":
-                command = command + "\"" + str(track_id) + ":" + str(track_filename) + "\" "
-            else:
-                command = command + "\"" + str(track_id) + ":" + str(default_folder_path) + "/" + str(track_filename) + "\" "
+            track_path = get_output_path(file, format_output_name(output_name_template, get_track_tokens(file, track, extension)))
+            if incremental_extract and is_output_up_to_date(track_path, file, track.bytes):
+                continue
+            command.append(str(track.id) + ":" + track_path)
     else:
-        command = ""
+        command = []
     return command
 
 
 def export_all_attachments(file):
-    if len(file[7]["attachments"]) > 0:
-        command = " attachments "
-        for attachment in file[7]["attachments"]:
-            id = attachment["id"]
-            filename = attachment["file_name"]
-            # Build command line for current attachment
-            if default_folder_path == "":
-                command = command + str(id) + ':\"' + str(filename) + "\" "
-            else:
-                command = command + str(id) + ':\"' + str(default_folder_path) + "/" + str(filename) + "\" "
-    else:
-        command = ""
+    command = []
+    for attachment in file.attachments:
+        id = attachment.id
+        # Build command line for current attachment
+        attachment_path = get_output_path(file, attachment.file_name)  # Next to the (extracted tracks of the) mkv file, which can be in a sub folder
+        if incremental_extract and is_output_up_to_date(attachment_path, file, attachment.size):
+            continue
+        command.append(str(id) + ":" + attachment_path)
+    if len(command) > 0:
+        command = ["attachments"] + command
     return command
 
 
 def export_chapters(file):
-    filename = file[0][0:len(file[0]) - 4]
-    command = ""
-    if file[12] == 1:
-        if default_folder_path == "":
-            command = " chapters \"" + str(filename) + ".chapters.xml\""
-        else:
-            command = " chapters \"" + default_folder_path + "/" + str(filename) + ".chapters.xml\""
+    filename = os.path.basename(file.name)[0:len(os.path.basename(file.name)) - 4]
+    command = []
+    if file.chapters:
+        chapters_path = get_output_path(file, str(filename) + ".chapters.xml")
+        if incremental_extract and is_output_up_to_date(chapters_path, file, None):
+            return []
+        command = ["chapters", chapters_path]
     else:
-        command = ""
+        command = []
     return command
 
 
+def import_gtk():  # Imports Gtk, Gdk and GLib for the GUI
+    global gtk
+    global gdk
+    global glib
+    import gi
+    gi.require_version("Gtk", "3.0")
+    from gi.repository import Gtk
+    from gi.repository import Gdk
+    from gi.repository import GLib
+    gtk = Gtk
+    gdk = Gdk
+    glib = GLib
+
+
+def parse_command_line_parameters(argv):  # Parses the command line parameters for both the GUI and the --cli mode
+    parser = argparse.ArgumentParser(description="Bulk extract the tracks, chapters and attachments of mkv files with mkvextract.")
+    parser.add_argument("paths", nargs="*", help="The folder to start in (GUI), or the folders and/or mkv files to process (--cli).")
+    parser.add_argument("--cli", action="store_true", help="Run without the GUI:  print the mkvextract command lines (or run them with --execute).")
+    parser.add_argument("--action", choices=extract_actions, default="everything", help="What to extract (--cli).  Default:  everything")
+    parser.add_argument("--execute", action="store_true", help="Run the mkvextract command lines instead of printing them (--cli).")
+    parser.add_argument("--incremental", action="store_true", help="Skip the outputs that are already extracted (newer than the mkv file and of the expected size).")
+    parser.add_argument("--audio-languages", default="", metavar="LIST", help="Only extract the audio tracks with one of these languages (comma separated).")
+    parser.add_argument("--audio-types", default="", metavar="LIST", help="Only extract the audio tracks with one of these codecs (comma separated).")
+    parser.add_argument("--audio-name", default="", metavar="REGEX", help="Only extract the audio tracks whose name matches this regular expression.")
+    parser.add_argument("--audio-ids", default="", metavar="LIST", help="Only extract the audio tracks with one of these track IDs (comma separated).")
+    parser.add_argument("--subtitles-languages", default="", metavar="LIST", help="Only extract the subtitle tracks with one of these languages (comma separated).")
+    parser.add_argument("--subtitles-types", default="", metavar="LIST", help="Only extract the subtitle tracks with one of these codecs (comma separated).")
+    parser.add_argument("--subtitles-name", default="", metavar="REGEX", help="Only extract the subtitle tracks whose name matches this regular expression.")
+    parser.add_argument("--subtitles-ids", default="", metavar="LIST", help="Only extract the subtitle tracks with one of these track IDs (comma separated).")
+    parser.add_argument("--recursive", action="store_true", help="Also look for mkv files in the sub folders.")
+    parser.add_argument("--max-depth", type=int, help="How many sub folder levels --recursive goes down.  Default:  no limit")
+    parser.add_argument("--include", action="append", default=[], metavar="GLOB", help="Only use the mkv files matching this glob pattern (can be given more than once).")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB", help="Skip the mkv files and sub folders matching this glob pattern (can be given more than once).")
+    parser.add_argument("--watch", action="store_true", help="Keep watching the folder for new or changed mkv files and process them as they arrive (the GUI starts with \"Watch folder\" on).")
+    parser.add_argument("--mkvmerge-identify", action="store_true", help="Always identify the files with mkvmerge, instead of reading the Matroska headers directly.")
+    parser.add_argument("--output", metavar="FOLDER", help="Extract to this folder (with the same sub folders as the mkv files), e.g. on another disk.  Default:  next to the mkv files")
+    parser.add_argument("--name-template", metavar="TEMPLATE", help="The file names of the extracted tracks, with the tokens {basename}, {id}, {lang}, {name}, {codec} and {ext}.  Default:  " + output_name_template)
+    parser.add_argument("--skip-duplicates", action="store_true", help="Only extract the first copy of the files with the same content (the same tracks, duration, size, and first and last MB).")
+    parser.add_argument("--no-space-check", action="store_true", help="Don't leave out the files whose outputs (by their expected size) don't fit on the destination.")
+    parser.add_argument("--resume", action="store_true", help="Run the unfinished jobs of the last batches again (--cli), after deleting their partial outputs.")
+    parser.add_argument("--retries", type=int, help="How often --resume (or resuming in the GUI) retries a failed job.  Default:  2")
+    parser.add_argument("--passes", choices=["auto", "single", "split"], default="auto", help="How to extract each file:  in a single mkvextract pass, in parallel per track passes, or \"auto\" (split files of at least --split-min-size on solid state storage).  Default:  auto")
+    parser.add_argument("--split-min-size", type=float, metavar="GB", help="The file size from which --passes auto splits a file.  Default:  2")
+    parser.add_argument("--jobs", type=int, help="The number of mkvextract processes to run at the same time.  Default:  the number of CPUs")
+    parser.add_argument("--probe-jobs", type=int, help="The number of mkvmerge --identify processes to run at the same time.  Default:  the number of CPUs")
+    parser.add_argument("--profile", metavar="FILE", help="Write the per stage timings (json) to this file on exit (\"-\" = stderr).")
+    return parser.parse_args(argv)
+
+
+def get_cli_file_list(paths):  # Sets default_folder_path for the --cli paths and returns their mkv files (relative to default_folder_path)
+    global default_folder_path
+    file_paths = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            for file in get_list_of_mkv_files(path):
+                file_paths.append(path + "/" + file)
+        elif os.path.isfile(path):
+            file_paths.append(path)
+        else:
+            print("There was a problem with the following path:  " + str(path), file=sys.stderr)
+    if len(file_paths) == 0:
+        return []
+    default_folder_path = os.path.commonpath([os.path.dirname(path) for path in file_paths])
+    file_list = []
+    for path in file_paths:
+        file = os.path.relpath(path, default_folder_path)
+        if file not in file_list:
+            file_list.append(file)
+    return file_list
+
+
+def run_cli(parameters):  # The --cli mode:  prints the command lines, or runs them and reports the job statuses.  Returns the exit code.
+    global default_folder_path
+    if parameters.resume:
+        return resume_cli_jobs()
+    unfinished = get_unfinished_jobs(job_journal_path)
+    if len(unfinished) > 0 and parameters.execute:
+        print("The job journal has unfinished jobs from an earlier batch:  " + get_unfinished_summary(unfinished) + "  (--resume runs them again)", file=sys.stderr)
+    update_parameter_files_at_start([path for path in parameters.paths if "file://" in path])
+    paths = [path for path in parameters.paths if "file://" not in path] + parameter_files
+    if len(paths) == 0:
+        paths = [os.getcwd()]
+    try:
+        track_filters["audio"] = parse_track_filter(parameters.audio_languages, parameters.audio_types, parameters.audio_name, parameters.audio_ids)
+        track_filters["subtitles"] = parse_track_filter(parameters.subtitles_languages, parameters.subtitles_types, parameters.subtitles_name, parameters.subtitles_ids)
+    except re.error as error:
+        print("Invalid track name regular expression:  " + str(error), file=sys.stderr)
+        return 2
+    try:
+        check_output_name_template(output_name_template)
+    except ValueError as error:
+        print("Invalid --name-template:  " + str(error), file=sys.stderr)
+        return 2
+    if parameters.watch:
+        if len(paths) != 1 or not os.path.isdir(paths[0]):
+            print("--watch needs a single folder", file=sys.stderr)
+            return 2
+        default_folder_path = os.path.abspath(paths[0])
+        file_list = get_list_of_mkv_files()
+    else:
+        file_list = get_cli_file_list(paths)
+    populate_files_Full(file_list)
+    exit_code = process_cli_files(parameters)
+    if parameters.watch and exit_code != 130:
+        return watch_cli_folder(parameters)
+    return exit_code
+
+
+def process_cli_files(parameters, files=None):  # Prints the command lines of files_Full (or of the records in files), or runs them.  Returns the exit code.
+    groups = find_duplicate_groups(files_Full if files is None else files, default_folder_path)
+    set_duplicate_groups(files_Full if files is None else files, groups)
+    if len(groups) > 0:
+        print("Duplicates:  " + get_duplicates_summary(groups) + ("" if skip_duplicates else ", use --skip-duplicates to only extract the first copies"), file=sys.stderr)
+        for group in groups:
+            print("Duplicate group " + str(group[0].duplicate[0]) + ":  " + "  =  ".join(str(file.name) for file in group), file=sys.stderr)
+    build_command_lines(extract_actions.index(parameters.action), files)
+    if incremental_extract:
+        print("Incremental:  " + get_skipped_summary(), file=sys.stderr)
+    print("Plan:  " + get_plan_summary(), file=sys.stderr)
+    problems = get_output_collisions(files)
+    for problem in problems:
+        print("Output path collision:  " + problem, file=sys.stderr)
+    if len(problems) > 0 and parameters.execute:
+        print("Nothing extracted, please change --name-template", file=sys.stderr)
+        return 2
+    if not parameters.execute:
+        sys.stdout.write(get_command_lines_output())
+        sys.stdout.flush()
+        return 0
+    left_out = {}
+    devices = []
+    if check_free_space:
+        left_out, devices = plan_free_space(files)
+    for name in left_out:
+        print(left_out[name] + ":  " + str(name), file=sys.stderr)
+        command_lines[name] = "# " + left_out[name] + "..."
+    jobs, failed = get_extraction_jobs(files)
+    for name in failed:
+        print("Failed, " + failed[name] + ":  " + str(name), file=sys.stderr)
+    print("Pre-flight:  " + get_preflight_summary(devices, left_out, jobs, failed), file=sys.stderr)
+    if len(jobs) == 0:
+        return 1 if len(left_out) > 0 or len(failed) > 0 else 0
+    exit_code = run_cli_jobs(jobs)
+    return 1 if exit_code == 0 and (len(left_out) > 0 or len(failed) > 0) else exit_code
+
+
+def run_cli_jobs(jobs):  # Runs ExtractionJobs (recorded in the job journal) and reports their statuses.  Returns the exit code.
+    def job_changed(job):
+        if job.status != "running" or job.progress == 0:  # Only print the status changes, not every percent
+            print(job.get_status_text() + ":  " + str(job.file.name) + "  |  " + format_extraction_totals(scheduler.get_totals()), file=sys.stderr)
+
+    scheduler = ExtractionScheduler(jobs, job_changed, journal=job_journal)
+    try:
+        scheduler.run()
+    except KeyboardInterrupt:
+        scheduler.cancel()
+        return 130
+    failed = [job for job in jobs if job.status != "done"]
+    return 1 if len(failed) > 0 else 0
+
+
+def resume_cli_jobs():  # The --cli --resume mode:  runs the unfinished jobs of the job journal (see get_resume_jobs).  Returns the exit code.
+    unfinished = get_unfinished_jobs(job_journal_path)
+    if len(unfinished) == 0:
+        print("Nothing to resume", file=sys.stderr)
+        return 0
+    print("Resuming:  " + get_unfinished_summary(unfinished), file=sys.stderr)
+    jobs, given_up = get_resume_jobs(unfinished)
+    for entry in given_up:
+        print("Given up (failed " + str(entry["failures"]) + " times, or the mkv file is gone):  " + str(entry["file"]) + ("" if entry["pass"] == "" else " (" + entry["pass"] + ")"), file=sys.stderr)
+    if len(jobs) == 0:
+        return 1
+    exit_code = run_cli_jobs(jobs)
+    return 1 if exit_code == 0 and len(given_up) > 0 else exit_code
+
+
+def watch_cli_folder(parameters):  # The --cli --watch mode:  processes the new and changed mkv files of default_folder_path as they arrive, until Ctrl+C.  Returns the exit code.
+    changes = queue.Queue()
+    try:
+        watcher = InotifyWatcher(default_folder_path, lambda written, removed: changes.put((written, removed)))
+    except OSError as error:
+        print("There was a problem watching the following folder:  " + str(default_folder_path) + "  (" + str(error) + ")", file=sys.stderr)
+        return 1
+    watcher.start()
+    print("Watching " + str(default_folder_path) + " for new mkv files (Ctrl+C to stop)...", file=sys.stderr)
+    exit_code = 0
+    try:
+        while True:
+            written, removed = changes.get()
+            if written is None:
+                print("Too many changes at once, some files were missed (restart with --incremental to catch up)", file=sys.stderr)
+                continue
+            if len(written) == 0:  # Removed files don't need anything here
+                continue
+            files = list(iter_files_Full_entries(default_folder_path, sorted(written)))
+            files_Full[:] = files
+            result = process_cli_files(parameters, files)
+            if result == 130:
+                return 130
+            if result != 0:
+                exit_code = 1
+    except KeyboardInterrupt:
+        return 130 if exit_code == 0 else exit_code
+    finally:
+        watcher.stop()
+
+
 if __name__ == '__main__':
+    parameters = parse_command_line_parameters(sys.argv[1:])
+    if parameters.jobs is not None:
+        extract_max_jobs = parameters.jobs
+    if parameters.probe_jobs is not None:
+        probe_workers = parameters.probe_jobs
+    incremental_extract = parameters.incremental
+    skip_duplicates = parameters.skip_duplicates
+    native_identify = not parameters.mkvmerge_identify
+    watch_folder = parameters.watch
+    if parameters.output is not None:
+        output_folder_path = os.path.abspath(os.path.expanduser(parameters.output))
+    if parameters.name_template is not None:
+        output_name_template = parameters.name_template
+    check_free_space = not parameters.no_space_check
+    if parameters.retries is not None:
+        extract_max_retries = parameters.retries
+    job_journal = JobJournal(job_journal_path)
+    extract_pass_mode = parameters.passes
+    if parameters.split_min_size is not None:
+        extract_split_min_size = int(parameters.split_min_size * 1000000000)
+    recursive_scan = parameters.recursive
+    scan_max_depth = parameters.max_depth
+    scan_include = parameters.include
+    scan_exclude = parameters.exclude
+    perf_profile_path = parameters.profile
+    if parameters.cli:
+        exit_code = run_cli(parameters)
+        process_engine.shutdown(engine_kill_seconds + 1)  # e.g. the jobs that Ctrl+C cancelled
+        if perf_profile_path is not None:
+            write_perf_profile(perf_profile_path)
+        sys.exit(exit_code)
     # Check for command line arguments, and set the default_folder_path appropriately
-    if len(sys.argv) > 1:  # If there is a command line argument, check if it is a folder
-        if os.path.isdir(sys.argv[1]):  # Valid folder:  so set the default_folder_path to it
-            default_folder_path = sys.argv[1]
-        elif os.path.isdir(os.path.dirname(os.path.abspath(sys.argv[1]))):  # If valid file path was sent:  use folder path from it.
-            default_folder_path = os.path.dirname(os.path.abspath(sys.argv[1]))
-        elif "file://" in sys.argv[1]:  # In case using 'Bulk Rename' option in Nemo, get file path from first parameter and auto-select the files.
-            update_parameter_files_at_start(sys.argv[1:])  # Convert URL encoded files to paths
-            if os.path.isdir(os.path.dirname(os.path.abspath(parameter_files[0]))):  # If the first file is a valid path:  use folder path from it.
+    if len(parameters.paths) > 0:  # If there is a command line argument, check if it is a folder
+        if os.path.isdir(parameters.paths[0]):  # Valid folder:  so set the default_folder_path to it
+            default_folder_path = parameters.paths[0]
+        elif os.path.isdir(os.path.dirname(os.path.abspath(parameters.paths[0]))):  # If valid file path was sent:  use folder path from it.
+            default_folder_path = os.path.dirname(os.path.abspath(parameters.paths[0]))
+        elif "file://" in parameters.paths[0]:  # In case using 'Bulk Rename' option in Nemo, get file path from first parameter and auto-select the files.
+            update_parameter_files_at_start(parameters.paths)  # Convert URL encoded files to paths
+            if len(parameter_files) > 0 and os.path.isdir(os.path.dirname(os.path.abspath(parameter_files[0]))):  # If the first file is a valid path:  use folder path from it.
                 default_folder_path = os.path.dirname(os.path.abspath(parameter_files[0]))
             else:  # Invalid first file path:  so set the default_folder_path to where the python file is
                 default_folder_path = sys.path[0]
@@ -925,5 +3529,7 @@ if __name__ == '__main__':
             default_folder_path = sys.path[0]
     else:  # No command line argument:  so set the default_folder_path to where the python file is
         default_folder_path = sys.path[0]
+    import_gtk()
     main = Main()
     gtk.main()
+    process_engine.shutdown(engine_kill_seconds + 1)
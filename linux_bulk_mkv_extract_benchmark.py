@@ -0,0 +1,255 @@
+#!/usr/bin/python3
+
+
+"""
+Application:  linux_bulk_mkv_extract_benchmark.py
+Author:  BSFEMA
+Purpose:  Measures how the stages of linux_bulk_mkv_extract.py scale with the number of mkv files:  the folder scan, identifying the files (cold and from the identify cache),
+          the facet index, the data grid markup, the data grid rows, building the command lines, and running the extraction jobs.
+          The mkv files are synthetic:  every file comes with mkvmerge json data (with a varied number of tracks, chapters and attachments),
+          which stub "mkvmerge" and "mkvextract" scripts (put first on the PATH) hand out, after a configurable latency.
+          So neither MKVToolNix nor real mkv files are needed, and the numbers only measure this application.
+Usage:  linux_bulk_mkv_extract_benchmark.py [--sizes 10,1000,10000] [--latency SECONDS] [--extract-limit FILES] [--output FILE]
+        Prints a table and writes the results as json (wall time, peak RSS and the number of stub processes per stage), to compare releases offline.
+"""
+
+
+import sys
+import os
+import time
+import json
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import datetime
+import resource
+
+
+import linux_bulk_mkv_extract as app  # The application is next to this file (sys.path[0])
+
+
+benchmark_version = 1  # The version of the json results (bump it when the stages or their measurements change)
+stub_mkvmerge = """#!/bin/sh
+echo mkvmerge >> "$BENCHMARK_COUNT_FILE"
+if [ "$1" = "--version" ]; then
+    echo "mkvmerge v80.0 ('Benchmark Stub') 64-bit"
+    exit 0
+fi
+sleep "$BENCHMARK_LATENCY"
+for path; do :; done
+cat "$path.json"
+"""
+stub_mkvextract = """#!/bin/sh
+echo mkvextract >> "$BENCHMARK_COUNT_FILE"
+sleep "$BENCHMARK_LATENCY"
+echo "#GUI#progress 100%"
+"""
+# The synthetic tracks:  (type, mkvmerge codec, codec_id)
+video_codecs = [("AVC/H.264/MPEG-4p10", "V_MPEG4/ISO/AVC"), ("HEVC/H.265/MPEG-H", "V_MPEGH/ISO/HEVC"), ("VP9", "V_VP9")]
+audio_codecs = [("AAC", "A_AAC"), ("AC-3", "A_AC3"), ("E-AC-3", "A_EAC3"), ("DTS", "A_DTS"), ("FLAC", "A_FLAC"), ("Opus", "A_OPUS"), ("TrueHD Atmos", "A_TRUEHD")]
+subtitle_codecs = [("SubRip/SRT", "S_TEXT/UTF8"), ("SubStationAlpha", "S_TEXT/ASS"), ("HDMV PGS", "S_HDMV/PGS"), ("VobSub", "S_VOBSUB")]
+languages = ["eng", "jpn", "ger", "fre", "spa", "ita", "por", "rus", "chi", "kor", "und"]
+track_names = ["", "", "", "Main", "Commentary", "Director's Commentary", "Signs & Songs", "Full", "SDH", "Forced"]
+
+
+def make_mkvmerge_json(rng, name):  # The mkvmerge json data of a synthetic mkv file:  1 video track, 1-4 audio tracks, 0-8 subtitle tracks, maybe chapters and attachments
+    tracks = []
+    codec, codec_id = rng.choice(video_codecs)
+    tracks.append({"id": 0, "type": "video", "codec": codec, "properties": {"codec_id": codec_id, "language": "und", "default_track": True, "display_dimensions": "1920x1080",
+                                                                             "tag_number_of_bytes": str(rng.randint(200, 8000) * 1000000)}})
+    for kind, codecs, count in (("audio", audio_codecs, rng.randint(1, 4)), ("subtitles", subtitle_codecs, rng.randint(0, 8))):
+        for i in range(count):
+            codec, codec_id = rng.choice(codecs)
+            properties = {"codec_id": codec_id, "language": rng.choice(languages), "default_track": i == 0}
+            if rng.choice(track_names) != "":
+                properties["track_name"] = rng.choice(track_names)
+            if rng.random() < 0.8:  # Not every file has the statistics tags
+                properties["tag_number_of_bytes"] = str(rng.randint(1, 2000) * 100000)
+            if kind == "subtitles":
+                properties["encoding"] = "UTF-8"
+            tracks.append({"id": len(tracks), "type": kind, "codec": codec, "properties": properties})
+    chapters = [{"num_entries": rng.randint(4, 30)}] if rng.random() < 0.7 else []
+    attachments = [{"id": i + 1, "file_name": "font" + str(i + 1) + ".ttf", "content_type": "font/ttf", "size": rng.randint(20000, 900000)} for i in range(rng.choice([0, 0, 1, 3]))]
+    return {"container": {"properties": {"title": name[0:len(name) - 4]}, "recognized": True, "supported": True, "type": "Matroska"},
+            "tracks": tracks, "chapters": chapters, "attachments": attachments}
+
+
+def make_fixtures(folder_path, count, seed):  # Writes count synthetic mkv files (in sub folders of 500 files) with their mkvmerge json data next to them.  Returns the number of tracks.
+    rng = random.Random(seed)
+    track_count = 0
+    for i in range(count):
+        sub_folder = os.path.join(folder_path, "Season " + str(i // 500 + 1))
+        os.makedirs(sub_folder, exist_ok=True)
+        name = "Show - S" + str(i // 500 + 1).zfill(2) + "E" + str(i % 500 + 1).zfill(3) + ".mkv"
+        json_data = make_mkvmerge_json(rng, name)
+        track_count = track_count + len(json_data["tracks"])
+        with open(os.path.join(sub_folder, name), "wb") as mkv_file:
+            mkv_file.write(b"\0" * 4096)  # Not Matroska, so the native reader leaves it to mkvmerge (it's off anyway)
+        with open(os.path.join(sub_folder, name + ".json"), "w") as json_file:
+            json.dump(json_data, json_file)
+    return track_count
+
+
+def make_stubs(bin_path):  # Writes the stub mkvmerge and mkvextract
+    os.makedirs(bin_path, exist_ok=True)
+    for name, script in (("mkvmerge", stub_mkvmerge), ("mkvextract", stub_mkvextract)):
+        with open(os.path.join(bin_path, name), "w") as stub_file:
+            stub_file.write(script)
+        os.chmod(os.path.join(bin_path, name), 0o755)
+
+
+def reset_peak_rss():  # Resets the peak RSS (VmHWM) of this process, so it can be measured per stage.  Returns False if the kernel doesn't allow that.
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def get_peak_rss():  # The peak RSS of this process in KB (since reset_peak_rss)
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def get_subprocess_counts(count_path):  # The number of stub processes that were run so far:  {"mkvmerge": n, "mkvextract": n}
+    counts = {"mkvmerge": 0, "mkvextract": 0}
+    try:
+        with open(count_path) as count_file:
+            for line in count_file:
+                if line.strip() in counts:
+                    counts[line.strip()] = counts[line.strip()] + 1
+    except OSError:
+        pass
+    return counts
+
+
+def measure(stage, count_path, function):  # Runs a stage and returns its measurements
+    per_stage_rss = reset_peak_rss()
+    counts_before = get_subprocess_counts(count_path)
+    start = time.perf_counter()
+    details = function()
+    wall = time.perf_counter() - start
+    counts_after = get_subprocess_counts(count_path)
+    result = {"stage": stage, "wall_seconds": round(wall, 4), "peak_rss_kb": get_peak_rss(), "peak_rss_scope": "stage" if per_stage_rss else "process",
+              "subprocesses": {name: counts_after[name] - counts_before[name] for name in counts_after}}
+    if details is not None:
+        result.update(details)
+    return result
+
+
+def load_data_grid():  # The data grid rows of load_Data_Grid, into a Gtk.ListStore with the columns of liststore_Data_Grid (without the window, so no display is needed)
+    if app.gtk is None:
+        try:
+            app.import_gtk()
+        except (ImportError, ValueError) as error:
+            return {"skipped": "Gtk isn't available (" + str(error) + ")"}
+    liststore = app.gtk.ListStore(*([str] * 8))
+    rows = [app.get_Data_Grid_row(file) for file in app.files_Full]
+    for row in rows:
+        liststore.append(row)
+    return {"rows": len(liststore)}
+
+
+def extract(limit):  # Builds the command lines of the first limit files again and runs them with the ExtractionScheduler (the stub mkvextract doesn't write anything)
+    files = app.files_Full[:limit]
+    app.build_command_lines(0, files)
+    jobs, failed = app.get_extraction_jobs(files)
+    scheduler = app.ExtractionScheduler(jobs)
+    scheduler.run()
+    return {"jobs": len(jobs), "failed": len([job for job in jobs if job.status != "done"])}
+
+
+def run_size(count, work_path, latency, extract_limit, seed):  # Runs all of the stages for count synthetic files.  Returns the results of this size.
+    folder_path = os.path.join(work_path, str(count) + " files")
+    track_count = make_fixtures(folder_path, count, seed)
+    count_path = os.path.join(work_path, "subprocesses_" + str(count))
+    os.environ["BENCHMARK_COUNT_FILE"] = count_path
+    os.environ["BENCHMARK_LATENCY"] = str(latency)
+    # Start from a clean application state, with everything it stores in work_path
+    app.default_folder_path = folder_path
+    app.recursive_scan = True
+    app.native_identify = False  # The synthetic files are only known to the stub mkvmerge
+    app.mkvmerge_version = None
+    app.identify_cache_path = os.path.join(work_path, "identify_cache_" + str(count) + ".sqlite")
+    app.throughput_history_path = os.path.join(work_path, "throughput_history.json")
+    app.output_folder_path = os.path.join(work_path, "output")
+    app.files_Full.clear()
+    app.markup_cache.clear()
+    app.command_lines.clear()
+    stages = []
+    file_list = []
+
+    def scan():
+        file_list[:] = app.get_list_of_mkv_files()
+        return {"files": len(file_list)}
+
+    def identify():
+        app.populate_files_Full(file_list)  # Includes the facet index (parse_json_data)
+        return {"files": len(app.files_Full)}
+
+    def render():
+        app.markup_cache.clear()
+        app.render_files_Full()
+
+    def build_command_lines():
+        app.build_command_lines(0)
+        return {"command_lines": len(app.command_lines)}
+
+    stages.append(measure("scan", count_path, scan))
+    stages.append(measure("identify (cold)", count_path, identify))
+    stages.append(measure("identify (cached)", count_path, identify))
+    stages.append(measure("parse_json_data", count_path, app.parse_json_data))
+    stages.append(measure("render_files_Full", count_path, render))
+    stages.append(measure("load_Data_Grid", count_path, load_data_grid))
+    stages.append(measure("build_command_lines", count_path, build_command_lines))
+    if extract_limit > 0:
+        stages.append(measure("extraction (first " + str(min(count, extract_limit)) + " files)", count_path, lambda: extract(extract_limit)))
+    return {"files": count, "tracks": track_count, "stages": stages}
+
+
+def print_results(results):  # Prints the results of a size as a table
+    print(str(results["files"]) + " files (" + str(results["tracks"]) + " tracks):")
+    for stage in results["stages"]:
+        if "skipped" in stage:
+            print("    {:<36}skipped:  {}".format(stage["stage"], stage["skipped"]))
+            continue
+        subprocesses = ",  ".join(name + " " + str(count) for name, count in stage["subprocesses"].items() if count > 0)
+        print("    {:<36}{:>10.3f} s{:>12,} KB peak RSS    {}".format(stage["stage"], stage["wall_seconds"], stage["peak_rss_kb"], subprocesses))
+    sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the stages of linux_bulk_mkv_extract.py with synthetic mkv files and stub mkvmerge/mkvextract.")
+    parser.add_argument("--sizes", default="10,1000,10000", metavar="LIST", help="The numbers of mkv files to benchmark (comma separated).  Default:  10,1000,10000")
+    parser.add_argument("--latency", type=float, default=0.0, metavar="SECONDS", help="How long every stub mkvmerge/mkvextract takes.  Default:  0")
+    parser.add_argument("--extract-limit", type=int, default=1000, metavar="FILES", help="The number of files the extraction stage runs (0 = skip it).  Default:  1000")
+    parser.add_argument("--seed", type=int, default=2023, help="The seed of the synthetic mkvmerge json data.  Default:  2023")
+    parser.add_argument("--output", default="benchmark_results.json", metavar="FILE", help="Where to write the json results.  Default:  benchmark_results.json")
+    parser.add_argument("--keep", action="store_true", help="Keep the synthetic files (the folder is printed).")
+    parameters = parser.parse_args()
+    work_path = tempfile.mkdtemp(prefix="linux_bulk_mkv_extract_benchmark_")
+    make_stubs(os.path.join(work_path, "bin"))
+    os.environ["PATH"] = os.path.join(work_path, "bin") + os.pathsep + os.environ.get("PATH", "")
+    report = {"version": benchmark_version, "created": datetime.datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+              "platform": platform.platform(), "cpu_count": os.cpu_count(), "latency_seconds": parameters.latency, "seed": parameters.seed, "results": []}
+    try:
+        for size in [int(size) for size in parameters.sizes.split(",") if size.strip() != ""]:
+            report["results"].append(run_size(size, work_path, parameters.latency, parameters.extract_limit, parameters.seed))
+            print_results(report["results"][-1])
+    finally:
+        if parameters.keep:
+            print("The synthetic files are in " + work_path)
+        else:
+            shutil.rmtree(work_path, ignore_errors=True)
+    with open(parameters.output, "w") as output_file:
+        json.dump(report, output_file, indent=2)
+    print("Results written to " + parameters.output)
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+
+"""
+Application:  test_linux_bulk_mkv_extract.py
+Author:  BSFEMA
+Purpose:  Tests for linux_bulk_mkv_extract.py that don't need the GUI.
+          The tests that compare against mkvmerge are skipped if MKVToolNix isn't installed.
+Usage:  python3 -m unittest test_linux_bulk_mkv_extract  (or python3 -m pytest)
+"""
+
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+
+import linux_bulk_mkv_extract as app  # The application is next to this file (sys.path[0])
+
+
+def ebml_element(element_id, data):  # Builds an EBML element (with an 8 byte size)
+    if isinstance(data, int):
+        data = data.to_bytes(max(1, (data.bit_length() + 7) // 8), "big")
+    elif isinstance(data, str):
+        data = data.encode("utf-8")
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, "big") + (0x01 << 56 | len(data)).to_bytes(8, "big") + data
+
+
+def write_mkv_file(path, language):  # Writes a minimal Matroska file with one subtitle track in the given (ISO 639-2) language
+    header = ebml_element(app.ebml_id_header, ebml_element(0x4286, 1) + ebml_element(0x42F7, 1) + ebml_element(0x42F2, 4) + ebml_element(0x42F3, 8) +
+                          ebml_element(app.ebml_id_doc_type, "matroska") + ebml_element(0x4287, 4) + ebml_element(0x4285, 2))
+    info = ebml_element(app.ebml_id_info, ebml_element(app.ebml_id_timestamp_scale, 1000000) + ebml_element(app.ebml_id_muxing_app, "test") +
+                        ebml_element(app.ebml_id_writing_app, "test"))
+    track = ebml_element(app.ebml_id_track_entry, ebml_element(app.ebml_id_track_number, 1) + ebml_element(app.ebml_id_track_uid, 1) +
+                         ebml_element(app.ebml_id_track_type, 17) + ebml_element(app.ebml_id_codec_id, "S_TEXT/UTF8") +
+                         ebml_element(app.ebml_id_language, language))
+    cluster = ebml_element(app.ebml_id_cluster, ebml_element(0xE7, 0) + ebml_element(0xA3, bytes([0x81, 0, 0, 0x80]) + b"test"))
+    with open(path, "wb") as file:
+        file.write(header + ebml_element(app.ebml_id_segment, info + ebml_element(app.ebml_id_tracks, track) + cluster))
+
+
+class NativeIdentifyLanguageTests(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def native_language(self, language):  # Returns (language, language_ietf) of the native parser, or None if it leaves the file to mkvmerge
+        path = os.path.join(self.folder, language + ".mkv")
+        write_mkv_file(path, language)
+        try:
+            properties = app.native_identify_mkv_file(path)["tracks"][0]["properties"]
+        except app.NativeIdentifyError:
+            return None
+        return properties["language"], properties["language_ietf"]
+
+    def test_iso_639_1_languages(self):
+        self.assertEqual(self.native_language("afr"), ("afr", "af"))  # Not in the original (short) table
+        self.assertEqual(self.native_language("ger"), ("ger", "de"))
+        self.assertEqual(self.native_language("und"), ("und", "und"))
+
+    def test_unknown_languages_are_left_to_mkvmerge(self):
+        self.assertIsNone(self.native_language("ast"))  # Asturian has no ISO 639-1 code
+        self.assertIsNone(self.native_language("xyz"))
+
+    @unittest.skipIf(shutil.which("mkvmerge") is None, "mkvmerge isn't installed")
+    def test_native_identify_matches_mkvmerge(self):
+        for language in ("afr", "ger", "swa", "wel", "und", "ast"):
+            native = self.native_language(language)
+            if native is None:
+                continue  # mkvmerge identifies this file in the application too
+            result = subprocess.run(["mkvmerge", "-J", os.path.join(self.folder, language + ".mkv")], capture_output=True, text=True)
+            properties = json.loads(result.stdout)["tracks"][0]["properties"]
+            self.assertEqual(native, (properties["language"], properties["language_ietf"]), language)
+
+
+class ExtractionJobTests(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.command_lines = app.command_lines
+        app.command_lines = {}
+        self.files = []
+        for name in ("a.mkv", "b.mkv", "c.mkv"):
+            path = os.path.join(self.folder, name)
+            write_mkv_file(path, "eng")
+            self.files.append(app.MkvFile(name))
+            app.command_lines[name] = [["mkvextract", path, "tracks", "0:" + os.path.join(self.folder, name[:-4] + ".srt")]]
+
+    def tearDown(self):
+        app.command_lines = self.command_lines
+        shutil.rmtree(self.folder)
+
+    def test_removed_file_fails_on_its_own(self):  # A mkv file that is removed after the scan only fails that file, not the whole batch
+        os.remove(os.path.join(self.folder, "b.mkv"))
+        jobs, failed = app.get_extraction_jobs(self.files)
+        self.assertEqual([job.file.name for job in jobs], ["a.mkv", "c.mkv"])
+        self.assertEqual(list(failed), ["b.mkv"])
+        self.assertTrue(self.files[1].status.startswith("failed"))
+        self.assertFalse(isinstance(app.command_lines["b.mkv"], list))
+
+    def test_removed_file_isnt_resumed(self):
+        unfinished = [{"batch": "test", "job": i, "file": file.name, "source": app.command_lines[file.name][0][1], "command": app.command_lines[file.name][0],
+                       "outputs": [], "pass": "", "started": False, "failures": 0, "status": "queued"} for i, file in enumerate(self.files)]
+        os.remove(os.path.join(self.folder, "b.mkv"))
+        jobs, given_up = app.get_resume_jobs(unfinished)
+        self.assertEqual([job.file.name for job in jobs], ["a.mkv", "c.mkv"])
+        self.assertEqual([entry["file"] for entry in given_up], ["b.mkv"])
+
+
+if __name__ == "__main__":
+    unittest.main()